@@ -9,10 +9,27 @@ It also keeps the prompt small. 64k records will not fit in a context window
 (and a model would get the arithmetic wrong anyway); a few dozen findings do.
 
 Adding a new kind of analysis = one more function returning findings in the
-same shape, appended in build_findings().
+same shape, listed in WINDOW_ANALYSES with the windows it reads (or appended
+in build_findings() when it reads something else, like the production
+reports).
+
+Analyses read time windows (MilkWindow / FeedWindow) rather than rows: the
+per-cow daily liters, visit intervals, daily totals. Those are computed either
+from one dict per milking (RowData) or, for a large vault, from NumPy arrays
+(app/columnar.py) -- same windows, same findings, to the last bit.
 """
 
+from bisect import bisect_right
 from datetime import timedelta
+from functools import cached_property
+
+from app import columnar
+
+# How build_findings holds the records while analysing: "python" (one dict
+# per row, standard library only), "numpy" (arrays per field, see
+# app/columnar.py) or "auto" (numpy when it is installed). The findings are
+# identical whichever runs.
+ENGINES = ("auto", "python", "numpy")
 
 # A cow needs at least this many milkings in *each* window before we compare
 # them, so a single missed day can't look like a collapse in production.
@@ -102,13 +119,13 @@ def _liters_per_cow_day(rows):
 
 
 def _intervals_by_cow(rows):
-    """Hours between consecutive milkings, per cow."""
+    """Hours between consecutive milkings, per cow. ``rows`` are in time order
+    (enrich sorts them once), so each cow's timestamps already are."""
     per_cow = {}
     for row in rows:
         per_cow.setdefault(row["animal_number"], []).append(row["timestamp"])
     intervals = {}
     for animal, stamps in per_cow.items():
-        stamps.sort()
         hours = [
             (stamps[i] - stamps[i - 1]).total_seconds() / 3600
             for i in range(1, len(stamps))
@@ -119,17 +136,179 @@ def _intervals_by_cow(rows):
     return intervals
 
 
-def split_windows(rows, recent_days, baseline_days):
-    """Split into (recent, baseline) using the newest record as 'now', because
-    the vault may not contain data up to today."""
-    if not rows:
-        return [], [], None
-    latest = rows[-1]["timestamp"]
-    recent_start = latest - timedelta(days=recent_days)
-    baseline_start = recent_start - timedelta(days=baseline_days)
-    recent = [r for r in rows if r["timestamp"] > recent_start]
-    baseline = [r for r in rows if baseline_start < r["timestamp"] <= recent_start]
-    return recent, baseline, latest
+class MilkWindow:
+    """The milkings of one time window, and what the analyses read from them.
+
+    Every analysis takes windows rather than rows, so an engine only has to
+    answer these few questions about a window -- this one from the enriched
+    rows, app/columnar.py from NumPy arrays -- and the findings come out the
+    same. Everything is computed on first use.
+
+    Here a window is an index range of the time-ordered rows; ``rows`` copies
+    only the references in that range.
+    """
+
+    def __init__(self, rows, low, high):
+        self.all_rows = rows
+        self.low = low
+        self.high = high
+
+    @property
+    def rows(self):
+        # A slice, not islice: islice steps through every row before ``low``,
+        # which made each pass cost the whole history instead of the window.
+        return self.all_rows[self.low : self.high]
+
+    @property
+    def milkings(self):
+        return self.high - self.low
+
+    @cached_property
+    def days(self):
+        """Distinct days with a milking."""
+        return len({row["day"] for row in self.rows})
+
+    @cached_property
+    def cows(self):
+        return len({row["animal_number"] for row in self.rows})
+
+    @cached_property
+    def liters_total(self):
+        return sum(row["liters"] or 0 for row in self.rows)
+
+    @cached_property
+    def failures(self):
+        """Milkings that did not finish normally (status other than OK)."""
+        return sum(1 for row in self.rows if row["status"] != "OK")
+
+    @cached_property
+    def liters_by_cow(self):
+        return _liters_per_cow_day(self.rows)
+
+    @cached_property
+    def intervals_by_cow(self):
+        return _intervals_by_cow(self.rows)
+
+    @cached_property
+    def liters_by_day(self):
+        """{day: liters milked that day, whole herd}."""
+        by_day = {}
+        for row in self.rows:
+            if row["liters"] is not None:
+                by_day[row["day"]] = by_day.get(row["day"], 0.0) + row["liters"]
+        return by_day
+
+
+class FeedWindow:
+    """The feedings of one time window (see MilkWindow)."""
+
+    def __init__(self, rows, low, high):
+        self.all_rows = rows
+        self.low = low
+        self.high = high
+
+    @property
+    def rows(self):
+        return self.all_rows[self.low : self.high]  # see MilkWindow.rows
+
+    @cached_property
+    def kg_by_day(self):
+        """{day: kg fed that day, whole herd}."""
+        by_day = {}
+        for row in self.rows:
+            by_day[row["day"]] = by_day.get(row["day"], 0.0) + row["kg"]
+        return by_day
+
+    @cached_property
+    def feed_left_by_cow(self):
+        """{animal: {"not_finished": feedings not eaten up, "total": feedings}}."""
+        per_cow = {}
+        for row in self.rows:
+            stats = per_cow.setdefault(row["animal_number"], {"not_finished": 0, "total": 0})
+            stats["total"] += 1
+            if row["consumed"] is False:
+                stats["not_finished"] += 1
+        return per_cow
+
+
+# The keys of the rows of enrich / enrich_feed.
+ROW_FIELDS = ("animal_number", "registration_number", "timestamp", "day", "status", "liters")
+FEED_ROW_FIELDS = ("animal_number", "timestamp", "day", "kg", "consumed")
+
+
+class RowData:
+    """The pure-Python engine: records enriched into one dict per row."""
+
+    def __init__(self, records, divisor, parse_timestamp, feed_records, feed_divisor):
+        self._index(
+            enrich(records, divisor, parse_timestamp),
+            enrich_feed(feed_records, feed_divisor, parse_timestamp),
+        )
+
+    def _index(self, rows, feed_rows):
+        self.rows = rows
+        self.feed_rows = feed_rows
+        # The rows are sorted once, in enrich; windows are found by binary
+        # search in these.
+        self.times = [row["timestamp"] for row in self.rows]
+        self.feed_times = [row["timestamp"] for row in self.feed_rows]
+        self.records_analysed = len(self.rows)
+        self.feed_records_analysed = len(self.feed_rows)
+        #: Timestamp of the newest milking, or None without any.
+        self.latest = self.rows[-1]["timestamp"] if self.rows else None
+
+    def as_of(self, moment):
+        """(milkings, feedings, newest milking) of the records up to and
+        including ``moment``; of all records when None."""
+        if moment is None:
+            return self.records_analysed, self.feed_records_analysed, self.latest
+        milkings = bisect_right(self.times, moment)
+        latest = self.times[milkings - 1] if milkings else None
+        return milkings, bisect_right(self.feed_times, moment), latest
+
+    def milk_window(self, start, end=None):
+        """Milkings after ``start`` up to and including ``end`` (None: the newest)."""
+        return MilkWindow(self.rows, *_bounds(self.times, start, end))
+
+    def feed_window(self, start, end=None):
+        return FeedWindow(self.feed_rows, *_bounds(self.feed_times, start, end))
+
+    def split(self, parts, since, until=None):
+        """The rows after ``since`` up to ``until`` as ``parts`` RowData, each
+        with all rows of its cows (see COW_ANALYSES)."""
+        part_of = {}
+        milk = [[] for _ in range(parts)]
+        feed = [[] for _ in range(parts)]
+        for rows, times, split_rows in ((self.rows, self.times, milk), (self.feed_rows, self.feed_times, feed)):
+            low, high = _bounds(times, since, until)
+            for row in rows[low:high]:
+                split_rows[part_of.setdefault(row["animal_number"], len(part_of) % parts)].append(row)
+        split = []
+        for part_rows, part_feed_rows in zip(milk, feed):
+            part = RowData.__new__(RowData)
+            part._index(part_rows, part_feed_rows)
+            split.append(part)
+        return split
+
+    def __getstate__(self):
+        # To a worker process as a list per field, not a dict per row.
+        return {
+            "rows": [[row[field] for row in self.rows] for field in ROW_FIELDS],
+            "feed_rows": [[row[field] for row in self.feed_rows] for field in FEED_ROW_FIELDS],
+        }
+
+    def __setstate__(self, state):
+        self._index(
+            [dict(zip(ROW_FIELDS, values)) for values in zip(*state["rows"])],
+            [dict(zip(FEED_ROW_FIELDS, values)) for values in zip(*state["feed_rows"])],
+        )
+
+
+def _bounds(times, start, end):
+    """Index range of the times after ``start``, up to and including ``end``."""
+    low = bisect_right(times, start)
+    high = len(times) if end is None else bisect_right(times, end)
+    return low, max(low, high)
 
 
 def _finding(kind, severity, scope, summary, metrics):
@@ -144,13 +323,13 @@ def _finding(kind, severity, scope, summary, metrics):
 
 def herd_findings(recent, baseline):
     findings = []
-    recent_days = len({row["day"] for row in recent})
-    baseline_days = len({row["day"] for row in baseline})
+    recent_days = recent.days
+    baseline_days = baseline.days
     if not recent_days or not baseline_days:
         return findings
 
-    recent_per_day = sum(r["liters"] or 0 for r in recent) / recent_days
-    baseline_per_day = sum(r["liters"] or 0 for r in baseline) / baseline_days
+    recent_per_day = recent.liters_total / recent_days
+    baseline_per_day = baseline.liters_total / baseline_days
     change = _change(recent_per_day, baseline_per_day)
     if change is not None and abs(change) >= 0.05:
         findings.append(
@@ -171,20 +350,20 @@ def herd_findings(recent, baseline):
             )
         )
 
-    recent_failures = sum(1 for r in recent if r["status"] != "OK")
-    if recent and recent_failures / len(recent) >= FAILURE_RATE_THRESHOLD:
-        rate = recent_failures / len(recent)
+    recent_failures = recent.failures
+    if recent.milkings and recent_failures / recent.milkings >= FAILURE_RATE_THRESHOLD:
+        rate = recent_failures / recent.milkings
         findings.append(
             _finding(
                 "herd_failure_rate",
                 "medium",
                 {"herd": True},
                 f"{rate * 100:.1f}% of recent milkings did not finish normally "
-                f"({recent_failures} of {len(recent)}).",
+                f"({recent_failures} of {recent.milkings}).",
                 {
                     "failure_rate_pct": round(rate * 100, 1),
                     "failed": recent_failures,
-                    "total": len(recent),
+                    "total": recent.milkings,
                 },
             )
         )
@@ -192,8 +371,12 @@ def herd_findings(recent, baseline):
 
 
 def cow_yield_findings(recent, baseline):
-    recent_by_cow = _liters_per_cow_day(recent)
-    baseline_by_cow = _liters_per_cow_day(baseline)
+    return _yield_ranked(_yield_candidates(recent, baseline))
+
+
+def _yield_candidates(recent, baseline):
+    recent_by_cow = recent.liters_by_cow
+    baseline_by_cow = baseline.liters_by_cow
     candidates = []
     for animal, recent_days_liters in recent_by_cow.items():
         baseline_days_liters = baseline_by_cow.get(animal, [])
@@ -210,8 +393,11 @@ def cow_yield_findings(recent, baseline):
         if change <= -YIELD_DROP_THRESHOLD or change >= YIELD_RISE_THRESHOLD:
             candidates.append((abs(change), animal, recent_avg, baseline_avg, change,
                                len(recent_days_liters), len(baseline_days_liters)))
+    return candidates
 
-    candidates.sort(reverse=True)
+
+def _yield_ranked(candidates):
+    candidates = sorted(candidates, reverse=True)
     findings = []
     for _, animal, recent_avg, baseline_avg, change, n_recent, n_base in (
         candidates[:MAX_FINDINGS_PER_KIND]
@@ -238,8 +424,12 @@ def cow_yield_findings(recent, baseline):
 
 
 def cow_interval_findings(recent, baseline):
-    recent_intervals = _intervals_by_cow(recent)
-    baseline_intervals = _intervals_by_cow(baseline)
+    return _interval_ranked(_interval_candidates(recent, baseline))
+
+
+def _interval_candidates(recent, baseline):
+    recent_intervals = recent.intervals_by_cow
+    baseline_intervals = baseline.intervals_by_cow
     candidates = []
     for animal, hours in recent_intervals.items():
         base_hours = baseline_intervals.get(animal, [])
@@ -250,8 +440,11 @@ def cow_interval_findings(recent, baseline):
         change = _change(recent_avg, baseline_avg)
         if change is not None and change >= INTERVAL_RISE_THRESHOLD:
             candidates.append((change, animal, recent_avg, baseline_avg, len(hours)))
+    return candidates
+
 
-    candidates.sort(reverse=True)
+def _interval_ranked(candidates):
+    candidates = sorted(candidates, reverse=True)
     findings = []
     for change, animal, recent_avg, baseline_avg, n_recent in candidates[:MAX_FINDINGS_PER_KIND]:
         findings.append(
@@ -272,6 +465,14 @@ def cow_interval_findings(recent, baseline):
     return findings
 
 
+FEED_FIELDS = ("feed_a_raw", "feed_b_raw", "feed_c_raw", "feed_d_raw")
+
+
+def kg_of(record, feed_divisor):
+    """Feed given in one feed record, all feed types together."""
+    return sum(record.get(key) or 0 for key in FEED_FIELDS) / feed_divisor
+
+
 def enrich_feed(records, feed_divisor, parse_timestamp):
     """Feed records -> rows with parsed time, kg and consumed flag."""
     rows = []
@@ -279,16 +480,12 @@ def enrich_feed(records, feed_divisor, parse_timestamp):
         timestamp = parse_timestamp(record.get("timestamp"))
         if timestamp is None:
             continue
-        grams = sum(
-            record.get(key) or 0
-            for key in ("feed_a_raw", "feed_b_raw", "feed_c_raw", "feed_d_raw")
-        )
         rows.append(
             {
                 "animal_number": record.get("animal_number"),
                 "timestamp": timestamp,
                 "day": timestamp.date(),
-                "kg": grams / feed_divisor,
+                "kg": kg_of(record, feed_divisor),
                 "consumed": record.get("all_feed_consumed"),
             }
         )
@@ -296,22 +493,17 @@ def enrich_feed(records, feed_divisor, parse_timestamp):
     return rows
 
 
-def _liters_per_kg(feed_rows, milk_rows):
+def _liters_per_kg(feed, milk):
     """Herd efficiency over days where BOTH feed and milk were measured."""
-    feed_by_day = {}
-    for row in feed_rows:
-        feed_by_day[row["day"]] = feed_by_day.get(row["day"], 0.0) + row["kg"]
-    milk_by_day = {}
-    for row in milk_rows:
-        if row["liters"] is not None:
-            milk_by_day[row["day"]] = milk_by_day.get(row["day"], 0.0) + row["liters"]
+    feed_by_day = feed.kg_by_day
+    milk_by_day = milk.liters_by_day
     overlap = [d for d, kg in feed_by_day.items() if kg > 0 and d in milk_by_day]
     if len(overlap) < FEED_EFFICIENCY_MIN_DAYS:
         return None
     return sum(milk_by_day[d] for d in overlap) / sum(feed_by_day[d] for d in overlap)
 
 
-def feed_findings(feed_recent, feed_baseline, milk_recent, milk_baseline):
+def feed_efficiency_findings(feed_recent, feed_baseline, milk_recent, milk_baseline):
     findings = []
 
     # Herd feed efficiency: liters of milk per kg of feed.
@@ -334,20 +526,17 @@ def feed_findings(feed_recent, feed_baseline, milk_recent, milk_baseline):
                 },
             )
         )
+    return findings
 
-    # Cows leaving feed uneaten -- often one of the first visible illness signs.
-    per_cow = {}
-    for row in feed_recent:
-        stats = per_cow.setdefault(row["animal_number"], {"not_finished": 0, "total": 0})
-        stats["total"] += 1
-        if row["consumed"] is False:
-            stats["not_finished"] += 1
-    baseline_per_cow = {}
-    for row in feed_baseline:
-        stats = baseline_per_cow.setdefault(row["animal_number"], {"not_finished": 0, "total": 0})
-        stats["total"] += 1
-        if row["consumed"] is False:
-            stats["not_finished"] += 1
+
+def cow_feed_left_findings(feed_recent, feed_baseline):
+    """Cows leaving feed uneaten -- often one of the first visible illness signs."""
+    return _feed_left_ranked(_feed_left_candidates(feed_recent, feed_baseline))
+
+
+def _feed_left_candidates(feed_recent, feed_baseline):
+    per_cow = feed_recent.feed_left_by_cow
+    baseline_per_cow = feed_baseline.feed_left_by_cow
 
     candidates = []
     for animal, stats in per_cow.items():
@@ -355,11 +544,17 @@ def feed_findings(feed_recent, feed_baseline, milk_recent, milk_baseline):
             continue
         rate = stats["not_finished"] / stats["total"]
         if stats["not_finished"] >= FEED_LEFT_MIN_EVENTS and rate >= FEED_LEFT_RATE_THRESHOLD:
-            candidates.append((rate, animal, stats))
-    candidates.sort(reverse=True)
+            base = baseline_per_cow.get(animal, {"not_finished": 0, "total": 0})
+            candidates.append((rate, animal, stats, base))
+    return candidates
 
-    for rate, animal, stats in candidates[:MAX_FINDINGS_PER_KIND]:
-        base = baseline_per_cow.get(animal, {"not_finished": 0, "total": 0})
+
+def _feed_left_ranked(candidates):
+    # Ranked on (rate, animal): a cow is in one candidate, so the stats
+    # behind them are never compared.
+    candidates = sorted(candidates, key=lambda candidate: candidate[:2], reverse=True)
+    findings = []
+    for rate, animal, stats, base in candidates[:MAX_FINDINGS_PER_KIND]:
         base_rate = base["not_finished"] / base["total"] if base["total"] else None
         findings.append(
             _finding(
@@ -427,7 +622,7 @@ def production_speed_findings(production_records):
     return findings
 
 
-def cow_recovery_findings(rows, recent_days, baseline_days):
+def cow_recovery_findings(recent, dip, baseline):
     """Cows that dipped and are back at their own baseline -- good news.
 
     Not every insight should be an alarm. A cow that produced clearly less for
@@ -436,7 +631,8 @@ def cow_recovery_findings(rows, recent_days, baseline_days):
     intervened learns it worked), and a recovery the farmer did NOT act on is
     still useful ("she sorted it out herself, but keep half an eye on her").
 
-    Timeline, anchored on the newest record like everything else:
+    Timeline, anchored on the newest record like everything else (the
+    windows are cut in build_findings):
         baseline (baseline_days) -> dip window (recent_days) -> recent (recent_days)
     Recovered = the dip window sat >= RECOVERY_DIP_THRESHOLD below baseline AND
     the recent window is back within RECOVERY_MARGIN of baseline. The baseline
@@ -445,22 +641,15 @@ def cow_recovery_findings(rows, recent_days, baseline_days):
     Yield is the metric today because it is the metric we have milking-level
     history for. The same shape applies verbatim to any per-visit measurement a
     future source adds (conductivity being the obvious one) -- that would be a
-    second call to this function with different rows, not new logic.
+    second call to this function with different windows, not new logic.
     """
-    if not rows:
-        return []
-    latest = rows[-1]["timestamp"]
-    recent_start = latest - timedelta(days=recent_days)
-    dip_start = recent_start - timedelta(days=recent_days)
-    baseline_start = dip_start - timedelta(days=baseline_days)
+    return _recovery_ranked(_recovery_candidates(recent, dip, baseline))
 
-    recent = [r for r in rows if r["timestamp"] > recent_start]
-    dip = [r for r in rows if dip_start < r["timestamp"] <= recent_start]
-    baseline = [r for r in rows if baseline_start < r["timestamp"] <= dip_start]
 
-    recent_by_cow = _liters_per_cow_day(recent)
-    dip_by_cow = _liters_per_cow_day(dip)
-    baseline_by_cow = _liters_per_cow_day(baseline)
+def _recovery_candidates(recent, dip, baseline):
+    recent_by_cow = recent.liters_by_cow
+    dip_by_cow = dip.liters_by_cow
+    baseline_by_cow = baseline.liters_by_cow
 
     candidates = []
     for animal, baseline_days_liters in baseline_by_cow.items():
@@ -481,8 +670,11 @@ def cow_recovery_findings(rows, recent_days, baseline_days):
             continue
         if dip_change <= -RECOVERY_DIP_THRESHOLD and abs(recent_change) <= RECOVERY_MARGIN:
             candidates.append((abs(dip_change), animal, baseline_avg, dip_avg, recent_avg, dip_change))
+    return candidates
 
-    candidates.sort(reverse=True)
+
+def _recovery_ranked(candidates):
+    candidates = sorted(candidates, reverse=True)
     findings = []
     for _, animal, baseline_avg, dip_avg, recent_avg, dip_change in (
         candidates[:MAX_FINDINGS_PER_KIND]
@@ -577,6 +769,139 @@ def correlation_findings(findings):
     return results
 
 
+# The analyses that read windows, each with the windows it reads (see
+# Windows), in the order their findings are reported. A new analysis of
+# existing windows is one more line here and costs little at run time: the
+# per-cow and per-day figures it reads are already computed for the others.
+WINDOW_ANALYSES = (
+    (herd_findings, ("recent", "baseline")),
+    (cow_yield_findings, ("recent", "baseline")),
+    (cow_interval_findings, ("recent", "baseline")),
+    (cow_recovery_findings, ("recent", "dip", "before_dip")),
+    # Cross-dataset findings: feed data joined against the same windows
+    # (anchored on the newest milking, so all findings describe the same
+    # period).
+    (feed_efficiency_findings, ("feed_recent", "feed_baseline", "recent", "baseline")),
+    (cow_feed_left_findings, ("feed_recent", "feed_baseline")),
+)
+
+
+# The per-cow analyses of WINDOW_ANALYSES as (candidates, ranking). A cow's
+# candidate depends on her own records only, so with a process pool the herd
+# is split (parallel_workers): each worker computes the candidates of its
+# cows, and the ranking, which needs them all (MAX_FINDINGS_PER_KIND), runs
+# once on the merged lists. The findings are those of a single process.
+COW_ANALYSES = {
+    cow_yield_findings: (_yield_candidates, _yield_ranked),
+    cow_interval_findings: (_interval_candidates, _interval_ranked),
+    cow_recovery_findings: (_recovery_candidates, _recovery_ranked),
+    cow_feed_left_findings: (_feed_left_candidates, _feed_left_ranked),
+}
+
+
+class Windows:
+    """The windows of one run by name, each built once and shared.
+
+    Every figure the analyses read is computed on a window and kept there
+    (MilkWindow / FeedWindow), so handing all analyses the same window
+    objects computes each figure -- liters per cow-day, intervals per cow,
+    feed left per cow -- once per run, however many analyses read it.
+    Names covering the same span share one window: with equal window
+    lengths, recovery's "dip" is the "baseline".
+    """
+
+    def __init__(self, data, latest, recent_days, baseline_days, until=None, feedings=None):
+        self.data = data
+        self.latest = latest
+        self.recent_days = recent_days
+        self.baseline_days = baseline_days
+        self.until = until
+        #: To cut the same windows from a part of the data (COW_ANALYSES).
+        self.arguments = (latest, recent_days, baseline_days, until)
+        self.feedings = data.feed_records_analysed if feedings is None else feedings
+        self.recent_start = latest - timedelta(days=recent_days)
+        self.baseline_start = self.recent_start - timedelta(days=baseline_days)
+        # Recovery looks further back: its baseline ends where the dip begins.
+        dip_start = self.recent_start - timedelta(days=recent_days)
+        # The recent windows run to the newest record, or to ``until``.
+        self.spans = {
+            "recent": ("milk", self.recent_start, until),
+            "baseline": ("milk", self.baseline_start, self.recent_start),
+            "dip": ("milk", dip_start, self.recent_start),
+            "before_dip": ("milk", dip_start - timedelta(days=baseline_days), dip_start),
+            "feed_recent": ("feed", self.recent_start, until),
+            "feed_baseline": ("feed", self.baseline_start, self.recent_start),
+        }
+        self._built = {}
+
+    def __getitem__(self, name):
+        span = self.spans[name]
+        if span not in self._built:
+            kind, start, end = span
+            cut = self.data.milk_window if kind == "milk" else self.data.feed_window
+            self._built[span] = cut(start, end)
+        return self._built[span]
+
+    def have_records(self, names):
+        """False when a named window's collection has no records at all (no
+        feed data on this farm): the analysis has nothing to compare."""
+        return self.feedings or all(self.spans[name][0] != "feed" for name in names)
+
+
+def _split_candidates(data, windows, executor, workers):
+    """{per-cow analysis: candidates of every cow}, the herd split over
+    ``workers`` tasks in ``executor``."""
+    analyses = [
+        (analysis, names)
+        for analysis, names in WINDOW_ANALYSES
+        if analysis in COW_ANALYSES and windows.have_records(names)
+    ]
+    # Only the records in reach of the windows go to the workers.
+    since = windows.latest - timedelta(days=reach_days(windows.recent_days, windows.baseline_days))
+    futures = [
+        executor.submit(_part_candidates, part, windows.arguments, analyses)
+        for part in data.split(workers, since, windows.until)
+    ]
+    merged = {analysis: [] for analysis, _ in analyses}
+    for future in futures:
+        for analysis, candidates in future.result().items():
+            merged[analysis].extend(candidates)
+    return merged
+
+
+def _part_candidates(part, window_arguments, analyses):
+    # In a worker process: the candidates of this part's cows.
+    windows = Windows(part, *window_arguments)
+    return {
+        analysis: COW_ANALYSES[analysis][0](*(windows[name] for name in names))
+        for analysis, names in analyses
+    }
+
+
+def reach_days(recent_days, baseline_days):
+    """How far before the newest milking build_findings reads: the start of
+    the recovery baseline, the oldest window. Older records can't change a
+    finding, only the record counts in the context."""
+    return 2 * recent_days + baseline_days
+
+
+def load_data(records, divisor, parse_timestamp, feed_records=None, feed_divisor=1000, engine="auto"):
+    """The records in the form an engine analyses them (see ENGINES)."""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown analysis engine '{engine}' (known: {', '.join(ENGINES)})")
+    if engine != "python":
+        if columnar.available():
+            try:
+                return columnar.ColumnData(
+                    records, divisor, parse_timestamp, feed_records or [], feed_divisor, kg_of, FEED_FIELDS
+                )
+            except columnar.Unsupported:
+                pass  # data the columns can't hold exactly: the rows can
+        elif engine == "numpy":
+            raise RuntimeError("analysis engine 'numpy' needs NumPy: pip install numpy")
+    return RowData(records, divisor, parse_timestamp, feed_records or [], feed_divisor)
+
+
 def build_findings(
     records,
     divisor,
@@ -586,62 +911,89 @@ def build_findings(
     feed_records=None,
     production_records=None,
     feed_divisor=1000,
+    engine="auto",
+    records_analysed=None,
+    feed_records_analysed=None,
+    executor=None,
+    workers=1,
 ):
-    """Full analysis bundle: context the model needs + the findings themselves."""
-    rows = enrich(records, divisor, parse_timestamp)
-    recent, baseline, latest = split_windows(rows, recent_days, baseline_days)
+    """Full analysis bundle: context the model needs + the findings themselves.
 
-    findings = []
-    findings.extend(herd_findings(recent, baseline))
-    findings.extend(cow_yield_findings(recent, baseline))
-    findings.extend(cow_interval_findings(recent, baseline))
-    findings.extend(cow_recovery_findings(rows, recent_days, baseline_days))
-
-    # Cross-dataset findings: feed and production data joined against the same
-    # windows (anchored on the newest milking, so all findings describe the
-    # same period).
-    feed_rows = enrich_feed(feed_records or [], feed_divisor, parse_timestamp)
-    if feed_rows and latest:
-        recent_start = latest - timedelta(days=recent_days)
-        baseline_start = recent_start - timedelta(days=baseline_days)
-        feed_recent = [r for r in feed_rows if r["timestamp"] > recent_start]
-        feed_baseline = [
-            r for r in feed_rows if baseline_start < r["timestamp"] <= recent_start
-        ]
-        findings.extend(feed_findings(feed_recent, feed_baseline, recent, baseline))
-    if production_records:
-        findings.extend(production_speed_findings(production_records))
+    ``engine`` picks how the records are held while analysing (see ENGINES);
+    the bundle is the same either way. When ``records`` / ``feed_records`` are
+    only the part of the history within reach_days (app/incremental.py), the
+    ``*_records_analysed`` arguments are the counts of the whole history to
+    report in the context. ``executor`` / ``workers``: see analyse.
+    """
+    data = load_data(records, divisor, parse_timestamp, feed_records, feed_divisor, engine)
+    bundle = analyse(data, recent_days, baseline_days, production_records, None, executor, workers)
+    if records_analysed is not None:
+        bundle["context"]["records_analysed"] = records_analysed
+    if feed_records_analysed is not None:
+        bundle["context"]["feed_records_analysed"] = feed_records_analysed
+    return bundle
 
-    # Last, because it reads the findings above rather than the records. Built
-    # into its own list first: extending a list from itself would loop.
-    findings.extend(correlation_findings(findings))
 
-    # The windows are anchored on the newest record, not on today: if the
-    # uploader falls behind, "recent" is genuinely older than it sounds.
-    # Making the dates explicit lets readers see exactly which period every
-    # finding is about (and warn when the data is stale).
+def analyse(
+    data, recent_days, baseline_days, production_records=None, until=None, executor=None, workers=1
+):
+    """The bundle of build_findings from records already loaded (load_data).
+
+    With ``until``, the bundle as it would have been on that moment: only the
+    records up to it count, and the windows are anchored on the newest
+    milking before it. The windows are index ranges of the loaded data, so a
+    run per day over a long history (analyst --backfill) costs the windows of
+    each day, not the whole history each time.
+
+    With an ``executor`` (a process pool) and ``workers`` > 1, the per-cow
+    analyses run on ``workers`` parts of the herd in it (see COW_ANALYSES).
+    """
+    milkings, feedings, latest = data.as_of(until)
+
+    findings = []
+    recent = baseline = None
     window = None
     if latest:
-        recent_start = latest - timedelta(days=recent_days)
-        baseline_start = recent_start - timedelta(days=baseline_days)
+        windows = Windows(data, latest, recent_days, baseline_days, until, feedings)
+        split = {}
+        if executor is not None and workers > 1:
+            split = _split_candidates(data, windows, executor, workers)
+        for analysis, names in WINDOW_ANALYSES:
+            if analysis in split:
+                findings.extend(COW_ANALYSES[analysis][1](split[analysis]))
+            elif windows.have_records(names):
+                findings.extend(analysis(*(windows[name] for name in names)))
+        recent = windows["recent"]
+        baseline = windows["baseline"]
+
+        # The windows are anchored on the newest record, not on today: if the
+        # uploader falls behind, "recent" is genuinely older than it sounds.
+        # Making the dates explicit lets readers see exactly which period every
+        # finding is about (and warn when the data is stale).
         window = {
-            "data_from": recent_start.date().isoformat(),
+            "data_from": windows.recent_start.date().isoformat(),
             "data_until": latest.date().isoformat(),
-            "baseline_from": baseline_start.date().isoformat(),
+            "baseline_from": windows.baseline_start.date().isoformat(),
         }
+    if production_records:
+        findings.extend(production_speed_findings(production_records))
+
+    # Last, because it reads the findings above rather than the records. Built
+    # into its own list first: extending a list from itself would loop.
+    findings.extend(correlation_findings(findings))
 
     return {
         "context": {
-            "records_analysed": len(rows),
-            "feed_records_analysed": len(feed_rows),
+            "records_analysed": milkings,
+            "feed_records_analysed": feedings,
             "production_records_analysed": len(production_records or []),
             "latest_record": latest.isoformat() if latest else None,
             "recent_window_days": recent_days,
             "baseline_window_days": baseline_days,
             "window": window,
-            "recent_milkings": len(recent),
-            "baseline_milkings": len(baseline),
-            "cows_in_recent_window": len({r["animal_number"] for r in recent}),
+            "recent_milkings": recent.milkings if recent else 0,
+            "baseline_milkings": baseline.milkings if baseline else 0,
+            "cows_in_recent_window": recent.cows if recent else 0,
         },
         "findings": findings,
     }
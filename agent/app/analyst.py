@@ -10,11 +10,13 @@ import argparse
 import json
 import logging
 import time
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
 
-from app.analysis import build_findings
+from app.analysis import analyse, build_findings, load_data
 from app.cache import RecordCache, load_records
 from app.config import CACHE_DIRECTORY, load_settings, vault_fingerprint
+from app.incremental import AnalysisState
 from app.insights import build_insight_record, dataset_key, record_path
 from app.llm import LLMError, create_llm_client
 from app.prompting import (
@@ -33,6 +35,9 @@ logger = logging.getLogger("agent")
 # and a group is never split, so this is a target rather than a hard cap.
 DEFAULT_MAX_FINDINGS_PER_REQUEST = 12
 
+# The "model" of backfilled insights: nobody worded them (see backfill).
+BACKFILL_MODEL = "none"
+
 
 def parse_timestamp(value):
     if not isinstance(value, str):
@@ -115,17 +120,67 @@ def gather_data(settings, vault, refresh):
     return loaded
 
 
+def analysis_pool(settings):
+    """(process pool, workers) for the per-cow analyses: ``parallel_workers``
+    processes, or (None, 1) to analyse in this process (the default)."""
+    workers = settings.get("parallel_workers", 1)
+    if workers > 1:
+        return ProcessPoolExecutor(max_workers=workers), workers
+    return None, 1
+
+
 def build_bundle(settings, data):
-    return build_findings(
-        data["source_collection"],
-        divisor=settings.get("yield_divisor", 1000),
-        parse_timestamp=parse_timestamp,
-        recent_days=settings.get("recent_window_days", 7),
-        baseline_days=settings.get("baseline_window_days", 28),
-        feed_records=data["feed_collection"],
-        production_records=data["production_collection"],
-        feed_divisor=settings.get("feed_divisor", 1000),
+    recent_days = settings.get("recent_window_days", 7)
+    baseline_days = settings.get("baseline_window_days", 28)
+    # Only the records in reach of the windows are analysed; the state keeps
+    # them between runs so a run parses just what is new (app/incremental.py).
+    state = AnalysisState(
+        CACHE_DIRECTORY / "analysis_state.json",
+        vault_fingerprint(settings["vault"]),
+        recent_days,
+        baseline_days,
+    )
+    history = state.update(data["source_collection"], data["feed_collection"], parse_timestamp)
+    executor, workers = analysis_pool(settings)
+    try:
+        return build_findings(
+            history["milk"]["records"],
+            divisor=settings.get("yield_divisor", 1000),
+            parse_timestamp=parse_timestamp,
+            recent_days=recent_days,
+            baseline_days=baseline_days,
+            feed_records=history["feed"]["records"],
+            production_records=data["production_collection"],
+            feed_divisor=settings.get("feed_divisor", 1000),
+            engine=settings.get("analysis_engine", "auto"),
+            records_analysed=history["milk"]["analysed"],
+            feed_records_analysed=history["feed"]["analysed"],
+            executor=executor,
+            workers=workers,
+        )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def insight_records(bundle, worded, model, analysis_date, created_at):
+    """(insight records of a bundle's findings, the dataset key in their ids)."""
+    period = bundle["context"].get("window")
+    data_key = dataset_key(
+        bundle["context"]["records_analysed"],
+        bundle["context"]["latest_record"],
+        bundle["context"]["feed_records_analysed"],
+        bundle["context"]["production_records_analysed"],
     )
+    records = []
+    for index, finding in enumerate(bundle["findings"]):
+        title, body = worded.get(index, (finding["summary"], ""))
+        records.append(
+            build_insight_record(
+                finding, title, body, model, analysis_date, created_at, period, data_key
+            )
+        )
+    return records, data_key
 
 
 def run_once(settings, vault, llm, refresh=False):
@@ -145,21 +200,9 @@ def run_once(settings, vault, llm, refresh=False):
     analysis_date = now.strftime("%Y-%m-%d")
     created_at = now.isoformat(timespec="seconds")
 
-    period = bundle["context"].get("window")
-    data_key = dataset_key(
-        bundle["context"]["records_analysed"],
-        bundle["context"]["latest_record"],
-        bundle["context"]["feed_records_analysed"],
-        bundle["context"]["production_records_analysed"],
+    records_to_store, data_key = insight_records(
+        bundle, worded, llm.name(), analysis_date, created_at
     )
-    records_to_store = []
-    for index, finding in enumerate(bundle["findings"]):
-        title, body = worded.get(index, (finding["summary"], ""))
-        records_to_store.append(
-            build_insight_record(
-                finding, title, body, llm.name(), analysis_date, created_at, period, data_key
-            )
-        )
 
     # The eVault has no overwrite-on-id, so skip insights already stored for
     # this analysis date (ids are deterministic -- see app/insights.py).
@@ -188,6 +231,76 @@ def run_once(settings, vault, llm, refresh=False):
         logger.info("  [%s] %s", record["severity"], record["title"])
 
 
+def backfill(settings, vault, first_day, last_day, store=False, refresh=False):
+    """The insights the agent would have written at the end of each day from
+    ``first_day`` to ``last_day``: to check the analyses against a known
+    history, or to give a new farm's dashboard its past.
+
+    The collections are loaded once and every day is an anchor on them
+    (analysis.analyse with ``until``): only the records up to that day count,
+    and the windows are cut from the loaded data, so each day costs its own
+    windows rather than another pass over the history. Prints one JSON line
+    per day; with ``store`` the insights go to the vault instead.
+
+    Backfilled insights aren't worded by the model -- that would be a model
+    call per day -- so their title is the calculated summary and their model
+    BACKFILL_MODEL. Their created_at is the end of their day, which keeps the
+    dashboard showing the newest real run, and their ids are deterministic
+    like any insight's: a repeated backfill stores nothing twice.
+    """
+    data = gather_data(settings, vault, refresh)
+    loaded = load_data(
+        data["source_collection"],
+        settings.get("yield_divisor", 1000),
+        parse_timestamp,
+        data["feed_collection"],
+        settings.get("feed_divisor", 1000),
+        settings.get("analysis_engine", "auto"),
+    )
+    recent_days = settings.get("recent_window_days", 7)
+    baseline_days = settings.get("baseline_window_days", 28)
+    production = [
+        record
+        for record in data["production_collection"]
+        if isinstance(record.get("report_date"), str)
+    ]
+
+    records_to_store = []
+    executor, workers = analysis_pool(settings)
+    try:
+        day = first_day
+        while day <= last_day:
+            until = datetime.combine(day, datetime.max.time())
+            reported = [record for record in production if record["report_date"][:10] <= day.isoformat()]
+            bundle = analyse(loaded, recent_days, baseline_days, reported, until, executor, workers)
+            if store:
+                records, _ = insight_records(
+                    bundle, {}, BACKFILL_MODEL, day.isoformat(), until.isoformat(timespec="seconds")
+                )
+                records_to_store.extend(records)
+            else:
+                print(json.dumps({"analysis_date": day.isoformat(), **bundle}, default=str))
+            day += timedelta(days=1)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    if not store:
+        return
+
+    insights_collection = settings.get("insights_collection", "milking_insights")
+    existing_ids = {r.get("id") for r in vault.fetch_all(insights_collection)}
+    new_records = [r for r in records_to_store if r["id"] not in existing_ids]
+    vault.store_many((record_path(record), record) for record in new_records)
+    logger.info(
+        "Backfilled %s -> %s: stored %d insights in '%s' (%d already present)",
+        first_day.isoformat(),
+        last_day.isoformat(),
+        len(new_records),
+        insights_collection,
+        len(records_to_store) - len(new_records),
+    )
+
+
 def main():
     arguments = argparse.ArgumentParser(description="Melkmonitor AI analysis agent")
     arguments.add_argument("--watch", action="store_true", help="keep running periodically")
@@ -197,10 +310,31 @@ def main():
     arguments.add_argument(
         "--dry-run", action="store_true", help="analyse and print, but write nothing to the vault"
     )
+    arguments.add_argument(
+        "--backfill",
+        nargs=2,
+        metavar=("FROM", "TO"),
+        help="the findings each day FROM..TO (YYYY-MM-DD) would have given, one JSON line per day",
+    )
+    arguments.add_argument(
+        "--store", action="store_true", help="with --backfill: write them to the vault as insights"
+    )
     options = arguments.parse_args()
+    if options.store and not options.backfill:
+        arguments.error("--store only goes with --backfill")
+    if options.backfill:
+        try:
+            first_day, last_day = (date.fromisoformat(value) for value in options.backfill)
+        except ValueError:
+            arguments.error("--backfill takes two dates, YYYY-MM-DD")
+        if first_day > last_day:
+            arguments.error("--backfill: FROM is after TO")
 
     settings = load_settings()
     vault = create_vault_client(settings["vault"])
+    if options.backfill:
+        backfill(settings, vault, first_day, last_day, options.store, options.refresh)
+        return
     llm = create_llm_client(settings.get("llm", {}))
 
     if not llm.available():
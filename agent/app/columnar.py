@@ -0,0 +1,377 @@
+"""The analysis engine for large vaults: the records as NumPy arrays.
+
+analysis.py's own engine turns every milking into a dict and every analysis
+loops over those dicts again -- fine for a season of one herd, slow for a
+5000-cow vault with years of history. Here each collection is converted once
+into arrays per field (animal number, microseconds since 1970, day, liters,
+status), sorted by time, and the questions the analyses ask of a window
+(MilkWindow / FeedWindow in analysis.py) are answered with vectorized
+group-bys: window bounds by binary search (``searchsorted``), sums per cow per
+day and per day with ``np.add.at``, visit intervals with ``np.diff``.
+
+The findings are identical to the row engine's, to the last bit, because the
+arithmetic is the same arithmetic in the same order:
+
+- ``np.add.at`` adds the values one at a time in row order, exactly like the
+  dict accumulation in analysis.py (``np.sum`` adds pairwise and rounds
+  differently, so it is not used for totals; the one total analysis.py takes
+  with ``sum()`` is still taken with ``sum()``);
+- timestamps are integer microseconds, so an interval is the same division
+  ``timedelta.total_seconds()`` does;
+- records the arrays can't hold exactly (an animal number that is not an
+  int, a timestamp with a UTC offset) raise Unsupported, and analysis.py
+  analyses those records with its rows instead.
+
+NumPy is optional: without it available() is False and only the row engine
+runs.
+"""
+
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # optional; analysis.py falls back to its row engine
+    np = None
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_MICROSECONDS_PER_DAY = 86_400_000_000
+# Integers beyond this can't pass through a float64 unchanged.
+_EXACT_INTEGER_LIMIT = 2**53
+
+# "YYYY-MM-DDTHH:MM:SS": what the uploader writes, and what NumPy parses.
+_PLAIN_LENGTH = 19
+_PLAIN_DIGITS = (0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18)
+_PLAIN_SEPARATORS = ((4, b"-"), (7, b"-"), (10, b"T"), (13, b":"), (16, b":"))
+
+
+class Unsupported(Exception):
+    """The records hold something the arrays can't represent exactly."""
+
+
+def available():
+    return np is not None
+
+
+def _microseconds(timestamp):
+    if timestamp.tzinfo is not None:
+        raise Unsupported("timestamp with a UTC offset")
+    return (timestamp - _EPOCH) // _MICROSECOND
+
+
+def _datetime(microseconds):
+    return _EPOCH + timedelta(microseconds=int(microseconds))
+
+
+def _plain_timestamps(values):
+    """(mask of the values that are plain ISO timestamps, their seconds)."""
+    text = np.array(values, dtype=f"U{_PLAIN_LENGTH + 1}")
+    plain = np.char.str_len(text) == _PLAIN_LENGTH
+    try:
+        raw = text[plain].astype(f"S{_PLAIN_LENGTH}")
+    except UnicodeEncodeError:
+        return np.zeros(len(values), dtype=bool), None
+    chars = raw.view(np.uint8).reshape(-1, _PLAIN_LENGTH)
+    digits = chars[:, _PLAIN_DIGITS].astype(np.int64) - ord("0")
+    ok = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    for position, separator in _PLAIN_SEPARATORS:
+        ok &= chars[:, position] == ord(separator)
+    # Ranges NumPy is laxer about than datetime: year 0, hour 24, second 60.
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    ok &= (year >= 1) & (digits[:, 8] * 10 + digits[:, 9] <= 23)
+    ok &= (digits[:, 10] <= 5) & (digits[:, 12] <= 5)
+    plain[plain] = ok
+    try:
+        seconds = raw[ok].astype("datetime64[s]").astype(np.int64)
+    except ValueError:
+        # A day that doesn't exist (Feb 30): parse_timestamp decides, one by one.
+        return np.zeros(len(values), dtype=bool), None
+    return plain, seconds
+
+
+def _timestamps(values, parse_timestamp):
+    """(microseconds since 1970 per value, which values are timestamps).
+
+    Plain ``YYYY-MM-DDTHH:MM:SS`` text is parsed by NumPy in one go; every
+    other value goes through ``parse_timestamp``, which must read plain text
+    the way datetime.fromisoformat does (analyst.parse_timestamp does).
+    """
+    microseconds = np.zeros(len(values), dtype=np.int64)
+    valid = np.zeros(len(values), dtype=bool)
+    if not values:
+        return microseconds, valid
+    plain, seconds = _plain_timestamps(values)
+    if seconds is not None:
+        microseconds[plain] = seconds * 1_000_000
+        valid[plain] = True
+    for index in np.flatnonzero(~plain).tolist():
+        timestamp = parse_timestamp(values[index])
+        if timestamp is not None:
+            microseconds[index] = _microseconds(timestamp)
+            valid[index] = True
+    return microseconds, valid
+
+
+def _animal_numbers(values, order):
+    """The animal numbers of the rows in ``order``, as int64."""
+    if set(map(type, values)) != {int}:
+        # Only the rows that are analysed have to be ints.
+        values = [values[index] for index in order.tolist()]
+        if values and set(map(type, values)) != {int}:
+            raise Unsupported("animal_number that is not an integer")
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError as error:
+            raise Unsupported("animal_number beyond 64 bits") from error
+    try:
+        return np.array(values, dtype=np.int64)[order]
+    except OverflowError as error:
+        raise Unsupported("animal_number beyond 64 bits") from error
+
+
+def _time_order(records, parse_timestamp):
+    # Indexes of the records with a timestamp, oldest first; ties keep their
+    # order, as the row engine's stable sort does.
+    microseconds, valid = _timestamps([record.get("timestamp") for record in records], parse_timestamp)
+    order = np.flatnonzero(valid)
+    order = order[np.argsort(microseconds[order], kind="stable")]
+    return order, microseconds[order]
+
+
+def _milk_columns(records, divisor):
+    raw = [record.get("yield_raw") for record in records]
+    has_liters = np.array([isinstance(value, (int, float)) for value in raw], dtype=bool)
+    numbers = np.array(
+        [value if isinstance(value, (int, float)) else 0 for value in raw], dtype=np.float64
+    )
+    if has_liters.any():
+        if np.abs(numbers).max() > _EXACT_INTEGER_LIMIT:
+            raise Unsupported("yield_raw too large for a float64")
+        if divisor == 0:
+            raise ZeroDivisionError("yield divisor is 0")
+    return numbers / divisor, has_liters
+
+
+def _feed_kg(records, feed_divisor, kg_of, feed_fields):
+    # Whole grams (what the uploader stores) add up exactly in int64, and one
+    # division of an exact total rounds like Python's; anything else is left
+    # to kg_of record by record, float sums included (sum() rounds its own way).
+    grams = np.zeros(len(records), dtype=np.int64)
+    for key in feed_fields:
+        values = [record.get(key) or 0 for record in records]
+        if values and set(map(type, values)) != {int}:
+            break
+        try:
+            column = np.array(values, dtype=np.int64)
+        except OverflowError:
+            break
+        if len(column) and np.abs(column).max() > _EXACT_INTEGER_LIMIT // len(feed_fields):
+            break
+        grams += column
+    else:
+        if len(records) and feed_divisor == 0:
+            raise ZeroDivisionError("feed divisor is 0")
+        return grams / feed_divisor
+    return np.array([kg_of(record, feed_divisor) for record in records], dtype=np.float64)
+
+
+class ColumnData:
+    """The NumPy engine: same interface as analysis.RowData.
+
+    ``kg_of(record, feed_divisor)`` is analysis.kg_of, the feed amount of a
+    feed record, and ``feed_fields`` the fields it adds up.
+    """
+
+    def __init__(self, records, divisor, parse_timestamp, feed_records, feed_divisor, kg_of, feed_fields):
+        order, time = _time_order(records, parse_timestamp)
+        liters, has_liters = _milk_columns(records, divisor)
+        self.milk = {
+            "time": time,
+            "day": time // _MICROSECONDS_PER_DAY,
+            "animal": _animal_numbers([record.get("animal_number") for record in records], order),
+            "liters": liters[order],
+            "has_liters": has_liters[order],
+            "ok": np.array([record.get("status") == "OK" for record in records], dtype=bool)[order],
+        }
+
+        order, time = _time_order(feed_records, parse_timestamp)
+        analysed = [feed_records[index] for index in order.tolist()]
+        self.feed = {
+            "time": time,
+            "day": time // _MICROSECONDS_PER_DAY,
+            "animal": _animal_numbers([record.get("animal_number") for record in feed_records], order),
+            "kg": _feed_kg(analysed, feed_divisor, kg_of, feed_fields),
+            "left": np.array([record.get("all_feed_consumed") is False for record in analysed], dtype=bool),
+        }
+        self._count()
+
+    def _count(self):
+        self.records_analysed = len(self.milk["time"])
+        self.feed_records_analysed = len(self.feed["time"])
+        self.latest = _datetime(self.milk["time"][-1]) if self.records_analysed else None
+
+    def as_of(self, moment):
+        if moment is None:
+            return self.records_analysed, self.feed_records_analysed, self.latest
+        until = _microseconds(moment)
+        milkings = int(np.searchsorted(self.milk["time"], until, side="right"))
+        feedings = int(np.searchsorted(self.feed["time"], until, side="right"))
+        latest = _datetime(self.milk["time"][milkings - 1]) if milkings else None
+        return milkings, feedings, latest
+
+    def milk_window(self, start, end=None):
+        return MilkColumns(self.milk, *_bounds(self.milk["time"], start, end))
+
+    def feed_window(self, start, end=None):
+        return FeedColumns(self.feed, *_bounds(self.feed["time"], start, end))
+
+    def split(self, parts, since, until=None):
+        """As analysis.RowData.split: ``parts`` ColumnData, cows spread over
+        them; the arrays pickle compactly to the worker processes."""
+        milk = {name: column[slice(*_bounds(self.milk["time"], since, until))] for name, column in self.milk.items()}
+        feed = {name: column[slice(*_bounds(self.feed["time"], since, until))] for name, column in self.feed.items()}
+        cows = np.unique(np.concatenate([milk["animal"], feed["animal"]]))
+        milk_part = np.searchsorted(cows, milk["animal"]) % parts
+        feed_part = np.searchsorted(cows, feed["animal"]) % parts
+        split = []
+        for number in range(parts):
+            part = ColumnData.__new__(ColumnData)
+            part.milk = {name: column[milk_part == number] for name, column in milk.items()}
+            part.feed = {name: column[feed_part == number] for name, column in feed.items()}
+            part._count()
+            split.append(part)
+        return split
+
+
+def _bounds(time, start, end):
+    # After ``start``, up to and including ``end``: binary search on the
+    # sorted times instead of a comparison per row.
+    low = int(np.searchsorted(time, _microseconds(start), side="right"))
+    high = len(time) if end is None else int(np.searchsorted(time, _microseconds(end), side="right"))
+    return low, max(low, high)
+
+
+def _sums_by(keys, values):
+    """(sorted distinct keys, the sum of ``values`` per key, added in order)."""
+    distinct, group = np.unique(keys, return_inverse=True)
+    sums = np.zeros(len(distinct), dtype=np.float64)
+    np.add.at(sums, group, values)
+    return distinct, sums
+
+
+def _split_by(owners, values):
+    """[values of each run of equal ``owners``] (owners sorted)."""
+    starts = np.flatnonzero(owners[1:] != owners[:-1]) + 1
+    return [part.tolist() for part in np.split(values, starts)]
+
+
+class MilkColumns:
+    """A MilkWindow over a slice of the milk arrays."""
+
+    def __init__(self, columns, low, high):
+        self.columns = columns
+        self.low = low
+        self.high = high
+        self.milkings = high - low
+        self._cache = {}
+
+    def _column(self, name):
+        return self.columns[name][self.low : self.high]
+
+    def _cached(self, name, compute):
+        if name not in self._cache:
+            self._cache[name] = compute()
+        return self._cache[name]
+
+    @property
+    def days(self):
+        days = self._column("day")
+        return int(np.count_nonzero(np.diff(days))) + 1 if len(days) else 0
+
+    @property
+    def cows(self):
+        return len(np.unique(self._column("animal")))
+
+    @property
+    def liters_total(self):
+        # sum(), not np.sum: the row engine's total, added the same way.
+        liters = self._column("liters")
+        counted = self._column("has_liters") & (liters != 0)
+        return sum(np.where(counted, liters, 0.0).tolist())
+
+    @property
+    def failures(self):
+        return int(np.count_nonzero(~self._column("ok")))
+
+    @property
+    def liters_by_cow(self):
+        return self._cached("liters_by_cow", self._liters_by_cow)
+
+    def _liters_by_cow(self):
+        measured = self._column("has_liters")
+        animals = self._column("animal")[measured]
+        if not len(animals):
+            return {}
+        days = self._column("day")[measured]
+        cows, cow_index = np.unique(animals, return_inverse=True)
+        first_day = days.min()
+        span = days.max() - first_day + 1
+        keys, sums = _sums_by(cow_index * span + (days - first_day), self._column("liters")[measured])
+        # Keys sort by cow, then day: each cow's days in date order.
+        return dict(zip(cows.tolist(), _split_by(keys // span, sums)))
+
+    @property
+    def intervals_by_cow(self):
+        return self._cached("intervals_by_cow", self._intervals_by_cow)
+
+    def _intervals_by_cow(self):
+        animals = self._column("animal")
+        if not len(animals):
+            return {}
+        by_cow = np.argsort(animals, kind="stable")  # each cow's milkings stay in time order
+        animals = animals[by_cow]
+        hours = np.diff(self._column("time")[by_cow]) / 1e6 / 3600
+        # Gaps beyond a day are export gaps (see analysis._intervals_by_cow).
+        kept = (animals[1:] == animals[:-1]) & (hours > 0) & (hours <= 24)
+        intervals = {cow: [] for cow in np.unique(animals).tolist()}
+        owners = animals[1:][kept]
+        if len(owners):
+            intervals.update(zip(np.unique(owners).tolist(), _split_by(owners, hours[kept])))
+        return intervals
+
+    @property
+    def liters_by_day(self):
+        return self._cached("liters_by_day", self._liters_by_day)
+
+    def _liters_by_day(self):
+        measured = self._column("has_liters")
+        days, sums = _sums_by(self._column("day")[measured], self._column("liters")[measured])
+        return dict(zip(days.tolist(), sums.tolist()))
+
+
+class FeedColumns:
+    """A FeedWindow over a slice of the feed arrays."""
+
+    def __init__(self, columns, low, high):
+        self.columns = columns
+        self.low = low
+        self.high = high
+
+    def _column(self, name):
+        return self.columns[name][self.low : self.high]
+
+    @property
+    def kg_by_day(self):
+        days, sums = _sums_by(self._column("day"), self._column("kg"))
+        return dict(zip(days.tolist(), sums.tolist()))
+
+    @property
+    def feed_left_by_cow(self):
+        cows, cow_index, totals = np.unique(
+            self._column("animal"), return_inverse=True, return_counts=True
+        )
+        left = np.bincount(cow_index[self._column("left")], minlength=len(cows))
+        return {
+            cow: {"not_finished": not_finished, "total": total}
+            for cow, not_finished, total in zip(cows.tolist(), left.tolist(), totals.tolist())
+        }
@@ -0,0 +1,142 @@
+"""What the analysis needs of the history, kept between runs.
+
+Every run used to enrich and analyse the whole history, while only the last
+``reach_days`` before the newest milking (analysis.reach_days: the windows,
+the recovery dip and its baseline) can change a finding, and only the newest
+records changed since the previous run. So the agent keeps that tail of each
+collection here (``cache/analysis_state.json``) together with a watermark --
+the newest timestamp folded in -- and on the next run only parses the records
+after it, appends them, and drops what fell out of reach. The analysis then
+runs on the tail; the record counts of the whole history are kept alongside
+for the context.
+
+Why records and not daily sums per cow: the windows are cut at the exact time
+of the newest milking minus N days, so they start and end in the middle of a
+day, and a day's total can't be split at that moment. The tail keeps only the
+fields the analysis reads, as lists.
+
+Whether the watermark is enough is checked, never assumed: the collection must
+hold exactly the records counted last time plus the ones after the watermark.
+A record stored late with an older timestamp (a re-exported day, a second
+robot catching up) breaks that count, and the state is rebuilt from the full
+collection -- as it is when it is missing, belongs to another vault or was
+kept for other window settings.
+"""
+
+import json
+from bisect import bisect_right
+from datetime import timedelta
+from pathlib import Path
+
+from app.analysis import FEED_FIELDS, reach_days
+
+# The record fields analysis.enrich / enrich_feed read; the rest isn't kept.
+MILK_FIELDS = ("animal_number", "timestamp", "yield_raw", "status")
+FEED_RECORD_FIELDS = ("animal_number", "timestamp", "all_feed_consumed", *FEED_FIELDS)
+
+
+class AnalysisState:
+
+    def __init__(self, file_path, fingerprint, recent_days, baseline_days):
+        self.path = Path(file_path)
+        self.fingerprint = fingerprint
+        self.windows = [recent_days, baseline_days]
+        self.reach_days = reach_days(recent_days, baseline_days)
+        #: {"milk": part, "feed": part} -- see _fold.
+        self.parts = {}
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+            except (json.JSONDecodeError, OSError):
+                return
+            if data.get("fingerprint") == fingerprint and data.get("windows") == self.windows:
+                self.parts = data.get("parts", {})
+
+    def update(self, records, feed_records, parse_timestamp):
+        """Fold this run's collections in; returns {"milk", "feed"}: per
+        collection the records in reach and how many the history holds."""
+        milk, milk_changed = self._fold("milk", records, MILK_FIELDS, parse_timestamp)
+        feed, feed_changed = self._fold("feed", feed_records, FEED_RECORD_FIELDS, parse_timestamp)
+        changed = milk_changed or feed_changed
+        if milk["watermark"] is not None:
+            # Feed is analysed against the milk windows, so the newest milking
+            # decides what is out of reach for both. Rows are in time order.
+            horizon = parse_timestamp(milk["watermark"]) - timedelta(days=self.reach_days)
+            for part in (milk, feed):
+                start = bisect_right(part["rows"], horizon, key=lambda row: parse_timestamp(row[1]))
+                if start:
+                    del part["rows"][:start]
+                    changed = True
+        if changed:
+            self._save()
+        return {
+            "milk": {"records": _records(milk, MILK_FIELDS), "analysed": milk["analysed"]},
+            "feed": {"records": _records(feed, FEED_RECORD_FIELDS), "analysed": feed["analysed"]},
+        }
+
+    def _fold(self, name, records, fields, parse_timestamp):
+        """The part (watermark, counts, rows in time order) after this run,
+        and whether it differs from the saved one.
+
+        ``seen`` is how many records the collection held, ``analysed`` how
+        many of them had a usable timestamp. Rows are [field values] in
+        ``fields`` order; ``timestamp`` is second.
+        """
+        part = self.parts.get(name)
+        newer = None
+        if part and part.get("watermark"):
+            newer = _after(records, part["watermark"], parse_timestamp)
+            if newer is not None and len(records) != part["seen"] + len(newer):
+                newer = None  # a record older than the watermark arrived: rebuild
+        if newer is None:
+            part = {"watermark": None, "seen": 0, "analysed": 0, "rows": []}
+            newer = _after(records, None, parse_timestamp)
+        if part.get("seen") == len(records) and not newer:
+            return part, False
+        newer.sort(key=lambda item: item[0])
+        part = {
+            "watermark": newer[-1][0].isoformat() if newer else part["watermark"],
+            "seen": len(records),
+            "analysed": part["analysed"] + len(newer),
+            "rows": part["rows"] + [[record.get(field) for field in fields] for _, record in newer],
+        }
+        self.parts[name] = part
+        return part, True
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"fingerprint": self.fingerprint, "windows": self.windows, "parts": self.parts}
+        temp_path = self.path.with_suffix(".json.tmp")
+        temp_path.write_text(json.dumps(payload), encoding="utf-8")
+        temp_path.replace(self.path)  # atomic: never leaves a half-written file
+
+
+def _after(records, watermark, parse_timestamp):
+    """[(timestamp, record)] of the records after ``watermark`` (all with a
+    usable timestamp when None); None when they can't be compared with it."""
+    if watermark is None:
+        timed = ((parse_timestamp(record.get("timestamp")), record) for record in records)
+        return [(timestamp, record) for timestamp, record in timed if timestamp is not None]
+    since = parse_timestamp(watermark)
+    day = watermark[:10]
+    newer = []
+    for record in records:
+        value = record.get("timestamp")
+        # ISO text sorts like time, so anything before the watermark's day
+        # is skipped without parsing; a record in another notation that is
+        # skipped wrongly breaks the count check in _fold.
+        if not isinstance(value, str) or value[:10] < day:
+            continue
+        timestamp = parse_timestamp(value)
+        if timestamp is None:
+            continue
+        try:
+            if timestamp > since:
+                newer.append((timestamp, record))
+        except TypeError:
+            return None  # with and without UTC offset: only a rebuild sorts that out
+    return newer
+
+
+def _records(part, fields):
+    return [dict(zip(fields, row)) for row in part["rows"]]
@@ -125,6 +125,24 @@ RECORD_SCHEMA = {
 }
 
 
+def _add_period(record):
+    # v1 -> v2. A v1 insight never recorded which dates it covered, and that
+    # can't be recovered afterwards: the period is stored as unknown (null).
+    upgraded = {}
+    for name, value in record.items():
+        upgraded[name] = value
+        if name == "scope":
+            upgraded["period"] = None
+    upgraded.setdefault("period", None)
+    upgraded["schema_version"] = 2
+    return upgraded
+
+
+#: Upgrades of stored insights to SCHEMA_VERSION, one version at a time, for
+#: the uploader's migrate.py (same contract as a DataSource's ``migrations``).
+MIGRATIONS = {1: _add_period}
+
+
 def _subject_of(scope):
     if "animal_number" in scope:
         return str(scope["animal_number"])
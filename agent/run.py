@@ -1,3 +1,4 @@
+import multiprocessing
 import sys
 from pathlib import Path
 
@@ -7,4 +8,7 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # repo root, fo
 from app.analyst import main
 
 if __name__ == "__main__":
+    # With parallel_workers > 1 the analysis starts worker processes; in a
+    # frozen .exe they must be routed back into the pool.
+    multiprocessing.freeze_support()
     main()
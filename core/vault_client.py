@@ -1,15 +1,24 @@
+import http.client
+import io
 import json
 import logging
+import re
 import threading
 import time
 import urllib.error
 import urllib.parse
 import urllib.request
 from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
 from pathlib import Path
 
 logger = logging.getLogger("melkmonitor.vault")
 
+# A top-level key of a local subject file: the files are written with
+# json.dumps(indent=2), so keys sit at two spaces and record fields at four.
+_SUBJECT_KEY = re.compile(r'^  ("(?:[^"\\]|\\.)*"): ', re.MULTILINE)
+
 
 class VaultClient(ABC):
 
@@ -32,6 +41,26 @@ class VaultClient(ABC):
     def fetch_all(self, prefix):
         raise NotImplementedError
 
+    def fetch_pages(self, prefix, after=None):
+        """Yield ``(records, cursor)`` per page of the collection -- for
+        reading a collection too large to hold at once (migrate.py).
+
+        Passing a yielded ``cursor`` back as ``after`` resumes right after that
+        page. Default: one page from fetch_all(); backends override this.
+        """
+        yield self.fetch_all(prefix), None
+
+    def fetch_id_pages(self, prefix, after=None):
+        """Yield ``(ids, cursor)`` per page of the collection, keeping only the
+        record ids -- for rebuilding dedup state without holding every payload.
+
+        Passing a yielded ``cursor`` back as ``after`` resumes right after that
+        page, so a long read can be checkpointed and continued. Default: the
+        pages of fetch_pages(); backends override this with something lighter.
+        """
+        for records, cursor in self.fetch_pages(prefix, after):
+            yield [record.get("id") for record in records], cursor
+
     def count(self, prefix):
         """How many records the collection holds.
 
@@ -51,6 +80,8 @@ class LocalVaultClient(VaultClient):
     containing all its records keyed by unique id. Avoids one-file-per-record, which
     does not scale on a local filesystem once thousands of records accumulate."""
 
+    BATCH_SIZE = 500  # records per store_many batch
+
     def __init__(self, root_directory):
         self.root = Path(root_directory)
         self.root.mkdir(parents=True, exist_ok=True)
@@ -78,6 +109,32 @@ class LocalVaultClient(VaultClient):
             records[unique_id] = record
             file_path.write_text(json.dumps(records, indent=2), encoding="utf-8")
 
+    def store_many(self, items, on_stored=None):
+        # Batched so each subject file is read and rewritten once per batch
+        # rather than once per record (which also kept concurrent callers
+        # queueing on the lock).
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= self.BATCH_SIZE:
+                self._store_batch(batch, on_stored)
+                batch = []
+        if batch:
+            self._store_batch(batch, on_stored)
+
+    def _store_batch(self, batch, on_stored):
+        by_file = {}
+        for path, record in batch:
+            prefix, subject_id, unique_id = path.rsplit("/", 2)
+            by_file.setdefault(self._subject_file(prefix, subject_id), {})[unique_id] = record
+        with self._lock:
+            for file_path, new_records in by_file.items():
+                records = self._read_subject_file(file_path)
+                records.update(new_records)
+                file_path.write_text(json.dumps(records, indent=2), encoding="utf-8")
+        if on_stored:
+            on_stored([record for _, record in batch])
+
     def fetch_all(self, prefix):
         directory = self.root.joinpath(*prefix.split("/"))
         if not directory.exists():
@@ -87,6 +144,36 @@ class LocalVaultClient(VaultClient):
             records.extend(self._read_subject_file(file_path).values())
         return records
 
+    def fetch_pages(self, prefix, after=None):
+        # One page per subject file, the cursor being the file's name.
+        for file_path in self._subject_files(prefix, after):
+            yield list(self._read_subject_file(file_path).values()), file_path.name
+
+    def fetch_id_pages(self, prefix, after=None):
+        # One page per subject file; the ids are the file's keys, read straight
+        # from the text without decoding any record.
+        for file_path in self._subject_files(prefix, after):
+            yield self._read_subject_keys(file_path), file_path.name
+
+    def _subject_files(self, prefix, after=None):
+        directory = self.root.joinpath(*prefix.split("/"))
+        if not directory.exists():
+            return []
+        return [
+            file_path
+            for file_path in sorted(directory.glob("*.json"))
+            if after is None or file_path.name > after
+        ]
+
+    @classmethod
+    def _read_subject_keys(cls, file_path):
+        text = file_path.read_text(encoding="utf-8")
+        keys = [json.loads(match.group(1)) for match in _SUBJECT_KEY.finditer(text)]
+        if not keys and text.strip() not in ("", "{}"):
+            # Not in the layout store() writes (edited by hand?): decode it.
+            keys = list(cls._read_subject_file(file_path))
+        return keys
+
     def subscribe(self, prefix, callback, interval_seconds=5):
         def poll():
             known_versions = {}
@@ -106,6 +193,181 @@ class LocalVaultClient(VaultClient):
         return thread
 
 
+class RequestBudget:
+    """At most ``limit`` requests in flight, handed out round-robin per farm.
+
+    A plain semaphore lets whichever thread happens to wake first through, so
+    a farm doing a big backfill with three collections could keep a farm with
+    a handful of new milkings waiting for minutes. Here a freed slot goes to
+    the next farm in turn that has a request waiting (first come, first served
+    within a farm), so every farm's uploads keep moving under the one budget.
+    """
+
+    def __init__(self, limit):
+        self._free = limit
+        #: per farm, its waiting requests; dict order is the rotation.
+        self._waiting = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, farm):
+        with self._lock:
+            if self._free:
+                self._free -= 1
+                waiter = None
+            else:
+                waiter = threading.Lock()
+                waiter.acquire()
+                self._waiting.setdefault(farm, deque()).append(waiter)
+        if waiter is not None:
+            waiter.acquire()  # released by _release, which hands us its slot
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        with self._lock:
+            farm = next(iter(self._waiting), None)
+            if farm is None:
+                self._free += 1
+                return
+            queue = self._waiting.pop(farm)
+            waiter = queue.popleft()
+            if queue:
+                self._waiting[farm] = queue  # to the back of the rotation
+            waiter.release()
+
+
+class EVaultConnection:
+    """What every eVault client on one registry shares: the platform token,
+    the HTTP connections and the request budget.
+
+    A platform token is issued per platform, not per eVault (the eVault is
+    picked by the ``X-ENAME`` header), so uploading for many farms needs one
+    token, not one per farm. HTTP connections are kept open and reused per
+    host -- farms' eVaults mostly live on the same few hosts -- instead of a
+    new TCP/TLS handshake for every request. And ``max_concurrent_requests``
+    caps the requests in flight across all clients together (RequestBudget).
+
+    Each MetaStateEVaultClient gets its own connection unless one is passed
+    in; the multi-farm uploader passes the same one to every farm.
+    """
+
+    def __init__(self, registry_url, platform, max_concurrent_requests=2):
+        self.registry_url = registry_url.rstrip("/")
+        self.platform = platform
+        self.budget = RequestBudget(max_concurrent_requests)
+        self._token = None
+        self._token_expires_at = None  # seconds since epoch, or None
+        self._token_lock = threading.Lock()
+        #: per (scheme, host), connections not in use right now.
+        self._idle = {}
+        self._idle_lock = threading.Lock()
+
+    def token(self, refresh_margin_seconds):
+        with self._token_lock:
+            now = time.time()
+            if self._token and (
+                self._token_expires_at is None
+                or now < self._token_expires_at - refresh_margin_seconds
+            ):
+                return self._token
+            body = self.http_json(
+                f"{self.registry_url}/platforms/certification", {"platform": self.platform}
+            )
+            self._token = body["token"]
+            expires_at = body.get("expiresAt")
+            if expires_at:
+                expires_at = float(expires_at)
+                # The adapter treats expiresAt as a Unix timestamp; normalize
+                # milliseconds to seconds if needed.
+                if expires_at > 1e12:
+                    expires_at /= 1000.0
+            self._token_expires_at = expires_at or None
+            return self._token
+
+    def drop_token(self, token):
+        """The server refused ``token``: fetch a fresh one next time (unless
+        another client already did)."""
+        with self._token_lock:
+            if self._token == token:
+                self._token = None
+
+    def http_json(self, url, payload=None, headers=None):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https") or urllib.request.getproxies().get(parts.scheme):
+            # Behind a proxy: let urllib route the request (no reuse).
+            return self._urlopen_json(url, payload, headers)
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        all_headers = {"Content-Type": "application/json", **(headers or {})}
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        key = (parts.scheme, parts.netloc)
+        while True:
+            connection, reused = self._checkout(key)
+            # Only a connection the server closed while it sat idle is retried
+            # on a fresh one: the send fails, or the reply ends before its
+            # first byte. Any later failure may come after the server acted
+            # on the request -- a bulk create resent would store the batch
+            # twice -- so it is raised for the caller's retry (the outbox).
+            stale = False
+            try:
+                try:
+                    connection.request("POST" if data else "GET", target, body=data, headers=all_headers)
+                except (BrokenPipeError, ConnectionResetError):
+                    stale = True
+                    raise
+                try:
+                    response = connection.getresponse()
+                except http.client.RemoteDisconnected:
+                    stale = True
+                    raise
+                body = response.read()
+            except (http.client.HTTPException, OSError) as error:
+                connection.close()
+                if reused and stale:
+                    continue
+                if isinstance(error, OSError):
+                    raise
+                # A reply cut off halfway (IncompleteRead, BadStatusLine): a
+                # network failure to the callers, which retry on OSError.
+                raise ConnectionError(f"{url}: {error!r}") from error
+            if response.will_close:
+                connection.close()
+            else:
+                self._checkin(key, connection)
+            if response.status >= 400:
+                raise urllib.error.HTTPError(
+                    url, response.status, response.reason, response.msg, io.BytesIO(body)
+                )
+            return json.loads(body.decode("utf-8"))
+
+    def _checkout(self, key):
+        with self._idle_lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, netloc = key
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return connection_class(netloc), False
+
+    def _checkin(self, key, connection):
+        with self._idle_lock:
+            self._idle.setdefault(key, []).append(connection)
+
+    @staticmethod
+    def _urlopen_json(url, payload=None, headers=None):
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(url, data=data, method="POST" if data else "GET")
+        request.add_header("Content-Type", "application/json")
+        for key, value in (headers or {}).items():
+            request.add_header(key, value)
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+
 class MetaStateEVaultClient(VaultClient):
     """Client for the real MetaState W3DS eVault.
 
@@ -170,33 +432,32 @@ class MetaStateEVaultClient(VaultClient):
         }
     """
 
-    def __init__(self, registry_url, w3id, platform, schema_ids):
+    def __init__(self, registry_url, w3id, platform, schema_ids, max_concurrent_requests=2, connection=None):
         self.registry_url = registry_url.rstrip("/")
         self.w3id = w3id
         self.platform = platform
         self.schema_ids = schema_ids or {}
+        # Callers may use one client from several threads (the uploader syncs
+        # its sources concurrently, and several farms over one connection):
+        # the connection's budget caps the requests in flight at once so
+        # parallelism never turns into a rate-limit storm, and it fetches a
+        # token only once between them.
+        self.connection = connection or EVaultConnection(registry_url, platform, max_concurrent_requests)
         self._endpoint = None
-        self._token = None
-        self._token_expires_at = None  # seconds since epoch, or None
+        self._endpoint_lock = threading.Lock()
 
     # -- HTTP plumbing -----------------------------------------------------
 
-    @staticmethod
-    def _http_json(url, payload=None, headers=None):
-        data = json.dumps(payload).encode("utf-8") if payload is not None else None
-        request = urllib.request.Request(url, data=data, method="POST" if data else "GET")
-        request.add_header("Content-Type", "application/json")
-        for key, value in (headers or {}).items():
-            request.add_header(key, value)
-        with urllib.request.urlopen(request) as response:
-            return json.loads(response.read().decode("utf-8"))
-
     def _resolve_endpoint(self):
+        with self._endpoint_lock:
+            return self._resolve_endpoint_locked()
+
+    def _resolve_endpoint_locked(self):
         if self._endpoint:
             return self._endpoint
         url = f"{self.registry_url}/resolve?w3id={urllib.parse.quote(self.w3id)}"
         try:
-            body = self._http_json(url)
+            body = self.connection.http_json(url)
         except urllib.error.HTTPError as error:
             if error.code == 404:
                 # By far the most common setup mistake: settings.json still
@@ -221,39 +482,25 @@ class MetaStateEVaultClient(VaultClient):
         return self._endpoint
 
     def _get_token(self):
-        now = time.time()
-        if self._token and (
-            self._token_expires_at is None
-            or now < self._token_expires_at - self.TOKEN_REFRESH_MARGIN_SECONDS
-        ):
-            return self._token
-        body = self._http_json(
-            f"{self.registry_url}/platforms/certification", {"platform": self.platform}
-        )
-        self._token = body["token"]
-        expires_at = body.get("expiresAt")
-        if expires_at:
-            expires_at = float(expires_at)
-            # The adapter treats expiresAt as a Unix timestamp; normalize
-            # milliseconds to seconds if needed.
-            if expires_at > 1e12:
-                expires_at /= 1000.0
-        self._token_expires_at = expires_at or None
-        return self._token
+        return self.connection.token(self.TOKEN_REFRESH_MARGIN_SECONDS)
 
     def _graphql(self, query, variables):
         endpoint = self._resolve_endpoint()
         token_refreshed = False
         for attempt in range(self.MAX_RETRIES):
+            token = self._get_token()
             headers = {
-                "Authorization": f"Bearer {self._get_token()}",
+                "Authorization": f"Bearer {token}",
                 "X-ENAME": self.w3id,
             }
             try:
-                body = self._http_json(endpoint, {"query": query, "variables": variables}, headers)
+                with self.connection.budget.slot(self.w3id):
+                    body = self.connection.http_json(
+                        endpoint, {"query": query, "variables": variables}, headers
+                    )
             except urllib.error.HTTPError as error:
                 if error.code in (401, 403) and not token_refreshed:
-                    self._token = None  # token expired or revoked: fetch a fresh one
+                    self.connection.drop_token(token)  # expired or revoked: fetch a fresh one
                     token_refreshed = True
                     continue
                 # 429 Too Many Requests / 5xx are transient: back off and retry.
@@ -302,32 +549,36 @@ class MetaStateEVaultClient(VaultClient):
         )
 
     def store_many(self, items, on_stored=None):
-        # Group by ontology (derived from each path) and send each group as a
-        # few bulk requests instead of one request per record — this is what
-        # keeps large uploads under the eVault's per-request rate limit.
-        groups = {}
-        for path, record in items:
-            groups.setdefault(self._schema_for(path), []).append(record)
-        total = sum(len(records) for records in groups.values())
+        # Group by ontology (derived from each path) and send each group as
+        # bulk requests instead of one request per record -- this is what
+        # keeps large uploads under the eVault's per-request rate limit. A
+        # chunk is sent as soon as it is full, so ``items`` can be a lazy
+        # stream: uploading starts while the caller is still producing records.
+        pending = {}
         done = 0
-        for ontology, records in groups.items():
-            for start in range(0, len(records), self.BULK_CHUNK_SIZE):
-                chunk = records[start : start + self.BULK_CHUNK_SIZE]
-                inputs = [
-                    {"ontology": ontology, "payload": record, "acl": ["*"]}
-                    for record in chunk
-                ]
-                data = self._graphql(self.BULK_STORE_MUTATION, {"inputs": inputs})
-                result = data["bulkCreateMetaEnvelopes"]
-                if result.get("errorCount"):
-                    raise RuntimeError(
-                        f"bulkCreateMetaEnvelopes: {result['errorCount']} of "
-                        f"{len(chunk)} records failed for ontology '{ontology}'"
-                    )
-                if on_stored:
-                    on_stored(chunk)
-                done += len(chunk)
-                logger.info("eVault upload progress: %d/%d records", done, total)
+        for path, record in items:
+            ontology = self._schema_for(path)
+            chunk = pending.setdefault(ontology, [])
+            chunk.append(record)
+            if len(chunk) >= self.BULK_CHUNK_SIZE:
+                done += self._store_chunk(ontology, pending.pop(ontology), on_stored)
+                logger.info("eVault upload progress '%s': %d records stored", ontology, done)
+        for ontology, chunk in pending.items():
+            done += self._store_chunk(ontology, chunk, on_stored)
+            logger.info("eVault upload progress '%s': %d records stored", ontology, done)
+
+    def _store_chunk(self, ontology, chunk, on_stored):
+        inputs = [{"ontology": ontology, "payload": record, "acl": ["*"]} for record in chunk]
+        data = self._graphql(self.BULK_STORE_MUTATION, {"inputs": inputs})
+        result = data["bulkCreateMetaEnvelopes"]
+        if result.get("errorCount"):
+            raise RuntimeError(
+                f"bulkCreateMetaEnvelopes: {result['errorCount']} of "
+                f"{len(chunk)} records failed for ontology '{ontology}'"
+            )
+        if on_stored:
+            on_stored(chunk)
+        return len(chunk)
 
     def count(self, prefix):
         """Record count in one request, via the connection's totalCount.
@@ -362,6 +613,26 @@ class MetaStateEVaultClient(VaultClient):
                 return records
             after = page_info.get("endCursor")
 
+    def fetch_pages(self, prefix, after=None):
+        schema_id = self._schema_for(prefix)
+        while True:
+            data = self._graphql(
+                self.FETCH_QUERY,
+                {"filter": {"ontologyId": schema_id}, "first": self.PAGE_SIZE, "after": after},
+            )
+            connection = data["metaEnvelopes"]
+            page_info = connection.get("pageInfo") or {}
+            after = page_info.get("endCursor")
+            yield [edge["node"]["parsed"] for edge in connection["edges"]], after
+            if not page_info.get("hasNextPage"):
+                return
+
+    def fetch_id_pages(self, prefix, after=None):
+        # The API can't project into the payload, so pages still arrive whole;
+        # what is saved is memory: each page is reduced to its ids at once.
+        for records, cursor in self.fetch_pages(prefix, after):
+            yield [record.get("id") for record in records], cursor
+
     def subscribe(self, prefix, callback, interval_seconds=5):
         def poll():
             known = set()
@@ -381,7 +652,7 @@ class MetaStateEVaultClient(VaultClient):
         return thread
 
 
-def create_vault_client(vault_config):
+def create_vault_client(vault_config, connection=None):
     mode = vault_config.get("mode", "local")
     if mode == "evault":
         return MetaStateEVaultClient(
@@ -389,5 +660,7 @@ def create_vault_client(vault_config):
             vault_config["w3id"],
             vault_config.get("platform", "melkmonitor"),
             vault_config.get("schema_ids", {}),
+            vault_config.get("max_concurrent_requests", 2),
+            connection,
         )
     return LocalVaultClient(vault_config["local_path"])
@@ -54,6 +54,7 @@ KNOWN_READERS = {
         "agent (cow_speed_drop findings, lactation data)",
         CHATBOT_READER,
     ],
+    "milking_daily_aggregates": [CHATBOT_READER],
     "milking_insights": ["dashboard (/api/insights)", CHATBOT_READER],
 }
 
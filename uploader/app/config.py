@@ -40,6 +40,48 @@ def _normalize_sources(settings):
     return sources
 
 
+def _normalize_farms(settings):
+    """Return the list of farms, each ``{"name", "sources", "vault"}``.
+
+    Without a ``farms`` array there is one farm, named None, made of the
+    top-level ``sources`` and ``vault``. Otherwise every entry is a farm of
+    its own, with the top level as its template: ``vault`` keys in the entry
+    (or the ``w3id`` shorthand) override the top-level vault, and its
+    ``data_directory`` replaces that of every top-level source -- unless the
+    entry lists its own ``sources``. In local mode a farm without its own
+    ``local_path`` gets a folder named after it inside the top-level one.
+    """
+    farms = settings.get("farms")
+    if not farms:
+        return [{"name": None, "sources": settings["sources"], "vault": settings.get("vault", {})}]
+    names = set()
+    normalized = []
+    for farm in farms:
+        name = farm.get("name")
+        if not name or name != Path(name).name or name in names:
+            raise ValueError(
+                f"Every farm needs a unique 'name' usable as a folder name (got {name!r})"
+            )
+        names.add(name)
+        if farm.get("sources"):
+            sources = _normalize_sources(farm)
+        else:
+            sources = [dict(source) for source in settings["sources"]]
+            if "data_directory" in farm:
+                for source in sources:
+                    source["data_directory"] = _resolve(farm["data_directory"])
+        vault = {**settings.get("vault", {}), **farm.get("vault", {})}
+        if "w3id" in farm:
+            vault["w3id"] = farm["w3id"]
+        for key in VAULT_PATH_KEYS:
+            if key in farm.get("vault", {}):
+                vault[key] = _resolve(vault[key])
+        if vault.get("mode") != "evault" and "local_path" not in farm.get("vault", {}):
+            vault["local_path"] = str(Path(vault.get("local_path", _resolve("../evault_local"))) / name)
+        normalized.append({"name": name, "sources": sources, "vault": vault})
+    return normalized
+
+
 def load_settings(settings_path=None):
     settings_path = Path(settings_path) if settings_path else DEFAULT_SETTINGS_PATH
     settings = json.loads(settings_path.read_text(encoding="utf-8"))
@@ -48,4 +90,12 @@ def load_settings(settings_path=None):
     for key in VAULT_PATH_KEYS:
         if key in vault:
             vault[key] = _resolve(vault[key])
+    settings["farms"] = _normalize_farms(settings)
     return settings
+
+
+def vault_fingerprint(vault_config):
+    """Identifies which vault local state belongs to (see app/state.py)."""
+    if vault_config.get("mode") == "evault":
+        return f"evault|{vault_config.get('registry_url')}|{vault_config.get('w3id')}"
+    return f"local|{vault_config.get('local_path')}"
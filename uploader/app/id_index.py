@@ -0,0 +1,169 @@
+"""Compact set of record ids, used as SyncState's ``known``.
+
+A Python set of strings like ``5256_2025-10-16T16-45-14`` costs ~100 bytes per
+id, so the sync state of a multi-year or multi-farm vault runs into hundreds of
+MB and takes seconds to load from a JSON list. But the uploader's ids are not
+arbitrary strings: they are an animal number plus a date, optionally with
+minutes or seconds (see the ``id`` format in each source's record_schema).
+
+Such an id is encoded losslessly into one 64-bit integer -- animal number in
+the top 24 bits, seconds since 1970 in the next 38, and 2 bits saying which of
+the three id formats it was -- and kept in a sorted ``array('Q')``: 8 bytes per
+id, binary search to look one up, and a snapshot that is a single base64 blob.
+Ids that don't fit the pattern (a future source with another format) are kept
+exactly, as strings, so membership is always exact; nothing is hashed.
+"""
+
+import base64
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import date
+from heapq import merge
+
+_ID = re.compile(r"([1-9]\d{0,6})_(\d{4}-\d{2}-\d{2})(?:T(\d{2})-(\d{2})(?:-(\d{2}))?)?", re.ASCII)
+_EPOCH = date(1970, 1, 1).toordinal()
+_SECONDS_BITS = 38
+_FORMAT_DATE, _FORMAT_MINUTES, _FORMAT_SECONDS = 0, 1, 2
+
+_days = {}
+
+
+def _days_since_epoch(iso_date):
+    days = _days.get(iso_date)
+    if days is None:
+        days = date.fromisoformat(iso_date).toordinal() - _EPOCH
+        if days < 0:
+            raise ValueError(iso_date)
+        _days[iso_date] = days
+    return days
+
+
+def encode_id(record_id):
+    """64-bit key for a structured id, or None when it has another shape."""
+    match = _ID.fullmatch(record_id)
+    if not match:
+        return None
+    animal, day, hour, minute, second = match.groups()
+    try:
+        seconds = _days_since_epoch(day) * 86400
+    except ValueError:
+        return None
+    id_format = _FORMAT_DATE
+    if hour is not None:
+        hour, minute = int(hour), int(minute)
+        second_value = int(second) if second is not None else 0
+        if hour > 23 or minute > 59 or second_value > 59:
+            return None
+        seconds += hour * 3600 + minute * 60 + second_value
+        id_format = _FORMAT_SECONDS if second is not None else _FORMAT_MINUTES
+    return (int(animal) << (_SECONDS_BITS + 2)) | (seconds << 2) | id_format
+
+
+def decode_id(key):
+    """Inverse of encode_id: the exact id string the key was made from."""
+    animal = key >> (_SECONDS_BITS + 2)
+    seconds = (key >> 2) & ((1 << _SECONDS_BITS) - 1)
+    id_format = key & 3
+    days, seconds = divmod(seconds, 86400)
+    text = f"{animal}_{date.fromordinal(_EPOCH + days).isoformat()}"
+    if id_format == _FORMAT_DATE:
+        return text
+    hour, seconds = divmod(seconds, 3600)
+    minute, second = divmod(seconds, 60)
+    text = f"{text}T{hour:02d}-{minute:02d}"
+    return f"{text}-{second:02d}" if id_format == _FORMAT_SECONDS else text
+
+
+class IdIndex:
+    """Set-like: ``in``, ``add``, ``update``, ``len`` and iteration (as strings)."""
+
+    #: New keys are collected in a small set and merged into the sorted array
+    #: in one pass once there are this many, instead of one insert per id.
+    MERGE_AFTER = 65_536
+
+    def __init__(self, ids=()):
+        self._keys = array("Q")
+        self._pending = set()
+        self._exact = set()
+        self.update(ids)
+
+    def __contains__(self, record_id):
+        key = encode_id(record_id)
+        if key is None:
+            return record_id in self._exact
+        if key in self._pending:
+            return True
+        position = bisect_left(self._keys, key)
+        return position < len(self._keys) and self._keys[position] == key
+
+    def add(self, record_id):
+        key = encode_id(record_id)
+        if key is None:
+            self._exact.add(record_id)
+            return
+        if key in self._pending:
+            return
+        position = bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            return
+        self._pending.add(key)
+        if len(self._pending) >= self.MERGE_AFTER:
+            self._merge()
+
+    def update(self, ids):
+        # Bulk path (a rebuild hands over every id at once): no lookup per id,
+        # duplicates of already-merged keys are dropped by _merge instead.
+        for record_id in ids:
+            key = encode_id(record_id)
+            if key is None:
+                self._exact.add(record_id)
+            else:
+                self._pending.add(key)
+        if len(self._pending) >= self.MERGE_AFTER:
+            self._merge()
+
+    def _merge(self):
+        if not self._pending:
+            return
+        keys = array("Q")
+        previous = None
+        for key in merge(self._keys, sorted(self._pending)):
+            if key != previous:
+                keys.append(key)
+                previous = key
+        self._keys = keys
+        self._pending = set()
+
+    def __len__(self):
+        self._merge()
+        return len(self._keys) + len(self._exact)
+
+    def __iter__(self):
+        self._merge()
+        for key in self._keys:
+            yield decode_id(key)
+        yield from self._exact
+
+    def to_json(self):
+        """Snapshot payload: the key array as one base64 blob plus the exact ids."""
+        self._merge()
+        keys = array("Q", self._keys)
+        if sys.byteorder == "big":
+            keys.byteswap()  # stored little-endian, whatever machine wrote it
+        return {
+            "keys": base64.b64encode(keys.tobytes()).decode("ascii"),
+            "ids": sorted(self._exact),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        """Inverse of to_json; also reads the older plain ``{"ids": [...]}``."""
+        index = cls()
+        if data.get("keys"):
+            index._keys.frombytes(base64.b64decode(data["keys"]))
+            if sys.byteorder == "big":
+                index._keys.byteswap()
+        index.update(data.get("ids", []))
+        return index
@@ -0,0 +1,289 @@
+"""Schema migrations: re-emit a stored collection in its current record shape.
+
+Every record carries the ``schema_version`` of the shape it was written in,
+and the eVault can't overwrite a record, so old records can't be upgraded in
+place -- left alone, every reader has to handle every version forever. A
+migration instead copies the whole collection into a *target* collection
+(its own ontology), each record brought up to the current version by the
+one-step functions registered for it: ``migrations`` on a DataSource,
+``MIGRATIONS`` in agent/app/insights.py. Readers then switch to the target
+(``vault.schema_ids``) and only ever see the current shape.
+
+It is a batch job over what can be hundreds of thousands of records, shaped
+like a sync: pages are read from the vault one by one, upgraded in the
+process pool (``parallel_workers``) while the next pages are being read, and
+uploaded through ``store_many`` (bulk chunks). The target has a SyncState of
+its own, so nothing is stored twice, and a checkpoint after every few stored
+pages lets a cancelled run continue where it stopped.
+"""
+
+import argparse
+import logging
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from agent.app import insights as agent_insights
+from app.config import STATE_DIRECTORY, load_settings, vault_fingerprint
+from app.id_index import IdIndex
+from app.pipeline import rebuild_known
+from app.sources import create_source
+from app.state import MigrationCheckpoint, SyncState
+from core.vault_client import create_vault_client
+
+logger = logging.getLogger("uploader.migrate")
+
+# Pages handed to the process pool ahead of the one being uploaded.
+PAGES_AHEAD = 8
+# Stored pages between two saved checkpoints.
+CHECKPOINT_PAGES = 10
+# Seconds between two progress lines.
+REPORT_SECONDS = 10
+
+
+def upgrade(records, version, migrations):
+    """``records`` brought up to schema ``version``, plus how many needed it.
+
+    ``migrations`` maps a version to the function upgrading a record of that
+    version one step. Runs in worker processes, so it and the functions are
+    module-level. Raises ValueError for a record no registered step can bring
+    to ``version``: a migration stops rather than store something half done.
+    """
+    upgraded = []
+    changed = 0
+    for record in records:
+        record_version = record.get("schema_version", 1)
+        if record_version > version:
+            raise ValueError(
+                f"record {record.get('id')!r} has schema_version {record_version}, "
+                f"newer than this program's {version}"
+            )
+        if record_version < version:
+            changed += 1
+        while record_version < version:
+            step = migrations.get(record_version)
+            if step is None:
+                raise ValueError(
+                    f"record {record.get('id')!r}: no migration registered from "
+                    f"schema_version {record_version}"
+                )
+            record = step(record)
+            if record.get("schema_version", 1) <= record_version:
+                raise ValueError(f"migration from schema_version {record_version} did not bump it")
+            record_version = record["schema_version"]
+        upgraded.append(record)
+    return upgraded, changed
+
+
+def _upgraded_pages(pages, version, migrations, executor):
+    # (upgraded records, how many changed, records read, cursor) per page, in
+    # page order; with a pool the next PAGES_AHEAD pages are upgraded while
+    # this one is uploaded.
+    if executor is None:
+        for records, cursor in pages:
+            yield (*upgrade(records, version, migrations), len(records), cursor)
+        return
+    in_flight = deque()
+    for records, cursor in pages:
+        in_flight.append((executor.submit(upgrade, records, version, migrations), len(records), cursor))
+        if len(in_flight) > PAGES_AHEAD:
+            future, read, done_cursor = in_flight.popleft()
+            yield (*future.result(), read, done_cursor)
+    while in_flight:
+        future, read, done_cursor = in_flight.popleft()
+        yield (*future.result(), read, done_cursor)
+
+
+def migrate_collection(
+    vault, collection, target, version, migrations, record_path, state=None, checkpoint=None, executor=None
+):
+    """Copy ``collection`` into ``target``, every record at ``version``.
+
+    ``record_path(record)`` is the record's vault path in ``collection``; the
+    copy goes to the same path under ``target``. ``state`` is the target's
+    SyncState and ``checkpoint`` a MigrationCheckpoint (evault mode; both None
+    on the local vault, which is cheap to re-read). Returns the counts.
+    """
+    known = state.known if state else None
+    if known is None:
+        logger.info("Collection '%s': reading the ids it already holds...", target)
+        known = rebuild_known(vault, target, state)
+
+    after, counts = checkpoint.load() if checkpoint else (None, {})
+    counts = {"read": 0, "upgraded": 0, "stored": 0, "skipped": 0, **counts}
+    if after:
+        logger.info(
+            "Migrating '%s' -> '%s': resuming (%d records read before)",
+            collection,
+            target,
+            counts["read"],
+        )
+    queued = IdIndex()  # ids yielded this run, in case the source holds duplicates
+    # (records yielded before the page ended, its cursor, the counts then): a
+    # page is done once that many records are stored.
+    page_ends = deque()
+    progress = {"yielded": 0, "stored_pages": 0, "reported_at": time.perf_counter()}
+    started = time.perf_counter()
+    stored_before = counts["stored"]
+
+    def report(final=False):
+        elapsed = time.perf_counter() - started
+        rate = (counts["stored"] - stored_before) / elapsed if elapsed else 0.0
+        logger.info(
+            "Migrating '%s' -> '%s': %d read, %d upgraded, %d stored, %d already there%s "
+            "(%.0f records/s)",
+            collection,
+            target,
+            counts["read"],
+            counts["upgraded"],
+            counts["stored"],
+            counts["skipped"],
+            " -- done" if final else "",
+            rate,
+        )
+        progress["reported_at"] = time.perf_counter()
+
+    def items():
+        pages = vault.fetch_pages(collection, after)
+        for records, changed, read, cursor in _upgraded_pages(pages, version, migrations, executor):
+            counts["read"] += read
+            counts["upgraded"] += changed
+            for record in records:
+                record_id = record.get("id")
+                if record_id in known or record_id in queued:
+                    counts["skipped"] += 1
+                    continue
+                queued.add(record_id)
+                progress["yielded"] += 1
+                yield f"{target}{record_path(record)[len(collection):]}", record
+            counts_then = {**counts, "stored": stored_before + progress["yielded"]}
+            page_ends.append((progress["yielded"], cursor, counts_then))
+            if time.perf_counter() - progress["reported_at"] >= REPORT_SECONDS:
+                report()
+
+    def on_stored(chunk):
+        ids = [record["id"] for record in chunk]
+        known.update(ids)
+        if state:
+            state.add(ids)
+        counts["stored"] += len(chunk)
+        cursor = None
+        while page_ends and page_ends[0][0] <= counts["stored"] - stored_before:
+            _, cursor, counts_then = page_ends.popleft()
+            progress["stored_pages"] += 1
+        if checkpoint and cursor and progress["stored_pages"] >= CHECKPOINT_PAGES:
+            checkpoint.save(cursor, counts_then)
+            progress["stored_pages"] = 0
+
+    vault.store_many(items(), on_stored=on_stored)
+    if state:
+        state.compact()
+    if checkpoint:
+        checkpoint.clear()
+    report(final=True)
+    return counts
+
+
+def collection_schemas(farm_settings):
+    """{collection: (current schema version, migrations, record_path)} for
+    every collection this farm's programs write."""
+    schemas = {}
+    for source_config in farm_settings["sources"]:
+        source = create_source(source_config)
+        schemas[source.collection] = (source.SCHEMA_VERSION, source.migrations, source.record_path)
+    schemas[agent_insights.COLLECTION] = (
+        agent_insights.SCHEMA_VERSION,
+        agent_insights.MIGRATIONS,
+        agent_insights.record_path,
+    )
+    return schemas
+
+
+def main():
+    arguments = argparse.ArgumentParser(
+        description="Copy a vault collection into a new one, every record upgraded "
+        "to its current schema_version"
+    )
+    arguments.add_argument("collection", help="the collection to migrate, e.g. milking_insights")
+    arguments.add_argument(
+        "--to",
+        metavar="TARGET",
+        help="collection to write the migrated records to (default <collection>_v<version>)",
+    )
+    arguments.add_argument("--farm", help="with several farms in the settings: which one")
+    arguments.add_argument(
+        "--restart",
+        action="store_true",
+        help="read the collection from the start instead of resuming a cancelled run",
+    )
+    options = arguments.parse_args()
+
+    settings = load_settings()
+    farms = {farm["name"]: farm for farm in settings["farms"]}
+    if options.farm is None and len(farms) > 1:
+        sys.exit(f"Several farms are configured; pick one with --farm ({', '.join(farms)})")
+    if options.farm is not None and options.farm not in farms:
+        sys.exit(f"No farm named '{options.farm}' in the settings")
+    farm = farms[options.farm] if options.farm is not None else settings["farms"][0]
+
+    schemas = collection_schemas(farm)
+    if options.collection not in schemas:
+        sys.exit(f"Unknown collection '{options.collection}' (known: {', '.join(schemas)})")
+    version, migrations, record_path = schemas[options.collection]
+    target = options.to or f"{options.collection}_v{version}"
+
+    vault_config = farm["vault"]
+    schema_ids = vault_config.get("schema_ids", {})
+    if schema_ids.get(options.collection, options.collection) == schema_ids.get(target, target):
+        sys.exit(
+            f"'{options.collection}' and '{target}' are the same collection in the "
+            "vault (see vault.schema_ids): nothing to migrate"
+        )
+
+    state, checkpoint = None, None
+    if vault_config.get("mode") == "evault":
+        fingerprint = vault_fingerprint(vault_config)
+        state_directory = STATE_DIRECTORY / farm["name"] if farm["name"] else STATE_DIRECTORY
+        state = SyncState(state_directory / f"{target}.json", fingerprint)
+        checkpoint = MigrationCheckpoint(
+            state_directory / f"{target}.migrate.json", fingerprint, options.collection
+        )
+        if options.restart:
+            checkpoint.clear()
+
+    executor = None
+    workers = settings.get("parallel_workers", 1)
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        migrate_collection(
+            create_vault_client(vault_config),
+            options.collection,
+            target,
+            version,
+            migrations,
+            record_path,
+            state,
+            checkpoint,
+            executor,
+        )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    if vault_config.get("mode") == "evault":
+        switch = (
+            f"map the collection to it in vault.schema_ids of every program, "
+            f"e.g. \"{options.collection}\": \"{schema_ids.get(target, target)}\""
+        )
+    else:
+        switch = f"replace the folder '{options.collection}' in the local vault by '{target}'"
+    logger.info(
+        "'%s' is in '%s' at schema_version %d. To have readers and writers use it, %s "
+        "(run this again first if records were added to '%s' meanwhile).",
+        options.collection,
+        target,
+        version,
+        switch,
+        options.collection,
+    )
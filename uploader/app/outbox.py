@@ -0,0 +1,133 @@
+"""Durable upload queue (evault mode): parsing never waits on the network.
+
+Without it, an unreachable eVault made ``store_many`` raise halfway through a
+tick, the tick was lost, and the next one re-parsed every export file just to
+retry. Now the pipeline appends the transformed, deduplicated records of a
+collection to ``state/<collection>.outbox.jsonl`` (one ``[path, record]`` JSON
+line each, fsync'd per batch) and is done with them; a separate drain uploads
+from the front of the file and records how far it got in
+``<collection>.outbox.pos``. An outage only makes the queue longer. Once a
+collection's queue is fully uploaded the file is truncated again.
+
+Records in the queue are not in the vault yet, so they are not in SyncState
+either; ``pending`` holds their ids so the pipeline doesn't queue them twice.
+
+Like the sync state, the queue belongs to one vault: the position file records
+the vault fingerprint, and a queue left behind for another vault is dropped.
+Its records are queued again for the new one -- the sync state and tail cursors
+start over with the fingerprint too, so the next pass reads them again.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+
+class Outbox:
+
+    def __init__(self, file_path, fingerprint):
+        self.path = Path(file_path)
+        self.position_path = self.path.with_suffix(".pos")
+        self.fingerprint = fingerprint
+        #: ids queued but not yet acknowledged by the vault.
+        self.pending = set()
+        #: set whenever records are appended, so a waiting drain wakes up.
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        self._acked = 0
+        owner = fingerprint
+        if self.position_path.exists():
+            try:
+                position = json.loads(self.position_path.read_text(encoding="utf-8"))
+            except (ValueError, OSError):
+                position = 0
+            if isinstance(position, dict):
+                owner = position.get("fingerprint")
+                self._acked = position.get("acked", 0)
+            elif isinstance(position, int):
+                self._acked = position  # written before the fingerprint was kept
+        if owner != fingerprint:
+            # Queued for another vault (settings changed since): not ours to upload.
+            self.path.unlink(missing_ok=True)
+            self._acked = 0
+        self._load()
+        self._save_position()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        if self._acked > self.path.stat().st_size:
+            self._acked = 0  # crashed between truncating the file and saving the position
+        with open(self.path, "rb") as handle:
+            handle.seek(self._acked)
+            end = self._acked
+            for line in handle:
+                if not line.endswith(b"\n"):
+                    break  # torn by a crash mid-append: dropped below
+                self.pending.add(json.loads(line)[1]["id"])
+                end += len(line)
+        if end < self.path.stat().st_size:
+            # Its records were never acknowledged to the parser either (the
+            # append didn't finish), so the next pass simply queues them again.
+            os.truncate(self.path, end)
+        if self.pending:
+            self.ready.set()
+
+    def __len__(self):
+        """Queue depth: records waiting for the vault."""
+        return len(self.pending)
+
+    def append(self, items):
+        """Durably queue a batch of (path, record) pairs."""
+        lines = []
+        ids = []
+        for path, record in items:
+            lines.append(json.dumps([path, record]) + "\n")
+            ids.append(record["id"])
+        if not lines:
+            return
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as handle:
+                handle.writelines(lines)
+                handle.flush()
+                os.fsync(handle.fileno())
+            self.pending.update(ids)
+        self.ready.set()
+
+    def peek(self, limit):
+        """Up to ``limit`` queued entries from the front, as
+        (end_offset, path, record); pass an entry's end_offset to ``ack``."""
+        entries = []
+        with self._lock:
+            if not self.path.exists():
+                return entries
+            with open(self.path, "rb") as handle:
+                handle.seek(self._acked)
+                end = self._acked
+                for line in handle:
+                    end += len(line)
+                    path, record = json.loads(line)
+                    entries.append((end, path, record))
+                    if len(entries) >= limit:
+                        break
+        return entries
+
+    def ack(self, end_offset, ids):
+        """Everything up to ``end_offset`` is stored in the vault."""
+        with self._lock:
+            self._acked = end_offset
+            self.pending.difference_update(ids)
+            if self._acked >= self.path.stat().st_size:
+                # Fully drained: start the file over instead of growing forever.
+                self.path.write_bytes(b"")
+                self._acked = 0
+            self._save_position()
+
+    def _save_position(self):
+        self.position_path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"fingerprint": self.fingerprint, "acked": self._acked}
+        temp_path = self.position_path.with_suffix(".pos.tmp")
+        temp_path.write_text(json.dumps(payload), encoding="utf-8")
+        temp_path.replace(self.position_path)
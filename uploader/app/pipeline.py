@@ -1,84 +1,469 @@
 import argparse
 import logging
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
 
-from app.config import STATE_DIRECTORY, load_settings
+from app.config import STATE_DIRECTORY, load_settings, vault_fingerprint
 from app.sources import create_source
-from app.state import SyncState
-from core.vault_client import create_vault_client
+from app.id_index import IdIndex
+from app.outbox import Outbox
+from app.profiling import StageProfile, write_report
+from app.state import FileCursors, RebuildCheckpoint, SyncState
+from app.watcher import DirectoryWatcher
+from core.vault_client import EVaultConnection, create_vault_client
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger("uploader")
 
+# Pages of ids read between two saved rebuild checkpoints.
+REBUILD_CHECKPOINT_PAGES = 20
+# Records per fsync'd outbox append, and per drain read from its front.
+OUTBOX_BATCH = 1000
+# Drain retry backoff while the vault is unreachable: doubles up to the max.
+OUTBOX_RETRY_SECONDS = 5
+OUTBOX_MAX_RETRY_SECONDS = 300
 
-def run_once(sources, vault, states):
-    for source in sources:
-        records = source.records()
-        state = states.get(source.collection)
-        known = state.known if state else None
-        if known is None:
-            # No usable local sync state: rebuild the id set from the vault.
-            # On the real eVault this is a full paged crawl and can take
-            # minutes — it happens once; afterwards the state file keeps
-            # every run incremental.
+
+def rebuild_known(vault, collection, state):
+    """Every id already in the vault, read page by page keeping only the ids.
+
+    With a sync state (evault mode) progress is checkpointed next to it, so a
+    rebuild cancelled halfway continues where it stopped on the next run.
+    """
+    checkpoint = None
+    after, known = None, IdIndex()
+    if state:
+        checkpoint = RebuildCheckpoint(state.path.with_suffix(".rebuild.json"), state.fingerprint)
+        after, known = checkpoint.load()
+        if after:
             logger.info(
-                "Collection '%s': rebuilding sync state from the vault "
-                "(first run; can take minutes on the real eVault)...",
-                source.collection,
+                "Collection '%s': resuming the rebuild (%d ids read before)",
+                collection,
+                len(known),
             )
-            known = {record.get("id") for record in vault.fetch_all(source.collection)}
-            if state:
-                state.replace(known)
-        new_records = [record for record in records if record["id"] not in known]
+    for page, (ids, after) in enumerate(vault.fetch_id_pages(collection, after), start=1):
+        known.update(ids)
+        if checkpoint and after and page % REBUILD_CHECKPOINT_PAGES == 0:
+            checkpoint.save(after, known)
+    if not state:
+        return known
+    state.replace(known)
+    checkpoint.clear()
+    return state.known
+
 
-        def on_stored(chunk, _state=state, _known=known):
-            # Runs after every successfully stored chunk, so an interrupted
-            # run never re-uploads what already landed.
+def run_once(sources, vault, states, outboxes=None, profile_path=None, changed=None, thread_name="source"):
+    """Sync every source, concurrently: each collection is its own ontology,
+    so one source's upload never waits for another's parse. The vault client
+    caps how many requests are in flight across all of them.
+
+    With ``profile_path`` every source's stages are timed (app/profiling.py)
+    and the report of this pass is written there as JSON. ``changed``
+    (``{collection: [files]}``, from the watcher) limits the pass to those
+    files; sources without changes are skipped. The sources' threads are
+    named after ``thread_name`` (the farm, when serving several).
+    """
+    outboxes = outboxes or {}
+    if changed is not None:
+        sources = [source for source in sources if source.collection in changed]
+    started = time.perf_counter()
+    if profile_path:
+        for source in sources:
+            source.profile = StageProfile(source.collection)
+    with ThreadPoolExecutor(max_workers=max(1, len(sources)), thread_name_prefix=thread_name) as pool:
+        futures = [
+            pool.submit(
+                sync_source,
+                source,
+                vault,
+                states.get(source.collection),
+                outboxes.get(source.collection),
+                changed.get(source.collection) if changed is not None else None,
+            )
+            for source in sources
+        ]
+    for future in futures:
+        future.result()  # re-raise a source's failure once the others are done
+    if profile_path:
+        report = write_report(
+            [source.profile for source in sources], profile_path, time.perf_counter() - started
+        )
+        for collection, entry in report["sources"].items():
+            logger.info(
+                "Profile '%s': %s; %s records/s",
+                collection,
+                ", ".join(f"{stage} {seconds:.2f} s" for stage, seconds in entry["seconds"].items()),
+                entry["records_per_second"],
+            )
+        logger.info("Profile report written to %s", profile_path)
+
+
+def drain(outbox, vault, state):
+    """Upload the outbox front to back until it is empty; False (nothing
+    uploaded) while the sync state isn't loaded yet.
+
+    Raises whatever the vault raises; everything acknowledged before that
+    stays acknowledged, the rest stays queued.
+    """
+    if state is not None and state.known is None:
+        # The ids are still to be rebuilt from the vault (first run, a
+        # corrupt state, --rebuild-state) or that rebuild is running. Acked
+        # ids would make a state of just those -- the pipeline would take it
+        # for loaded and upload the history again -- or be thrown away by
+        # the rebuild's replace(). The queue waits for the state.
+        return False
+    while True:
+        entries = outbox.peek(OUTBOX_BATCH)
+        if not entries:
+            break
+        stored = 0
+
+        def on_stored(chunk, _entries=entries):
+            nonlocal stored
+            # Chunks come back in queue order, so the count says how far the
+            # front of the queue is safely in the vault.
+            stored += len(chunk)
             ids = [record["id"] for record in chunk]
-            _known.update(ids)
-            if _state:
-                _state.add(ids)
+            if state:
+                state.add(ids)  # known first: the id must never be in neither
+            outbox.ack(_entries[stored - 1][0], ids)
 
-        vault.store_many(
-            ((source.record_path(record), record) for record in new_records),
-            on_stored=on_stored,
+        vault.store_many(((path, record) for _, path, record in entries), on_stored=on_stored)
+    if state:
+        state.compact()
+    return True
+
+
+def drain_forever(collection, outbox, vault, state):
+    """Watch mode: upload whatever gets queued, backing off while the vault is
+    unreachable. Runs in its own thread, so parsing never waits for it."""
+    delay = OUTBOX_RETRY_SECONDS
+    while True:
+        outbox.ready.wait()
+        outbox.ready.clear()
+        try:
+            drained = drain(outbox, vault, state)
+        except (RuntimeError, OSError) as error:
+            logger.warning(
+                "Collection '%s': vault unreachable (%s); %d records wait in the "
+                "outbox, retrying in %d s",
+                collection,
+                error,
+                len(outbox),
+                delay,
+            )
+            time.sleep(delay)
+            delay = min(delay * 2, OUTBOX_MAX_RETRY_SECONDS)
+            outbox.ready.set()
+            continue
+        if not drained:
+            # The pass rebuilding the sync state may queue nothing new, so
+            # don't wait for an append: look again shortly.
+            time.sleep(OUTBOX_RETRY_SECONDS)
+            outbox.ready.set()
+            continue
+        delay = OUTBOX_RETRY_SECONDS
+        logger.info("Collection '%s': outbox drained", collection)
+
+
+def drain_once(outboxes, vault, states, thread_name="drain"):
+    """Single run: try to upload every queue once. A failure is logged, not
+    raised -- the records stay queued for the next run."""
+
+    def attempt(collection, outbox):
+        try:
+            if not drain(outbox, vault, states.get(collection)):
+                logger.warning(
+                    "Collection '%s': no sync state yet; %d records stay in the "
+                    "outbox for the next run",
+                    collection,
+                    len(outbox),
+                )
+        except (RuntimeError, OSError) as error:
+            logger.warning(
+                "Collection '%s': vault unreachable (%s); %d records stay in the "
+                "outbox for the next run",
+                collection,
+                error,
+                len(outbox),
+            )
+
+    with ThreadPoolExecutor(max_workers=max(1, len(outboxes)), thread_name_prefix=thread_name) as pool:
+        for collection, outbox in outboxes.items():
+            pool.submit(attempt, collection, outbox)
+
+
+def sync_source(source, vault, state, outbox=None, files=None):
+    profile = source.profile
+    known = state.known if state else None
+    if known is None:
+        # No usable local sync state: rebuild the id set from the vault.
+        # On the real eVault this is a full paged crawl and can take
+        # minutes — it happens once; afterwards the state file keeps
+        # every run incremental.
+        logger.info(
+            "Collection '%s': rebuilding sync state from the vault "
+            "(first run; can take minutes on the real eVault)...",
+            source.collection,
         )
+        started = time.perf_counter()
+        known = rebuild_known(vault, source.collection, state)
+        if profile is not None:
+            profile.rebuild_seconds += time.perf_counter() - started
+
+    counts = {"read": 0, "new": 0}
+
+    def new_records():
+        # A stream end to end: records are parsed, deduplicated and handed
+        # to store_many one at a time, so memory stays flat however much
+        # history the export files hold.
+        for record in source.records(files):
+            counts["read"] += 1
+            if record["id"] in known or (outbox is not None and record["id"] in outbox.pending):
+                continue
+            counts["new"] += 1
+            yield record
+
+    def on_stored(chunk):
+        # Runs after every successfully stored chunk, so an interrupted
+        # run never re-uploads what already landed.
+        ids = [record["id"] for record in chunk]
+        known.update(ids)
+        if state:
+            state.add(ids)
+
+    records = new_records()
+    if profile is not None:
+        records = profile.timed(records, "dedup")
+    started = time.perf_counter()
+    items = ((source.record_path(record), record) for record in records)
+    if outbox is None:
+        vault.store_many(items, on_stored=on_stored)
+        if state:
+            state.compact()
+    else:
+        # Queue durably and move on; the drain does the uploading.
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= OUTBOX_BATCH:
+                outbox.append(batch)
+                batch = []
+        outbox.append(batch)
+    if profile is not None:
+        # The whole stream ran inside this call; in evault mode "store" is
+        # appending to the outbox (the upload itself happens in the drain).
+        profile.add_time("store", time.perf_counter() - started)
+    # Everything read up to the new positions is stored (or queued) now.
+    source.commit(full_pass=files is None)
+    if outbox is None:
         logger.info(
             "Collection '%s': uploaded %d new records (%d in source files, %d already stored)",
             source.collection,
-            len(new_records),
-            len(records),
-            len(records) - len(new_records),
+            counts["new"],
+            counts["read"],
+            counts["read"] - counts["new"],
+        )
+    else:
+        logger.info(
+            "Collection '%s': queued %d new records (%d in source files, %d already "
+            "stored or queued); outbox depth %d",
+            source.collection,
+            counts["new"],
+            counts["read"],
+            counts["read"] - counts["new"],
+            len(outbox),
+        )
+
+
+class Farm:
+    """One farm: its sources, its vault client and its local state.
+
+    A single-farm configuration keeps its state directly in ``state/``; with
+    ``farms`` in the settings every farm gets ``state/<name>/`` (see
+    app/config.py), so the farms' sync states, outboxes and cursors never mix.
+    """
+
+    def __init__(self, farm_settings, vault, options, executor=None):
+        self.name = farm_settings["name"]
+        self.vault = vault
+        self.state_directory = STATE_DIRECTORY / self.name if self.name else STATE_DIRECTORY
+        self.sources = [create_source(source_config) for source_config in farm_settings["sources"]]
+        for source in self.sources:
+            source.executor = executor
+        self.profile_path = options.profile
+        if self.profile_path and self.name:
+            self.profile_path = self.profile_path.with_name(
+                f"{self.profile_path.stem}-{self.name}{self.profile_path.suffix}"
+            )
+        self.watcher = None
+
+        # Local sync state is only worth it for the real eVault (rate-limited,
+        # expensive to crawl); the local test vault is cheap to re-read every run.
+        self.states = {}
+        self.outboxes = {}
+        vault_config = farm_settings["vault"]
+        fingerprint = vault_fingerprint(vault_config)
+        if vault_config.get("mode") == "evault":
+            for source in self.sources:
+                state_path = self.state_directory / f"{source.collection}.json"
+                if options.rebuild_state:
+                    state_path.unlink(missing_ok=True)
+                    state_path.with_suffix(".journal").unlink(missing_ok=True)
+                    # A fresh rebuild, not the resumption of an old one.
+                    state_path.with_suffix(".rebuild.json").unlink(missing_ok=True)
+                self.states[source.collection] = SyncState(state_path, fingerprint)
+                # Never discarded by --rebuild-state: it holds records that are
+                # not in the vault yet.
+                self.outboxes[source.collection] = Outbox(
+                    self.state_directory / f"{source.collection}.outbox.jsonl", fingerprint
+                )
+
+        # Tail mode: remember how far each export file was read, so a pass only
+        # parses what the robot appended since (see read_delimited_rows).
+        for source in self.sources:
+            if source.config.get("tail"):
+                cursors_path = self.state_directory / f"{source.collection}.cursors.json"
+                if options.rebuild_state and cursors_path.exists():
+                    cursors_path.unlink()
+                source.cursors = FileCursors(cursors_path, fingerprint)
+        for source in self.sources:
+            source.load_state(self.state_directory, fingerprint, options.rebuild_state)
+
+    def run_once(self, changed=None):
+        run_once(
+            self.sources,
+            self.vault,
+            self.states,
+            self.outboxes,
+            self.profile_path,
+            changed,
+            self.name or "source",
+        )
+
+    def drain_once(self):
+        drain_once(
+            self.outboxes, self.vault, self.states, f"{self.name}-drain" if self.name else "drain"
         )
 
+    def start_draining(self):
+        for collection, outbox in self.outboxes.items():
+            threading.Thread(
+                target=drain_forever,
+                args=(collection, outbox, self.vault, self.states.get(collection)),
+                name=f"{self.name}-drain-{collection}" if self.name else f"drain-{collection}",
+                daemon=True,
+            ).start()
+
+    def sync_changes(self, changed, changed_at):
+        """Watch mode: one pass over the files the watcher reported."""
+        prefix = f"Farm '{self.name}': " if self.name else ""
+        try:
+            self.run_once(changed)
+        except Exception:
+            # The files stay unsynced and are reported again on the next poll;
+            # the other farms carry on meanwhile.
+            logger.exception("%sSync of %s failed", prefix, ", ".join(sorted(changed)))
+            return
+        self.watcher.synced(changed)
+        stored_at = time.time()
+        for collection, files in changed.items():
+            logger.info(
+                "%sCollection '%s': %d changed file(s) synced; change-to-stored latency %.1f s",
+                prefix,
+                collection,
+                len(files),
+                stored_at - min(changed_at[file_path] for file_path in files),
+            )
+
+
+def _each_farm(farms, action):
+    """Run ``action(farm)`` for every farm at once; re-raise the first failure
+    once all are done."""
+    with ThreadPoolExecutor(max_workers=len(farms), thread_name_prefix="farm") as pool:
+        futures = [pool.submit(action, farm) for farm in farms]
+    for future in futures:
+        future.result()
+
 
 def main():
     arguments = argparse.ArgumentParser(description="Melkmonitor data uploader")
-    arguments.add_argument("--watch", action="store_true", help="keep running; re-scan periodically")
+    arguments.add_argument("--watch", action="store_true", help="keep running; sync export files as they change")
     arguments.add_argument(
         "--rebuild-state",
         action="store_true",
         help="discard the local sync state and rebuild it from the vault",
     )
+    arguments.add_argument(
+        "--profile",
+        nargs="?",
+        const=STATE_DIRECTORY / "profile.json",
+        type=Path,
+        metavar="REPORT",
+        help="time every stage per source and write a JSON report "
+        "(default state/profile.json)",
+    )
     options = arguments.parse_args()
 
     settings = load_settings()
-    vault = create_vault_client(settings["vault"])
-    sources = [create_source(source_config) for source_config in settings["sources"]]
-
-    # Local sync state is only worth it for the real eVault (rate-limited,
-    # expensive to crawl); the local test vault is cheap to re-read every run.
-    states = {}
-    vault_config = settings["vault"]
-    if vault_config.get("mode") == "evault":
-        fingerprint = f"evault|{vault_config.get('registry_url')}|{vault_config.get('w3id')}"
-        for source in sources:
-            state_path = STATE_DIRECTORY / f"{source.collection}.json"
-            if options.rebuild_state and state_path.exists():
-                state_path.unlink()
-            states[source.collection] = SyncState(state_path, fingerprint)
-
-    run_once(sources, vault, states)
-    while options.watch:
-        time.sleep(settings.get("watch_interval_seconds", 60))
-        run_once(sources, vault, states)
+    if len(settings["farms"]) > 1:
+        # Many farms log the same collection names: say whose thread it is.
+        for handler in logging.getLogger().handlers:
+            handler.setFormatter(
+                logging.Formatter("%(asctime)s %(levelname)s [%(threadName)s] %(message)s")
+            )
+
+    # Parsing is CPU-bound (csv, timestamps, number conversion); with
+    # parallel_workers > 1 every source of every farm fans its files out over
+    # one shared process pool. Files are merged back in order, so results are
+    # identical.
+    executor = None
+    workers = settings.get("parallel_workers", 1)
+    if workers > 1 and options.profile:
+        # Stages running in worker processes can't be timed from here.
+        logger.info("Profiling: parsing in this process (parallel_workers ignored)")
+    elif workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+
+    # Farms on the same registry share one token, the HTTP connections and
+    # the vault.max_concurrent_requests budget, handed out round-robin.
+    connections = {}
+    farms = []
+    for farm_settings in settings["farms"]:
+        vault_config = farm_settings["vault"]
+        connection = None
+        if vault_config.get("mode") == "evault":
+            key = (vault_config["registry_url"], vault_config.get("platform", "melkmonitor"))
+            if key not in connections:
+                connections[key] = EVaultConnection(*key, vault_config.get("max_concurrent_requests", 2))
+            connection = connections[key]
+        vault = create_vault_client(vault_config, connection)
+        farms.append(Farm(farm_settings, vault, options, executor))
+
+    if options.watch:
+        for farm in farms:
+            # Snapshot before the first pass, so a change made during it is seen.
+            farm.watcher = DirectoryWatcher(farm.sources, settings.get("watch_debounce_seconds", 5))
+    _each_farm(farms, Farm.run_once)
+    if not options.watch:
+        _each_farm(farms, Farm.drain_once)
+        return
+    # Only now: the first pass loaded or rebuilt every sync state, which the
+    # drains add the stored ids to (drain waits for it regardless).
+    for farm in farms:
+        farm.start_draining()
+
+    # One polling loop for all farms. A farm whose pass is still running (a
+    # big backfill) is not polled again until it is done; the others are.
+    running = {}
+    with ThreadPoolExecutor(max_workers=len(farms), thread_name_prefix="farm") as pool:
+        while True:
+            time.sleep(settings.get("watch_poll_seconds", 2))
+            for farm in farms:
+                if farm in running and not running[farm].done():
+                    continue
+                changed, changed_at = farm.watcher.poll()
+                if changed:
+                    running[farm] = pool.submit(farm.sync_changes, changed, changed_at)
@@ -0,0 +1,231 @@
+"""Export files inside ``.zip``, ``.gz`` and ``.tar.gz`` archives, read in place.
+
+Farms hand over months of exports as one bundle. Unpacking it into
+``data_directory`` first would write gigabytes of temporary files to the farm
+PC, so ``DataSource.files()`` also lists the members of every archive in the
+directory whose name matches the source's ``file_pattern`` (matched against
+the member's own file name, folders inside the archive ignored), as
+``ArchiveMember`` objects that stand in for a ``Path``: a ``name`` and
+``stem``, a ``stat()`` (the archive's), and ``open()`` for a binary stream of
+the decompressed member. read_delimited_rows reads them like any export, with
+the same ``sep=`` and encoding handling.
+
+A zip member or plain ``.gz`` is opened directly. A ``.tar.gz`` can only be
+read front to back, so opening its members one at a time would decompress the
+archive again for every member; ``readable_in_order`` and ``groups`` instead
+hand all wanted members of one tar to a single pass through it.
+
+Member listings are cached per archive (by size and mtime), so the watcher can
+list them every poll without reading the archives again.
+"""
+
+import fnmatch
+import gzip
+import io
+import os
+import struct
+import tarfile
+import zipfile
+from pathlib import Path, PurePosixPath
+
+_listings = {}
+
+
+def archive_kind(file_path):
+    """``"zip"``, ``"tar"``, ``"gz"`` or None for a file that is no archive."""
+    name = file_path.name.lower()
+    if name.endswith(".zip"):
+        return "zip"
+    if name.endswith((".tar.gz", ".tgz")):
+        return "tar"
+    if name.endswith(".gz"):
+        return "gz"
+    return None
+
+
+class ArchiveMember:
+    """One file inside an archive, usable where sources expect a ``Path``."""
+
+    def __init__(self, archive, member, size, kind):
+        self.archive = Path(archive)
+        self.member = member
+        #: decompressed size in bytes.
+        self.size = size
+        self.kind = kind
+        path = PurePosixPath(member)
+        self.name = path.name
+        self.stem = path.stem
+        self.suffix = path.suffix
+        #: the open stream while a single pass through a tar serves this member.
+        self._stream = None
+
+    def __str__(self):
+        return f"{self.archive}!{self.member}"
+
+    def __repr__(self):
+        return f"ArchiveMember({str(self)!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, ArchiveMember) and (self.archive, self.member) == (
+            other.archive,
+            other.member,
+        )
+
+    def __hash__(self):
+        return hash((self.archive, self.member))
+
+    def __lt__(self, other):
+        # Members sort by archive, then member name. Sorting them together
+        # with plain paths has no meaningful order; files() decides that.
+        if not isinstance(other, ArchiveMember):
+            return NotImplemented
+        return (self.archive, self.member) < (other.archive, other.member)
+
+    def __getstate__(self):
+        # Picklable for the process pool; an open tar stream stays behind.
+        return {**self.__dict__, "_stream": None}
+
+    def stat(self):
+        """The archive's stat: a member changes exactly when its archive does."""
+        return self.archive.stat()
+
+    @property
+    def fingerprint(self):
+        """Identifies this version of the archive (tail mode's ``check``)."""
+        status = self.stat()
+        return f"{status.st_size}:{status.st_mtime_ns}"
+
+    def open(self):
+        """Binary stream of the decompressed member."""
+        if self._stream is not None:
+            return _Borrowed(self._stream)
+        if self.kind == "zip":
+            with zipfile.ZipFile(self.archive) as archive:
+                # The member stream keeps the file open after the ZipFile closes.
+                return archive.open(self.member)
+        if self.kind == "gz":
+            return gzip.open(self.archive, "rb")
+        # Random access into a tar.gz: decompresses up to the member. Only
+        # used when it isn't read as part of a pass (readable_in_order).
+        archive = tarfile.open(self.archive, "r:gz")
+        return _Owning(archive.extractfile(self.member), archive)
+
+
+class _Borrowed(io.BufferedIOBase):
+    """A stream handed out for one member that must not close the tar pass."""
+
+    def __init__(self, stream):
+        super().__init__()
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+    def read1(self, size=-1):
+        return self._stream.read(size)
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+class _Owning(_Borrowed):
+    """A member stream that closes its archive along with itself."""
+
+    def __init__(self, stream, archive):
+        super().__init__(stream)
+        self._archive = archive
+
+    def close(self):
+        if not self.closed:
+            self._archive.close()
+        super().close()
+
+
+def _gzip_size(file_path):
+    # The gzip trailer holds the decompressed size (modulo 4 GiB).
+    with open(file_path, "rb") as handle:
+        handle.seek(-4, os.SEEK_END)
+        return struct.unpack("<I", handle.read(4))[0]
+
+
+def _list(file_path, kind):
+    """[(member name, size)] in archive order."""
+    if kind == "zip":
+        with zipfile.ZipFile(file_path) as archive:
+            return [(info.filename, info.file_size) for info in archive.infolist() if not info.is_dir()]
+    if kind == "tar":
+        with tarfile.open(file_path, "r:gz") as archive:
+            return [(info.name, info.size) for info in archive.getmembers() if info.isfile()]
+    return [(file_path.name[: -len(".gz")], _gzip_size(file_path))]
+
+
+def archive_members(file_path, pattern):
+    """Members of an archive whose file name matches ``pattern``, in archive
+    order. An unreadable archive is skipped with no members, like an export
+    that fails to parse."""
+    kind = archive_kind(file_path)
+    try:
+        status = file_path.stat()
+        cached = _listings.get(file_path)
+        if cached and cached[0] == (status.st_size, status.st_mtime_ns):
+            listing = cached[1]
+        else:
+            listing = _list(file_path, kind)
+            _listings[file_path] = ((status.st_size, status.st_mtime_ns), listing)
+    except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError):
+        return []
+    return [
+        ArchiveMember(file_path, name, size, kind)
+        for name, size in listing
+        if fnmatch.fnmatch(PurePosixPath(name).name, pattern)
+    ]
+
+
+def groups(files):
+    """``files`` split into consecutive runs that are read together: the
+    members of one tar.gz form one run, everything else is a run of one."""
+    runs = []
+    for file_path in files:
+        if (
+            isinstance(file_path, ArchiveMember)
+            and file_path.kind == "tar"
+            and runs
+            and isinstance(runs[-1][0], ArchiveMember)
+            and runs[-1][0].kind == "tar"
+            and runs[-1][0].archive == file_path.archive
+        ):
+            runs[-1].append(file_path)
+        else:
+            runs.append([file_path])
+    return runs
+
+
+def readable_in_order(files):
+    """Yield ``files`` in order, each ready to ``open``. A run of tar.gz
+    members is served from one front-to-back pass through the archive, each
+    member while the pass stands on it -- so read it before asking for the
+    next."""
+    for run in groups(files):
+        first = run[0]
+        if not (isinstance(first, ArchiveMember) and first.kind == "tar" and len(run) > 1):
+            yield from run
+            continue
+        wanted = {member.member: member for member in run}
+        try:
+            with tarfile.open(first.archive, "r|gz") as archive:
+                for info in archive:
+                    member = wanted.get(info.name)
+                    if member is None or not info.isfile():
+                        continue
+                    member._stream = archive.extractfile(info)
+                    try:
+                        yield member
+                    finally:
+                        member._stream = None
+        except (OSError, EOFError, tarfile.TarError):
+            continue  # a damaged archive: what was read before stays read
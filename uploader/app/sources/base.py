@@ -27,43 +27,185 @@ Adding a new data source:
    ``VAULT_SCHEMA.json``, so readers (the dashboard, the agent, ...) know the
    new collection exists without reading this source's code.
 The pipeline, vault clients and dedup state need no changes.
+
+File-based sources only implement ``parse_file`` (one export file -> raw rows)
+and inherit ``parse``, which walks ``data_directory`` / ``file_pattern``. That
+is also what makes tail mode (``"tail": true`` in the source config) work for
+every source: ``parse`` hands each file its saved read position, and
+``read_delimited_rows`` returns only the rows appended since. Exports inside
+``.zip`` / ``.gz`` / ``.tar.gz`` archives in ``data_directory`` are read in
+place the same way (``archives.py``); ``parse_file`` can't tell the difference.
 """
 
 import csv
+import hashlib
+import io
+import os
+import time
 from abc import ABC, abstractmethod
+from collections import deque
+from itertools import chain, repeat
+from pathlib import Path
+
+from app.id_index import IdIndex
+from app.sources.archives import (
+    ArchiveMember,
+    archive_kind,
+    archive_members,
+    groups,
+    readable_in_order,
+)
+
+# Bytes just before a saved read position that are fingerprinted, so a file
+# that was replaced or rewritten (rather than appended to) is noticed even when
+# it is already longer than the saved position.
+TAIL_CHECK_BYTES = 64
 
+# Bound on parse_number's memo; only reachable by a column of distinct garbage.
+NUMBER_MEMO_LIMIT = 100_000
+_numbers = {}
 
-def read_delimited_rows(file_path):
-    """Yield rows from a milking-robot CSV/TXT export.
+
+def _delimiter_of(first_line):
+    """(delimiter, declared) for an export's first line.
 
     These exports declare their own separator on the first line (``sep=,``),
     which follows the robot's locale settings rather than a fixed convention --
-    so honour that line instead of assuming a separator. Values containing the
-    separator are quoted by the export (``"14,8"``), which csv handles.
+    so honour that line instead of assuming a separator. Without a declaration,
+    guess from the header (the line is then data, not a declaration).
+    """
+    if first_line.strip().lower().startswith("sep="):
+        return first_line.strip()[4:] or ",", True
+    return (";" if first_line.count(";") > first_line.count(",") else ","), False
+
+
+def _tail_check(handle, offset):
+    start = max(0, offset - TAIL_CHECK_BYTES)
+    handle.seek(start)
+    return hashlib.sha1(handle.read(offset - start)).hexdigest()
+
+
+def read_delimited_rows(file_path, cursor=None, profile=None):
+    """Rows from a milking-robot CSV/TXT export, as an iterator of lists.
+
+    Values containing the separator are quoted by the export (``"14,8"``),
+    which csv handles. Read as UTF-8 with replacement: the ignored robot
+    columns can contain anything (the feed export literally holds emoji), and
+    that must never stop the data columns from parsing.
+
+    ``cursor`` (tail mode) is a dict holding where the previous read stopped:
+    ``offset`` in bytes, the file's ``delimiter`` (the ``sep=`` line is only at
+    the top, so it must be remembered) and a ``check`` of the bytes before the
+    offset. Only complete lines after the offset are read -- a line the robot
+    is still writing waits for the next pass -- and the cursor is advanced in
+    place. A file that shrank or whose checked bytes changed was truncated or
+    rotated, and is read again from the top.
 
-    Read as UTF-8 with replacement: the ignored robot columns can contain
-    anything (the feed export literally holds emoji), and that must never stop
-    the data columns from parsing.
+    ``profile`` (an ``app.profiling.StageProfile``, ``--profile`` only) is
+    given the bytes read, the time spent reading them and the time spent in
+    csv on top of that.
     """
-    with open(file_path, encoding="utf-8-sig", errors="replace", newline="") as handle:
-        first_line = handle.readline()
-        if first_line.strip().lower().startswith("sep="):
-            delimiter = first_line.strip()[4:] or ","
-        else:
-            # No declaration: guess from the header, then re-read from the top.
-            delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
-            handle.seek(0)
-        yield from csv.reader(handle, delimiter=delimiter)
+    rows = _delimited_rows(file_path, cursor, profile)
+    return rows if profile is None else profile.timed(rows, "read_delimited_rows")
+
+
+def _open_binary(file_path):
+    """(binary stream, size) of an export file or archive member."""
+    if isinstance(file_path, ArchiveMember):
+        return file_path.open(), file_path.size
+    handle = open(file_path, "rb")
+    return handle, os.fstat(handle.fileno()).st_size
+
+
+def _delimited_rows(file_path, cursor, profile):
+    member = isinstance(file_path, ArchiveMember)
+    if cursor is None or member:
+        if member and cursor is not None:
+            # Archive members never grow in place: either this version of the
+            # archive was read completely before, or the member is read whole.
+            done = {"offset": file_path.size, "check": file_path.fingerprint}
+            if all(cursor.get(key) == value for key, value in done.items()):
+                return
+        binary, size = _open_binary(file_path)
+        with io.TextIOWrapper(binary, encoding="utf-8-sig", errors="replace", newline="") as handle:
+            first_line = handle.readline()
+            delimiter, declared = _delimiter_of(first_line)
+            lines = handle
+            if not declared:
+                lines = chain((first_line,), handle)
+            if profile is not None:
+                profile.add_file(size)
+                lines = profile.timed(lines, "file_read")
+            yield from csv.reader(lines, delimiter=delimiter)
+        if member and cursor is not None:
+            cursor.clear()
+            cursor.update(done)
+        return
+
+    started = time.perf_counter()
+    with open(file_path, "rb") as handle:
+        size = os.fstat(handle.fileno()).st_size
+        offset = cursor.get("offset", 0)
+        if offset and (size < offset or _tail_check(handle, offset) != cursor.get("check")):
+            cursor.clear()
+            offset = 0
+        if size == offset:
+            return
+        handle.seek(offset)
+        appended = handle.read(size - offset)
+        end = appended.rfind(b"\n") + 1
+        if not end:
+            return
+        cursor["offset"] = offset + end
+        cursor["check"] = _tail_check(handle, offset + end)
+
+    text = appended[:end].decode("utf-8", errors="replace")
+    if profile is not None:
+        profile.add_file(end)
+        profile.add_time("file_read", time.perf_counter() - started)
+    if offset == 0:
+        text = text.removeprefix("\ufeff")
+        first_line, _, rest = text.partition("\n")
+        cursor["delimiter"], declared = _delimiter_of(first_line)
+        if declared:
+            text = rest
+    yield from csv.reader(io.StringIO(text, newline=""), delimiter=cursor.get("delimiter", ","))
+
+
+def _transform_files(source_class, source_config, files, cursors):
+    """Worker side of parallel parsing: parse + transform whole files (one
+    export, or all members of one tar.gz -- see archives.groups).
+
+    Module-level (not a method) so a process pool can pickle it; the source is
+    rebuilt from its config in the worker, which is cheap. Returns the cursors
+    too, because in tail mode the worker is the one that advanced them.
+    """
+    source = source_class(source_config)
+    return list(source._transform_rows(source._parse(files, cursors))), cursors
 
 
 def parse_number(value):
     """Number from a Dutch robot export: decimal comma, empty -> None.
-    Returns int when the value is integral (mirrors yield_raw handling)."""
+    Returns int when the value is integral (mirrors yield_raw handling).
+
+    Memoized per distinct text: a numeric column of an export repeats the
+    same few thousand values (feed amounts, ``0``, empty), so the strip /
+    replace / float work is done once per value rather than once per cell.
+    """
+    try:
+        return _numbers[value]
+    except KeyError:
+        pass
     text = (value or "").strip().replace(",", ".")
-    if not text:
-        return None
-    number = float(text)
-    return int(number) if number.is_integer() else number
+    number = None
+    if text:
+        number = float(text)
+        if number.is_integer():
+            number = int(number)
+    if len(_numbers) >= NUMBER_MEMO_LIMIT:
+        _numbers.clear()
+    _numbers[value] = number
+    return number
 
 
 def parse_int(value):
@@ -88,13 +230,94 @@ class DataSource(ABC):
     #: Human-readable vault path template, e.g. "{collection}/{animal_number}/{id}".
     path_pattern = "{collection}/records/{id}"
 
+    #: ``file_pattern`` used when the source config doesn't set one.
+    default_file_pattern = "*"
+
+    #: How many of the most recent record ids records() remembers to drop
+    #: duplicates (see records()).
+    dedup_window = 50_000
+
+    #: Record field holding the moment the record describes, as ISO text
+    #: that sorts in time order, and that the record's id is built from. Lets
+    #: records() catch duplicates older than its window cheaply; None (the
+    #: default) leaves those to the pipeline's sync state.
+    order_field = None
+
+    #: How many leading characters of ``order_field`` the id carries (e.g.
+    #: 16 for an id to the minute over a timestamp with seconds); None: all
+    #: of it. Two records with the same id have the same value up to there,
+    #: which is all records() compares.
+    order_length = None
+
+    #: Upgrades of stored records to the current SCHEMA_VERSION, used by
+    #: migrate.py: {old version: function(record) -> the record one version
+    #: up}. Register one whenever SCHEMA_VERSION is bumped; module-level
+    #: functions, as they run in worker processes.
+    migrations = {}
+
     def __init__(self, source_config):
         self.config = source_config
         self.collection = source_config["collection"]
+        #: Saved read positions (app.state.FileCursors) when the source runs in
+        #: tail mode; set by the pipeline, None means every pass reads whole files.
+        self.cursors = None
+        #: Process pool shared by all sources when ``parallel_workers`` > 1;
+        #: set by the pipeline, None parses in this process.
+        self.executor = None
+        #: app.profiling.StageProfile of the current pass under ``--profile``;
+        #: set by the pipeline, None (the normal case) times nothing.
+        self.profile = None
 
-    @abstractmethod
-    def parse(self):
-        """Read the raw input and return a list of raw row dicts."""
+    def load_state(self, state_directory, fingerprint, discard=False):
+        """Load state of the source's own that must outlive a pass (see
+        commit). Called by the pipeline with the farm's state folder and the
+        vault fingerprint; ``discard`` is ``--rebuild-state``. Most sources
+        keep none."""
+
+    def commit(self, full_pass=True):
+        """Everything records() yielded this pass is stored (or queued in the
+        outbox): make what the pass advanced permanent -- the tail cursors,
+        and whatever a subclass keeps. ``full_pass`` is False for a pass over
+        some files only (watch mode)."""
+        if self.cursors is not None:
+            self.cursors.commit(full_pass)
+
+    def files(self):
+        """The export files to read, in a stable order: matching members of the
+        archives in ``data_directory`` (see archives.py; they usually hold the
+        older months), then the matching plain files, sorted."""
+        directory = Path(self.config["data_directory"])
+        pattern = self.config.get("file_pattern", self.default_file_pattern)
+        members = []
+        for archive in sorted(path for path in directory.glob("*") if archive_kind(path)):
+            members.extend(archive_members(archive, pattern))
+        plain = sorted(path for path in directory.glob(pattern) if not archive_kind(path))
+        return members + plain
+
+    def parse(self, files=None):
+        """Read the raw input and yield raw row dicts, one at a time.
+        ``files`` limits the pass to those export files (watch mode: the ones
+        that changed); default all of ``files()``."""
+        if files is None:
+            files = self.files()
+        cursors = [self._cursor_for(file_path) for file_path in files]
+        yield from self._parse(files, cursors)
+
+    def _cursor_for(self, file_path):
+        return self.cursors.cursor_for(file_path) if self.cursors is not None else None
+
+    def _parse(self, files, cursors):
+        cursor_of = dict(zip(files, cursors))
+        for file_path in readable_in_order(files):
+            rows = self.parse_file(file_path, cursor_of[file_path])
+            if self.profile is not None:
+                rows = self.profile.timed(rows, "parse_file")
+            yield from rows
+
+    def parse_file(self, file_path, cursor=None):
+        """Yield raw row dicts from one export file; ``cursor`` is passed on to
+        ``read_delimited_rows`` (with ``self.profile``) so tail mode reads only
+        what was appended."""
         raise NotImplementedError
 
     @abstractmethod
@@ -113,14 +336,90 @@ class DataSource(ABC):
         """
         return f"{self.collection}/records/{record['id']}"
 
-    def records(self):
-        """Parse + transform everything, deduplicated by record id."""
-        unique = {}
-        for raw in self.parse():
+    def _transform_rows(self, rows):
+        for raw in rows:
             try:
                 record = self.transform(raw)
             except (KeyError, ValueError):
                 continue
             if record:
-                unique[record["id"]] = record
-        return list(unique.values())
+                yield record
+
+    def _transformed(self, files=None):
+        if self.executor is None:
+            yield from self._transform_rows(self.parse(files))
+            return
+        # Parallel: one task per file (or per tar.gz), results consumed in
+        # file order (map preserves it), so records() sees exactly the serial
+        # sequence and its dedup keeps the same record.
+        if files is None:
+            files = self.files()
+        runs = groups(files)
+        cursor_runs = [[self._cursor_for(file_path) for file_path in run] for run in runs]
+        results = self.executor.map(
+            _transform_files, repeat(type(self)), repeat(self.config), runs, cursor_runs
+        )
+        for cursors, (records, advanced) in zip(cursor_runs, results):
+            for cursor, advanced_cursor in zip(cursors, advanced):
+                if cursor is not None:
+                    cursor.clear()
+                    cursor.update(advanced_cursor)
+            yield from records
+
+    def records(self, files=None):
+        """Parse + transform everything (or just ``files``) as a stream,
+        deduplicated by record id.
+
+        Duplicates come from export files that overlap in time, so they sit
+        close together in the stream: a bounded window of recent ids catches
+        them without holding every id of the history in memory.
+
+        The first version of a repeated id is the one kept. The dict of the
+        whole history this replaced kept the last one; that would mean
+        holding every record back until its window has passed -- no upload
+        before ``dedup_window`` records are parsed, and that many full
+        records in memory -- for a difference that only matters when a
+        re-export changes a row under the same id (the sync state keeps the
+        first version stored anyway).
+
+        Ids that leave the window go into an IdIndex (8 bytes per id rather
+        than a string in a set) when the source declares ``order_field``. The
+        exports are time-ordered, so a record newer than everything that ever
+        left the window can't be an old duplicate, and only the rare record
+        that isn't -- a re-sent older export -- is looked up there. Without
+        ``order_field`` such duplicates get through here and are caught by the
+        pipeline's sync state (or simply overwrite themselves in the local
+        vault).
+        """
+        recent = deque()
+        seen = set()
+        evicted = IdIndex()
+        evicted_until = None  # newest order_field value that left the window
+        order_field = self.order_field
+        records = self._transformed(files)
+        if self.profile is not None:
+            records = self.profile.timed(records, "transform")
+        for record in records:
+            record_id = record["id"]
+            if record_id in seen:
+                continue
+            order = record.get(order_field) if order_field else None
+            if order is not None and self.order_length:
+                order = order[: self.order_length]
+            if (
+                evicted_until is not None
+                and order is not None
+                and order <= evicted_until
+                and record_id in evicted
+            ):
+                continue
+            seen.add(record_id)
+            recent.append((record_id, order))
+            if len(recent) > self.dedup_window:
+                old_id, old_order = recent.popleft()
+                seen.discard(old_id)
+                if old_order is not None:
+                    evicted.update((old_id,))  # skips the lookup add() makes
+                    if evicted_until is None or old_order > evicted_until:
+                        evicted_until = old_order
+            yield record
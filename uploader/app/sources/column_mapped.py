@@ -0,0 +1,310 @@
+"""Export files described by a column mapping instead of parsing code.
+
+Most robot and CRV exports are the same shape: a delimited file with one record
+per row, some columns to convert (a number with a decimal comma, a ``d-m-yyyy``
+date, a ``Ja``/``Nee``), an id made of some of the fields. A
+``ColumnMappedSource`` is declared by its ``fields`` -- per record field the
+column(s) it comes from and its type -- plus the id format (the ``format`` of
+``id`` in record_schema), either on a subclass or in the source's settings
+(``"type": "column_mapped"``), so a new export of that shape needs no code.
+
+The mapping is compiled once per source into a converter function specialized
+for it, with the column indexes and conversions written out, so a row goes
+from the csv reader's list straight into its record: no raw-row dict in
+between, and no per-row lookups in the mapping.
+"""
+
+import re
+import string
+from datetime import datetime
+
+from app.sources.base import DataSource, parse_int, parse_number, read_delimited_rows
+from app.sources.timestamps import iso_date, iso_timestamp
+
+# A date that is not inside the file but part of its name (e.g.
+# "Productie-rapport_5-7-2026.csv" or "..._2026-07-05.csv"): ``file_date``.
+DATE_IN_NAME = (
+    (re.compile(r"(\d{4}-\d{2}-\d{2})"), "%Y-%m-%d"),
+    (re.compile(r"(\d{1,2}-\d{1,2}-\d{4})"), "%d-%m-%Y"),
+)
+
+# Field type -> its JSON type in record_schema.
+FIELD_TYPES = {
+    "text": "string",
+    "integer": "integer",
+    "number": "number",
+    "yes_no": "boolean",
+    "date": "string",
+    "timestamp": "string",
+    "file_date": "string",
+}
+
+# Where strftime directives sit in an ISO timestamp (``date``, ``timestamp``
+# and ``file_date`` values are ISO text), for ``{field:%Y-%m-%d}`` in an id.
+_ISO_TEMPLATE = "0000-00-00T00:00:00"
+_ISO_POSITIONS = {"%Y": (0, 4), "%m": (5, 7), "%d": (8, 10), "%H": (11, 13), "%M": (14, 16), "%S": (17, 19)}
+_SPEC_TOKEN = re.compile(r"%[YmdHMS]|[^%]+")
+
+_YES_NO = {"ja": True, "nee": False}
+
+
+def date_from_name(stem):
+    """ISO date found in a file name (stem), or None."""
+    for regex, date_format in DATE_IN_NAME:
+        match = regex.search(stem)
+        if match:
+            return datetime.strptime(match.group(1), date_format).date().isoformat()
+    return None
+
+
+def _column(spec, key, name):
+    column = spec.get(key)
+    if not isinstance(column, int) or isinstance(column, bool) or column < 0:
+        raise ValueError(f"Field '{name}': '{key}' must be a column position (0 = first column)")
+    return column
+
+
+def _value_expression(name, spec):
+    """Python expression converting ``row`` into the field's value, plus the
+    statements checking it (``{value}`` standing for the variable)."""
+    field_type = spec.get("type")
+    if field_type not in FIELD_TYPES:
+        known = ", ".join(FIELD_TYPES)
+        raise ValueError(f"Field '{name}': unknown type {field_type!r} (known: {known})")
+    if field_type == "file_date":
+        return "file_value", []
+    column = _column(spec, "column", name)
+    if field_type == "text":
+        return f"row[{column}].strip()", []
+    if field_type == "integer":
+        digits = spec.get("digits")
+        if digits is None:
+            return f"parse_int(row[{column}])", []
+        # A required whole number of exactly ``digits`` digits (animal numbers).
+        check = [
+            f"if len(str({{value}})) != {int(digits)}:",
+            f"    raise ValueError({name + ' is not ' + str(int(digits)) + ' digits'!r})",
+        ]
+        return f"int(row[{column}])", check
+    if field_type == "number":
+        return f"parse_number(row[{column}])", []
+    if field_type == "yes_no":
+        return f"_YES_NO.get(row[{column}].strip().lower())", []
+    if field_type == "date":
+        return f"iso_date(row[{column}].strip())", []
+    time_column = _column(spec, "time_column", name)
+    seconds_required = bool(spec.get("seconds_required", True))
+    return f"iso_timestamp(row[{column}].strip(), row[{time_column}].strip(), {seconds_required})", []
+
+
+def _id_expression(id_format, variables, fields):
+    """Python expression building the id from the converted fields.
+
+    ``{field}`` is the value as text; ``{field:%Y-%m-%dT%H-%M}`` picks parts
+    of an ISO date/timestamp by position -- slices of the ISO text, merged
+    where the format keeps the ISO separators, instead of a strftime.
+    """
+    # ("text", literal) | ("slice", variable, start, end) | ("value" or
+    # "text_value", variable): a value to turn into text, or already text.
+    pieces = []
+    for literal, name, spec, _ in string.Formatter().parse(id_format):
+        if literal:
+            pieces.append(("text", literal))
+        if name is None:
+            continue
+        if name not in variables:
+            raise ValueError(f"id format {id_format!r}: '{name}' is not a field")
+        if not spec:
+            text = FIELD_TYPES[fields[name]["type"]] == "string"
+            pieces.append(("text_value" if text else "value", variables[name]))
+            continue
+        if fields[name]["type"] not in ("date", "timestamp", "file_date"):
+            raise ValueError(f"id format {id_format!r}: '{name}' is no date, it takes no format")
+        tokens = _SPEC_TOKEN.findall(spec)
+        if "".join(tokens) != spec:
+            raise ValueError(f"id format {id_format!r}: unsupported format {spec!r}")
+        for token in tokens:
+            if token in _ISO_POSITIONS:
+                pieces.append(("slice", variables[name], *_ISO_POSITIONS[token]))
+            else:
+                pieces.append(("text", token))
+
+    merged = []
+    for piece in pieces:
+        if merged and piece[0] == "slice":
+            last = merged[-1]
+            # "%Y-%m": the "-" between them is the ISO text's own, so one slice.
+            if last[0] == "slice" and last[1] == piece[1] and last[3] == piece[2]:
+                merged[-1] = ("slice", piece[1], last[2], piece[3])
+                continue
+            if (
+                last[0] == "text"
+                and len(merged) > 1
+                and merged[-2][0] == "slice"
+                and merged[-2][1] == piece[1]
+                and _ISO_TEMPLATE[merged[-2][3]:piece[2]] == last[1]
+            ):
+                merged[-2:] = [("slice", piece[1], merged[-2][2], piece[3])]
+                continue
+        if merged and piece[0] == "text" and merged[-1][0] == "text":
+            merged[-1] = ("text", merged[-1][1] + piece[1])
+            continue
+        merged.append(piece)
+
+    parts = []
+    for piece in merged:
+        if piece[0] == "text":
+            parts.append(repr(piece[1]))
+        elif piece[0] == "value":
+            parts.append(f"str({piece[1]})")
+        elif piece[0] == "text_value":
+            parts.append(piece[1])
+        else:
+            parts.append(f"{piece[1]}[{piece[2]}:{piece[3]}]")
+    return " + ".join(parts) or "''"
+
+
+def compile_converter(fields, id_format, schema_version, source_name, label="column_mapped"):
+    """``convert((row, file_value))`` -> record, written out for this mapping.
+
+    Raises ValueError for a mapping that can't work (unknown type, bad column,
+    id naming a missing field); the function itself raises ValueError for a
+    row that doesn't convert, which records() skips.
+    """
+    variables = {name: f"v{index}" for index, name in enumerate(fields)}
+    lines = ["def convert(raw):", "    row, file_value = raw"]
+    for name, spec in fields.items():
+        expression, checks = _value_expression(name, spec)
+        lines.append(f"    {variables[name]} = {expression}")
+        lines.extend(f"    {check.format(value=variables[name])}" for check in checks)
+    lines.append("    return {")
+    lines.append(f"        'schema_version': {int(schema_version)!r},")
+    lines.append(f"        'id': {_id_expression(id_format, variables, fields)},")
+    for name in fields:
+        lines.append(f"        {name!r}: {variables[name]},")
+    lines.append(f"        'source': {str(source_name)!r},")
+    lines.append("    }")
+    namespace = {
+        "parse_int": parse_int,
+        "parse_number": parse_number,
+        "iso_date": iso_date,
+        "iso_timestamp": iso_timestamp,
+        "_YES_NO": _YES_NO,
+    }
+    exec(compile("\n".join(lines), f"<{label} converter>", "exec"), namespace)
+    return namespace["convert"]
+
+
+class ColumnMappedSource(DataSource):
+    """A delimited export whose records are declared, not programmed.
+
+    Subclasses set ``fields`` (and SCHEMA_VERSION, SOURCE, record_schema with
+    the id ``format``); as ``"type": "column_mapped"`` the same comes from the
+    source's settings::
+
+        {"type": "column_mapped", "collection": "mpr_uitslag",
+         "data_directory": "../data", "file_pattern": "MPR*.csv",
+         "source": "crv_mpr", "schema_version": 1,
+         "id_format": "{animal_number}_{sample_date}",
+         "path_pattern": "{collection}/{animal_number}/{id}",
+         "fields": {
+             "animal_number": {"type": "integer", "column": 1, "digits": 4},
+             "sample_date": {"type": "date", "column": 0},
+             "cell_count": {"type": "integer", "column": 5,
+                            "description": "x1000 cells/ml"}}}
+
+    Field types: ``text``, ``integer`` (empty -> null; with ``digits`` it is
+    required and must have exactly that many), ``number`` (decimal comma
+    allowed, empty -> null), ``yes_no`` (Ja/Nee -> true/false, else null),
+    ``date`` (``d-m-yyyy`` -> ISO), ``timestamp`` (date ``column`` + time
+    ``time_column``; ``"seconds_required": false`` accepts ``HH:MM``) and
+    ``file_date`` (the date in the file name; files without one are skipped).
+    Rows with fewer columns than the mapping reads are skipped, like rows that
+    fail to convert (headers, filler rows).
+    """
+
+    type_name = "column_mapped"
+
+    #: {record field: {"type": ..., "column": ..., ...}}, in record order.
+    fields = {}
+
+    SCHEMA_VERSION = 1
+    SOURCE = None
+
+    def __init__(self, source_config):
+        super().__init__(source_config)
+        fields = self.fields
+        id_format = self.record_schema.get("id", {}).get("format")
+        schema_version = self.SCHEMA_VERSION
+        source_name = self.SOURCE
+        if type(self) is ColumnMappedSource:
+            # Declared in the settings.
+            fields = source_config.get("fields") or {}
+            id_format = source_config.get("id_format")
+            schema_version = source_config.get("schema_version", 1)
+            source_name = source_config.get("source", self.collection)
+            self.SCHEMA_VERSION, self.SOURCE = schema_version, source_name
+            self.path_pattern = source_config.get("path_pattern", self.path_pattern)
+            self.record_schema = self._declared_schema(fields, id_format, schema_version, source_name)
+        if not fields or not id_format:
+            raise ValueError(f"Source '{self.collection}': column_mapped needs 'fields' and an id format")
+        # The compiled function *is* transform: one call per row.
+        self.transform = compile_converter(fields, id_format, schema_version, source_name, self.collection)
+        self._min_columns = 1 + max(
+            (
+                max(spec.get("column", -1), spec.get("time_column", -1))
+                for spec in fields.values()
+            ),
+            default=-1,
+        )
+        self._file_dated = any(spec["type"] == "file_date" for spec in fields.values())
+
+    @staticmethod
+    def _declared_schema(fields, id_format, schema_version, source_name):
+        schema = {
+            "schema_version": {
+                "type": "integer",
+                "description": "Bumped when this record's shape changes.",
+                "example": schema_version,
+            },
+            "id": {
+                "type": "string",
+                "description": "Unique within the collection; used for dedup on upload.",
+                "format": id_format,
+            },
+        }
+        for name, spec in fields.items():
+            schema[name] = {
+                "type": FIELD_TYPES.get(spec.get("type"), "string"),
+                "description": spec.get("description", ""),
+            }
+            if "example" in spec:
+                schema[name]["example"] = spec["example"]
+        schema["source"] = {
+            "type": "string",
+            "description": "Constant identifying which DataSource produced this record.",
+            "example": source_name,
+        }
+        return schema
+
+    def parse_file(self, file_path, cursor=None):
+        file_value = None
+        if self._file_dated:
+            file_value = date_from_name(file_path.stem)
+            if not file_value:
+                # A record without its date cannot be stored truthfully.
+                return
+        min_columns = self._min_columns
+        for row in read_delimited_rows(file_path, cursor, self.profile):
+            if len(row) < min_columns:
+                continue
+            yield row, file_value
+
+    def transform(self, raw):
+        # Replaced per instance by the compiled converter (see __init__).
+        raise NotImplementedError
+
+    def record_path(self, record):
+        # A mapped field may itself be called "collection"; in the path the
+        # source's collection wins.
+        return self.path_pattern.format_map({**record, "collection": self.collection})
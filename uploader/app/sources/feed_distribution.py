@@ -1,12 +1,9 @@
 """Feed distribution per milking (robot ``Voerdistributie-rapport*.csv`` export)."""
 
-from datetime import datetime
-from pathlib import Path
+from app.sources.column_mapped import ColumnMappedSource
 
-from app.sources.base import DataSource, parse_number, read_delimited_rows
 
-
-class FeedDistributionSource(DataSource):
+class FeedDistributionSource(ColumnMappedSource):
     """Reads ``Voerdistributie-rapport*.csv`` exports (';'-separated).
 
     Column layout by position: two robot-internal columns that are ignored,
@@ -25,10 +22,26 @@ class FeedDistributionSource(DataSource):
     SCHEMA_VERSION = 1
     SOURCE = "feed_distribution"
     ANIMAL_NUMBER_DIGITS = 4
-    TIME_FORMATS = ("%H:%M:%S", "%H:%M")
+
+    default_file_pattern = "Voerdistributie-rapport*.csv"
 
     path_pattern = "{collection}/{animal_number}/{id}"
 
+    order_field = "timestamp"
+    # The id is to the minute; a re-export may carry other seconds (or none).
+    order_length = len("2025-10-16T05:12")
+
+    fields = {
+        "animal_number": {"type": "integer", "column": 4, "digits": ANIMAL_NUMBER_DIGITS},
+        # The export writes the visit time with or without seconds.
+        "timestamp": {"type": "timestamp", "column": 2, "time_column": 3, "seconds_required": False},
+        "all_feed_consumed": {"type": "yes_no", "column": 5},
+        "feed_a_raw": {"type": "number", "column": 6},
+        "feed_b_raw": {"type": "number", "column": 7},
+        "feed_c_raw": {"type": "number", "column": 8},
+        "feed_d_raw": {"type": "number", "column": 9},
+    }
+
     record_schema = {
         "schema_version": {
             "type": "integer",
@@ -93,56 +106,3 @@ class FeedDistributionSource(DataSource):
             "example": SOURCE,
         },
     }
-
-    def parse(self):
-        directory = Path(self.config["data_directory"])
-        pattern = self.config.get("file_pattern", "Voerdistributie-rapport*.csv")
-        rows = []
-        for file_path in sorted(directory.glob(pattern)):
-            for row in read_delimited_rows(file_path):
-                if len(row) < 10:
-                    continue
-                rows.append(
-                    {
-                        "date": row[2].strip(),
-                        "time": row[3].strip(),
-                        "cow_id": row[4].strip(),
-                        "all_consumed": row[5].strip(),
-                        "feed_a": row[6].strip(),
-                        "feed_b": row[7].strip(),
-                        "feed_c": row[8].strip(),
-                        "feed_d": row[9].strip(),
-                    }
-                )
-        return rows
-
-    def _parse_timestamp(self, date_text, time_text):
-        for time_format in self.TIME_FORMATS:
-            try:
-                return datetime.strptime(f"{date_text} {time_text}", f"%d-%m-%Y {time_format}")
-            except ValueError:
-                continue
-        raise ValueError(f"unparseable visit time: {date_text} {time_text}")
-
-    def transform(self, raw):
-        timestamp = self._parse_timestamp(raw["date"], raw["time"])
-        animal_number = int(raw["cow_id"])
-        if len(str(animal_number)) != self.ANIMAL_NUMBER_DIGITS:
-            raise ValueError(
-                f"cow id {animal_number} is not {self.ANIMAL_NUMBER_DIGITS} digits"
-            )
-        return {
-            "schema_version": self.SCHEMA_VERSION,
-            "id": f"{animal_number}_{timestamp.strftime('%Y-%m-%dT%H-%M')}",
-            "animal_number": animal_number,
-            "timestamp": timestamp.isoformat(),
-            "all_feed_consumed": {"ja": True, "nee": False}.get(raw["all_consumed"].lower()),
-            "feed_a_raw": parse_number(raw["feed_a"]),
-            "feed_b_raw": parse_number(raw["feed_b"]),
-            "feed_c_raw": parse_number(raw["feed_c"]),
-            "feed_d_raw": parse_number(raw["feed_d"]),
-            "source": self.SOURCE,
-        }
-
-    def record_path(self, record):
-        return f"{self.collection}/{record['animal_number']}/{record['id']}"
@@ -0,0 +1,225 @@
+"""Per cow, per day totals of the milking robot control files."""
+
+import logging
+from datetime import date, datetime, timedelta
+
+from app.sources.milking_robot import MilkingRobotSource
+from app.state import OpenDays
+
+logger = logging.getLogger("uploader")
+
+# Closed days whose milking times are kept to recognise a late milking.
+LATE_CHECK_DAYS = 7
+
+
+class MilkingDailyAggregateSource(MilkingRobotSource):
+    """One record per cow per day: yield, visits and failed visits, summed
+    from the same FULLSENSE exports ``milking_robot`` reads.
+
+    Every reader (dashboard, agent, chatbot) starts by summing the raw
+    milkings per cow per day; with ~3 milkings a day this collection answers
+    those questions from a third of the records. It is written alongside
+    ``milking_controle_data``, never instead of it: raw values stay the
+    source of truth, and the yield stays raw here too (``yield_raw_total``).
+
+    The eVault can't overwrite a record, so a day's aggregate is only written
+    once the day is complete: at the end of a pass, every day that ended
+    ``close_margin_hours`` (source setting, default 6) before the newest
+    milking read so far is closed. Not earlier in the pass -- the exports
+    need not be in time order (an export sorted by cow, archive members read
+    before plain files), so a later day showing up says nothing about the
+    rows still to come. Until then a day's running totals live in
+    ``state/<collection>.days.json`` (app.state.OpenDays) and grow with every
+    pass, watch and tail mode included; a milking read twice is counted once.
+
+    A milking that turns up only after its day was closed (a late re-export
+    with new rows) can't be added to it. Within the last LATE_CHECK_DAYS
+    closed days such milkings are counted and logged; older closed days are
+    read again by every full pass, so their rows are skipped silently.
+    """
+
+    type_name = "milking_daily_aggregates"
+
+    SCHEMA_VERSION = 1
+    SOURCE = "milking_robot_daily"
+
+    order_field = "date"
+
+    record_schema = {
+        "schema_version": {
+            "type": "integer",
+            "description": "Bumped when this record's shape changes.",
+            "example": SCHEMA_VERSION,
+        },
+        "id": {
+            "type": "string",
+            "description": "Unique within the collection; used for dedup on upload.",
+            "format": "{animal_number}_{date:%Y-%m-%d}",
+            "example": "5256_2025-10-16",
+        },
+        "animal_number": {
+            "type": "integer",
+            "description": "4-digit animal tag number, as in milking_controle_data.",
+            "example": 5256,
+        },
+        "registration_number": {
+            "type": "string",
+            "description": "Official registration number, from the day's last milking.",
+            "example": "NL 660752569",
+        },
+        "date": {
+            "type": "string",
+            "description": (
+                "The day (ISO date, farm-local). Only complete days are written: "
+                "a day appears once the exports contain a milking a few hours "
+                "(close_margin_hours) into a later day."
+            ),
+            "example": "2025-10-16",
+        },
+        "visits": {
+            "type": "integer",
+            "description": "Milkings of the cow that day, any status.",
+            "example": 3,
+        },
+        "failed_visits": {
+            "type": "integer",
+            "description": "Of those, milkings with status '!' (not fully completed).",
+            "example": 0,
+        },
+        "unknown_status_visits": {
+            "type": "integer",
+            "description": "Of those, milkings with status '#' (unknown or other status).",
+            "example": 0,
+        },
+        "yield_raw_total": {
+            "type": "number",
+            "description": (
+                "Sum of yield_raw over all the day's milkings -- NOT liters, same "
+                "unit as milking_controle_data.yield_raw (liters = "
+                "yield_raw_total / yield_divisor)."
+            ),
+            "example": 38650,
+        },
+        "first_milking": {
+            "type": "string",
+            "description": "Timestamp of the day's first milking (ISO 8601, farm-local).",
+            "example": "2025-10-16T05:12:40",
+        },
+        "last_milking": {
+            "type": "string",
+            "description": "Timestamp of the day's last milking (ISO 8601, farm-local).",
+            "example": "2025-10-16T21:03:02",
+        },
+        "source": {
+            "type": "string",
+            "description": "Constant identifying which DataSource produced this record.",
+            "example": SOURCE,
+        },
+    }
+
+    def __init__(self, source_config):
+        super().__init__(source_config)
+        #: app.state.OpenDays once the pipeline has called load_state; without
+        #: it (a one-off run_once) open days are forgotten after the pass.
+        self.open_days = None
+
+    def load_state(self, state_directory, fingerprint, discard=False):
+        path = state_directory / f"{self.collection}.days.json"
+        if discard:
+            path.unlink(missing_ok=True)
+        self.open_days = OpenDays(path, fingerprint)
+        if not self.open_days.loaded and self.cursors is not None:
+            # Running totals lost but read positions kept: a tail pass would
+            # only see the end of the open days. Read the files whole once.
+            self.cursors.files = {}
+
+    def commit(self, full_pass=True):
+        super().commit(full_pass)
+        if self.open_days is not None:
+            self.open_days.commit()
+
+    def _transformed(self, files=None):
+        # The milking records of the pass, folded into the open days; once
+        # the pass is read, the days behind the watermark are closed (their
+        # aggregates yielded).
+        if self.open_days is not None:
+            working = self.open_days.checkout()
+        else:
+            working = {"closed_through": None, "days": {}, "closed": {}}
+        days = working["days"]
+        closed = working["closed"]
+        newest = max(
+            (f"{day}T{max(totals['times'])}" for day, animals in days.items() for totals in animals.values()),
+            default=None,
+        )
+        late = 0
+        for milking in super()._transformed(files):
+            timestamp = milking["timestamp"]
+            day = timestamp[:10]
+            animal = str(milking["animal_number"])
+            time_of_day = timestamp[11:]
+            if working["closed_through"] is not None and day <= working["closed_through"]:
+                if day in closed and time_of_day not in closed[day].get(animal, ()):
+                    late += 1
+                continue
+            if newest is None or timestamp > newest:
+                newest = timestamp
+            totals = days.setdefault(day, {}).setdefault(
+                animal,
+                {"times": [], "registration_number": None, "failed": 0, "unknown": 0, "yield_raw": 0},
+            )
+            if time_of_day in totals["times"]:
+                continue
+            totals["times"].append(time_of_day)
+            totals["registration_number"] = milking["registration_number"]
+            if milking["status"] == "!":
+                totals["failed"] += 1
+            elif milking["status"] == "#":
+                totals["unknown"] += 1
+            totals["yield_raw"] += milking["yield_raw"]
+        if late:
+            logger.warning(
+                "Collection '%s': %d milkings of days already stored were not added "
+                "to their daily aggregates (late export rows)",
+                self.collection,
+                late,
+            )
+        if newest is None:
+            return
+        margin = timedelta(hours=self.config.get("close_margin_hours", 6))
+        # Days before this one have ended at least ``margin`` before the newest milking.
+        watermark = (datetime.fromisoformat(newest) - margin).date().isoformat()
+        for closed_day in sorted(open_day for open_day in days if open_day < watermark):
+            animals = days.pop(closed_day)
+            yield from self._aggregates(closed_day, animals)
+            working["closed_through"] = closed_day
+            closed[closed_day] = {animal: totals["times"] for animal, totals in animals.items()}
+        if working["closed_through"] is not None:
+            keep_from = (
+                date.fromisoformat(working["closed_through"]) - timedelta(days=LATE_CHECK_DAYS - 1)
+            ).isoformat()
+            for old_day in [closed_day for closed_day in closed if closed_day < keep_from]:
+                del closed[old_day]
+
+    def _aggregates(self, day, animals):
+        for animal, totals in sorted(animals.items(), key=lambda item: int(item[0])):
+            yield_raw = totals["yield_raw"]
+            if isinstance(yield_raw, float):
+                yield_raw = round(yield_raw, 6)  # no float noise from the summing
+                if yield_raw.is_integer():
+                    yield_raw = int(yield_raw)
+            times = sorted(totals["times"])
+            yield {
+                "schema_version": self.SCHEMA_VERSION,
+                "id": f"{animal}_{day}",
+                "animal_number": int(animal),
+                "registration_number": totals["registration_number"],
+                "date": day,
+                "visits": len(times),
+                "failed_visits": totals["failed"],
+                "unknown_status_visits": totals["unknown"],
+                "yield_raw_total": yield_raw,
+                "first_milking": f"{day}T{times[0]}",
+                "last_milking": f"{day}T{times[-1]}",
+                "source": self.SOURCE,
+            }
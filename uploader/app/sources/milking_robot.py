@@ -1,10 +1,7 @@
 """Milking robot control files (FULLSENSE csv export)."""
 
-import csv
-from datetime import datetime
-from pathlib import Path
-
-from app.sources.base import DataSource
+from app.sources.base import DataSource, read_delimited_rows
+from app.sources.timestamps import iso_timestamp
 
 COLUMNS = (
     "animalNumber",
@@ -36,8 +33,12 @@ class MilkingRobotSource(DataSource):
     KNOWN_STATUSES = ("OK", "!", "#")
     ANIMAL_NUMBER_DIGITS = 4
 
+    default_file_pattern = "*.txt"
+
     path_pattern = "{collection}/{animal_number}/{id}"
 
+    order_field = "timestamp"
+
     record_schema = {
         "schema_version": {
             "type": "integer",
@@ -91,24 +92,16 @@ class MilkingRobotSource(DataSource):
         },
     }
 
-    def parse(self):
-        directory = Path(self.config["data_directory"])
-        pattern = self.config.get("file_pattern", "*.txt")
-        rows = []
-        for file_path in sorted(directory.glob(pattern)):
-            with open(file_path, encoding="utf-8") as handle:
-                for row in csv.reader(handle):
-                    if not row or row[0].strip().startswith("sep="):
-                        continue
-                    if len(row) < len(COLUMNS):
-                        continue
-                    rows.append(dict(zip(COLUMNS, (value.strip() for value in row))))
-        return rows
+    def parse_file(self, file_path, cursor=None):
+        for row in read_delimited_rows(file_path, cursor, self.profile):
+            if not row or row[0].strip().startswith("sep="):
+                continue
+            if len(row) < len(COLUMNS):
+                continue
+            yield dict(zip(COLUMNS, (value.strip() for value in row)))
 
     def transform(self, raw):
-        timestamp = datetime.strptime(
-            f"{raw['milkingDate']} {raw['milkingTime']}", "%d-%m-%Y %H:%M:%S"
-        )
+        timestamp = iso_timestamp(raw["milkingDate"], raw["milkingTime"])
         animal_number = int(raw["animalNumber"])
         if len(str(animal_number)) != self.ANIMAL_NUMBER_DIGITS:
             raise ValueError(
@@ -122,10 +115,10 @@ class MilkingRobotSource(DataSource):
             yield_raw = int(yield_raw)
         return {
             "schema_version": self.SCHEMA_VERSION,
-            "id": f"{animal_number}_{timestamp.strftime('%Y-%m-%dT%H-%M-%S')}",
+            "id": f"{animal_number}_{timestamp.replace(':', '-')}",
             "animal_number": animal_number,
             "registration_number": raw["registrationNumber"],
-            "timestamp": timestamp.isoformat(),
+            "timestamp": timestamp,
             "status": status,
             "yield_raw": yield_raw,
             "source": self.SOURCE,
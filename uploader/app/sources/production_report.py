@@ -1,28 +1,9 @@
 """Daily per-cow production snapshot (robot ``Productie-rapport*.csv`` export)."""
 
-import re
-from datetime import datetime
-from pathlib import Path
+from app.sources.column_mapped import ColumnMappedSource
 
-from app.sources.base import DataSource, parse_int, parse_number, read_delimited_rows
 
-# The report date is not inside the file -- it is part of the file name
-# (e.g. "Productie-rapport_5-7-2026.csv" or "..._2026-07-05.csv").
-DATE_IN_NAME = (
-    (re.compile(r"(\d{4}-\d{2}-\d{2})"), "%Y-%m-%d"),
-    (re.compile(r"(\d{1,2}-\d{1,2}-\d{4})"), "%d-%m-%Y"),
-)
-
-
-def report_date_from_name(stem):
-    for regex, date_format in DATE_IN_NAME:
-        match = regex.search(stem)
-        if match:
-            return datetime.strptime(match.group(1), date_format).date().isoformat()
-    return None
-
-
-class ProductionReportSource(DataSource):
+class ProductionReportSource(ColumnMappedSource):
     """Reads ``Productie-rapport*.csv`` exports (';'-separated, decimal comma).
 
     One row per cow: 24h production, 10-day average, lactation number, average
@@ -45,8 +26,23 @@ class ProductionReportSource(DataSource):
     SOURCE = "milking_robot_production"
     ANIMAL_NUMBER_DIGITS = 4
 
+    default_file_pattern = "Productie-rapport*.csv"
+
     path_pattern = "{collection}/{animal_number}/{id}"
 
+    order_field = "report_date"
+
+    fields = {
+        "animal_number": {"type": "integer", "column": 0, "digits": ANIMAL_NUMBER_DIGITS},
+        # Not inside the file: taken from its name, e.g. "Productie-rapport_5-7-2026.csv".
+        "report_date": {"type": "file_date"},
+        "milk_24h_kg": {"type": "number", "column": 1},
+        "milk_10d_avg_kg": {"type": "number", "column": 2},
+        "lactation_number": {"type": "integer", "column": 3},
+        "average_milking_speed_kg_min": {"type": "number", "column": 4},
+        "lactation_days": {"type": "integer", "column": 5},
+    }
+
     record_schema = {
         "schema_version": {
             "type": "integer",
@@ -114,50 +110,3 @@ class ProductionReportSource(DataSource):
             "example": SOURCE,
         },
     }
-
-    def parse(self):
-        directory = Path(self.config["data_directory"])
-        pattern = self.config.get("file_pattern", "Productie-rapport*.csv")
-        rows = []
-        for file_path in sorted(directory.glob(pattern)):
-            report_date = report_date_from_name(file_path.stem)
-            if not report_date:
-                # A snapshot without its date cannot be stored truthfully.
-                continue
-            for row in read_delimited_rows(file_path):
-                if len(row) < 6:
-                    continue
-                rows.append(
-                    {
-                        "report_date": report_date,
-                        "cow_id": row[0].strip(),
-                        "milk_24h": row[1].strip(),
-                        "milk_10d_avg": row[2].strip(),
-                        "lactation_number": row[3].strip(),
-                        "milking_speed": row[4].strip(),
-                        "lactation_days": row[5].strip(),
-                    }
-                )
-        return rows
-
-    def transform(self, raw):
-        animal_number = int(raw["cow_id"])
-        if len(str(animal_number)) != self.ANIMAL_NUMBER_DIGITS:
-            raise ValueError(
-                f"cow id {animal_number} is not {self.ANIMAL_NUMBER_DIGITS} digits"
-            )
-        return {
-            "schema_version": self.SCHEMA_VERSION,
-            "id": f"{animal_number}_{raw['report_date']}",
-            "animal_number": animal_number,
-            "report_date": raw["report_date"],
-            "milk_24h_kg": parse_number(raw["milk_24h"]),
-            "milk_10d_avg_kg": parse_number(raw["milk_10d_avg"]),
-            "lactation_number": parse_int(raw["lactation_number"]),
-            "average_milking_speed_kg_min": parse_number(raw["milking_speed"]),
-            "lactation_days": parse_int(raw["lactation_days"]),
-            "source": self.SOURCE,
-        }
-
-    def record_path(self, record):
-        return f"{self.collection}/{record['animal_number']}/{record['id']}"
@@ -0,0 +1,75 @@
+"""Fast parsing of the robot's fixed date/time formats, shared by all sources.
+
+Every milking and feeding row carries a ``d-m-yyyy`` date and a ``HH:MM:SS``
+(feed: sometimes ``HH:MM``) time. ``datetime.strptime`` re-interprets its
+format string on every call and is one of the slowest calls in the standard
+library, and the record id and timestamp were then built with ``strftime`` and
+``isoformat`` on top of it.
+
+Neither part needs any of that: an export holds a handful of distinct dates and
+at most 86,400 distinct times, so each distinct text is validated once (with
+the same rules strptime applies) and remembered as its ISO text. A row then
+costs two dict lookups and one string join. ``benchmark_timestamps.py`` in the
+uploader folder checks the results against strptime and measures the gain.
+"""
+
+import re
+from datetime import date
+
+_DATE = re.compile(r"(\d{1,2})-(\d{1,2})-(\d{4})", re.ASCII)
+_CLOCK = re.compile(r"(\d{1,2}):(\d{1,2})(?::(\d{1,2}))?", re.ASCII)
+
+# Bound on each memo; only reachable by an export full of distinct garbage.
+MEMO_LIMIT = 100_000
+
+_dates = {}
+_clocks = {}
+
+
+def _remember(memo, key, value):
+    if len(memo) >= MEMO_LIMIT:
+        memo.clear()
+    memo[key] = value
+
+
+def iso_date(text):
+    """``"5-7-2026"`` -> ``"2026-07-05"``; ValueError where strptime's
+    ``%d-%m-%Y`` would fail (including impossible dates such as 31-2)."""
+    iso = _dates.get(text)
+    if iso is None:
+        match = _DATE.fullmatch(text)
+        if not match:
+            raise ValueError(f"unparseable date: {text!r}")
+        day, month, year = (int(part) for part in match.groups())
+        iso = date(year, month, day).isoformat()
+        _remember(_dates, text, iso)
+    return iso
+
+
+def _clock(text):
+    entry = _clocks.get(text)
+    if entry is None:
+        match = _CLOCK.fullmatch(text)
+        if not match:
+            raise ValueError(f"unparseable time: {text!r}")
+        hour, minute = int(match.group(1)), int(match.group(2))
+        second = int(match.group(3)) if match.group(3) is not None else None
+        if hour > 23 or minute > 59 or (second or 0) > 59:
+            raise ValueError(f"unparseable time: {text!r}")
+        entry = (f"{hour:02d}:{minute:02d}:{second or 0:02d}", second is not None)
+        _remember(_clocks, text, entry)
+    return entry
+
+
+def iso_timestamp(date_text, time_text, seconds_required=True):
+    """Robot date + time -> ``"2025-10-16T16:45:14"``.
+
+    Identical to ``datetime.strptime(f"{date} {time}", "%d-%m-%Y %H:%M:%S")
+    .isoformat()``. With ``seconds_required=False`` a ``HH:MM`` time is also
+    accepted (seconds become ``00``), like trying ``%H:%M`` as a fallback.
+    Record ids are derived from the result by slicing, not re-formatting.
+    """
+    clock, has_seconds = _clock(time_text)
+    if seconds_required and not has_seconds:
+        raise ValueError(f"time without seconds: {time_text!r}")
+    return f"{iso_date(date_text)}T{clock}"
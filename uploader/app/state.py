@@ -8,42 +8,297 @@ file is missing, unreadable, or belongs to a different vault (fingerprint
 mismatch — e.g. the registry URL or w3id changed).
 
 State is updated after every successfully stored chunk, so an interrupted run
-never re-uploads what already landed.
+never re-uploads what already landed. Rewriting the whole id list per chunk
+would make a large first upload quadratic, so each chunk's ids are appended to
+a journal next to the snapshot instead (``<collection>.journal``, one JSON
+list per line, fsync'd) and folded into the snapshot by ``compact`` -- after a
+run, and whenever the journal grows large. Loading replays snapshot + journal.
+
+The ids themselves are held in an IdIndex (``app/id_index.py``): 8 bytes per
+id instead of a Python string in a set, and a snapshot that loads as one
+binary blob.
 """
 
 import json
+import os
 from pathlib import Path
 
+from app.id_index import IdIndex
+
 
 class SyncState:
 
+    #: Fold the journal into the snapshot once it holds this many ids.
+    COMPACT_AFTER_IDS = 100_000
+
     def __init__(self, file_path, fingerprint):
         self.path = Path(file_path)
+        self.journal_path = self.path.with_suffix(".journal")
         self.fingerprint = fingerprint
-        #: set of known-uploaded ids, or None when the state must be rebuilt
-        #: from the vault first.
+        #: IdIndex of known-uploaded ids (set-like), or None when the state
+        #: must be rebuilt from the vault first.
         self.known = None
+        self._journaled = 0
         if self.path.exists():
             try:
                 data = json.loads(self.path.read_text(encoding="utf-8"))
             except (json.JSONDecodeError, OSError):
                 return
             if data.get("fingerprint") == fingerprint:
-                self.known = set(data.get("ids", []))
+                self.known = IdIndex.from_json(data)
+                self._replay_journal()
+
+    def _replay_journal(self):
+        if not self.journal_path.exists():
+            return
+        torn = False
+        with open(self.journal_path, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    ids = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line torn by a crash mid-write: its chunk may be
+                    # uploaded once more, nothing worse.
+                    torn = True
+                    continue
+                self.known.update(ids)
+                self._journaled += len(ids)
+        if torn:
+            # Start a clean journal rather than appending after the torn line.
+            self._write_snapshot()
 
     def replace(self, ids):
-        self.known = set(ids)
-        self._save()
+        self.known = IdIndex(ids)
+        self._write_snapshot()
 
     def add(self, ids):
+        ids = list(ids)
         if self.known is None:
-            self.known = set()
+            self.known = IdIndex()
+            self._write_snapshot()  # the journal only means something on top of one
         self.known.update(ids)
-        self._save()
+        with open(self.journal_path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(ids) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())  # the chunk is in the vault; don't lose that fact
+        self._journaled += len(ids)
+        if self._journaled >= self.COMPACT_AFTER_IDS:
+            self._write_snapshot()
+
+    def compact(self):
+        """Fold the journal into the snapshot (no-op when it is empty)."""
+        if self._journaled and self.known is not None:
+            self._write_snapshot()
 
-    def _save(self):
+    def _write_snapshot(self):
         self.path.parent.mkdir(parents=True, exist_ok=True)
-        payload = {"fingerprint": self.fingerprint, "ids": sorted(self.known)}
+        payload = {"fingerprint": self.fingerprint, **self.known.to_json()}
         temp_path = self.path.with_suffix(".json.tmp")
         temp_path.write_text(json.dumps(payload), encoding="utf-8")
         temp_path.replace(self.path)  # atomic: never leaves a half-written file
+        # Only now is the journal redundant; a crash before this line just
+        # replays ids the snapshot already holds.
+        self.journal_path.unlink(missing_ok=True)
+        self._journaled = 0
+
+
+class RebuildCheckpoint:
+    """Progress of a sync-state rebuild, so a cancelled one resumes.
+
+    Rebuilding means paging through the whole collection on the real eVault,
+    which can take many minutes on a farm PC. Every few pages the ids read so
+    far and the cursor to continue from are saved here; the next run picks up
+    at that cursor. Resuming is safe because nothing is uploaded to the
+    collection until its rebuild has finished.
+
+    The checkpoint is only valid while nothing has been written to the
+    collection: the eVault orders envelopes by a content-derived UUID, so a
+    record stored meanwhile can land before the saved cursor and would be
+    skipped (see MetaStateEVaultClient.count). ``--rebuild-state`` therefore
+    discards it along with the sync state.
+    """
+
+    def __init__(self, file_path, fingerprint):
+        self.path = Path(file_path)
+        self.fingerprint = fingerprint
+
+    def load(self):
+        """(cursor to resume after, IdIndex read so far); (None, empty) to start over."""
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+            except (json.JSONDecodeError, OSError):
+                data = {}
+            if data.get("fingerprint") == self.fingerprint and data.get("after"):
+                return data["after"], IdIndex.from_json(data)
+        return None, IdIndex()
+
+    def save(self, after, ids):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"fingerprint": self.fingerprint, "after": after, **ids.to_json()}
+        temp_path = self.path.with_suffix(".json.tmp")
+        temp_path.write_text(json.dumps(payload), encoding="utf-8")
+        temp_path.replace(self.path)
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+
+class MigrationCheckpoint:
+    """Progress of a schema migration (migrate.py), so a cancelled one resumes.
+
+    Holds the cursor of the last source page whose records are all stored in
+    the target, and the running counts for the report. Skipping the pages
+    before it is only a shortcut: the target's own SyncState already keeps a
+    record from being stored twice.
+    """
+
+    def __init__(self, file_path, fingerprint, collection):
+        self.path = Path(file_path)
+        self.fingerprint = fingerprint
+        self.collection = collection
+
+    def load(self):
+        """(cursor to resume after, counts so far); (None, {}) to start over."""
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+            except (json.JSONDecodeError, OSError):
+                data = {}
+            if (
+                data.get("fingerprint") == self.fingerprint
+                and data.get("collection") == self.collection
+                and data.get("after")
+            ):
+                return data["after"], data.get("counts", {})
+        return None, {}
+
+    def save(self, after, counts):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "fingerprint": self.fingerprint,
+            "collection": self.collection,
+            "after": after,
+            "counts": counts,
+        }
+        temp_path = self.path.with_suffix(".json.tmp")
+        temp_path.write_text(json.dumps(payload), encoding="utf-8")
+        temp_path.replace(self.path)
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+
+class FileCursors:
+    """Tail mode: per export file, where the previous pass stopped reading.
+
+    Handed out as working copies (``cursor_for``) that the source advances
+    while parsing; they only become the saved positions on ``commit``, which
+    the pipeline calls once the records read from them are safely stored. A
+    failed upload therefore re-reads the same bytes next pass instead of
+    skipping them. Tied to the vault fingerprint like SyncState: positions
+    recorded for one vault mean nothing for another.
+    """
+
+    def __init__(self, file_path, fingerprint):
+        self.path = Path(file_path)
+        self.fingerprint = fingerprint
+        self.files = {}
+        self._pending = {}
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+            except (json.JSONDecodeError, OSError):
+                return
+            if data.get("fingerprint") == fingerprint:
+                self.files = data.get("files", {})
+
+    def cursor_for(self, file_path):
+        key = str(file_path)
+        cursor = dict(self.files.get(key, {}))
+        self._pending[key] = cursor
+        return cursor
+
+    def commit(self, full_pass=True):
+        if full_pass:
+            # Only files seen in this pass are kept, so deleted exports drop out.
+            self.files, self._pending = self._pending, {}
+        else:
+            # A pass over some files (watch mode) leaves the others' positions.
+            self.files.update(self._pending)
+            self._pending = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"fingerprint": self.fingerprint, "files": self.files}
+        temp_path = self.path.with_suffix(".json.tmp")
+        temp_path.write_text(json.dumps(payload), encoding="utf-8")
+        temp_path.replace(self.path)
+
+
+class OpenDays:
+    """Daily aggregate sources: per cow, the running totals of the days that
+    aren't complete yet, and the last day that is.
+
+    A complete ("closed") day's aggregate is stored once and never again --
+    the eVault can't overwrite a record -- so only days after
+    ``closed_through`` are still being added to. Each open cow-day keeps the
+    times of the milkings counted in it, so a milking read twice (overlapping
+    exports, a full pass after a watch pass) is counted once.
+
+    The milking times of the last few closed days are kept as well
+    (``closed``), so a milking of such a day that wasn't counted in it -- late,
+    the aggregate is already stored -- can be told from a re-read one.
+
+    Like FileCursors the pipeline works on a copy (``checkout``) that only
+    replaces the saved state on ``commit``, once the aggregates of the days
+    it closed are stored: a failed pass closes them again next time.
+    """
+
+    def __init__(self, file_path, fingerprint):
+        self.path = Path(file_path)
+        self.fingerprint = fingerprint
+        #: False when there was no usable saved state (first run, other vault).
+        self.loaded = False
+        self.closed_through = None
+        #: {ISO date: {animal number (str): totals}}
+        self.days = {}
+        #: {ISO date: {animal number (str): [milking times]}} of recently closed days.
+        self.closed = {}
+        self._working = None
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+            except (json.JSONDecodeError, OSError):
+                return
+            if data.get("fingerprint") == fingerprint:
+                self.closed_through = data.get("closed_through")
+                self.days = data.get("days", {})
+                self.closed = data.get("closed", {})
+                self.loaded = True
+
+    def checkout(self):
+        """A working copy ``{"closed_through", "days", "closed"}`` for one pass."""
+        self._working = {
+            "closed_through": self.closed_through,
+            "days": json.loads(json.dumps(self.days)),
+            "closed": json.loads(json.dumps(self.closed)),
+        }
+        return self._working
+
+    def commit(self):
+        if self._working is None:
+            return
+        self.closed_through = self._working["closed_through"]
+        self.days = self._working["days"]
+        self.closed = self._working["closed"]
+        self._working = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "fingerprint": self.fingerprint,
+            "closed_through": self.closed_through,
+            "days": self.days,
+            "closed": self.closed,
+        }
+        temp_path = self.path.with_suffix(".json.tmp")
+        temp_path.write_text(json.dumps(payload), encoding="utf-8")
+        temp_path.replace(self.path)
+        self.loaded = True
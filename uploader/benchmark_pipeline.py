@@ -0,0 +1,114 @@
+"""Throughput benchmark: the whole pipeline on a generated herd, local vault.
+
+Generates a herd with generate_sample_data.py into a temporary folder, then
+runs two profiled passes of the real pipeline against a fresh local vault:
+
+- ``initial`` -- everything is new and gets stored (a backfill),
+- ``rerun``   -- nothing is new (a normal tick: read, transform, dedup).
+
+and prints records/second and each stage's share per source (see
+app/profiling.py for what the stages are). With ``--output`` the figures are
+also written as JSON, to keep next to earlier runs for regression tracking.
+
+    cd uploader
+    python benchmark_pipeline.py                         # 200 cows, 30 days
+    python benchmark_pipeline.py --cows 2000 --days 60 --output bench.json
+
+Same parameters and seed, same input files -- so two runs are comparable.
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import generate_sample_data
+from app.pipeline import run_once
+from app.sources import create_source
+from core.vault_client import LocalVaultClient
+
+SOURCES = (
+    ("milking_robot", "milking_controle_data"),
+    ("feed_distribution", "feed_distribution_data"),
+    ("production_report", "milking_production_data"),
+)
+
+
+def run_pass(name, data_directory, vault, work_directory):
+    sources = [
+        create_source({"type": type_name, "collection": collection, "data_directory": str(data_directory)})
+        for type_name, collection in SOURCES
+    ]
+    report_path = work_directory / f"{name}.json"
+    run_once(sources, vault, {}, profile_path=report_path)
+    return json.loads(report_path.read_text(encoding="utf-8"))
+
+
+def print_pass(name, report):
+    print(f"\n{name}: {report['wall_seconds']:.2f} s wall")
+    for collection, entry in report["sources"].items():
+        total = entry["total_seconds"] or 1
+        shares = ", ".join(
+            f"{stage} {seconds / total:.0%}" for stage, seconds in entry["seconds"].items() if seconds
+        )
+        print(
+            f"  {collection:<26} {entry['counts']['records']:>9,} records "
+            f"{entry['records_per_second'] or 0:>9,} rec/s   {shares}"
+        )
+
+
+def main():
+    arguments = argparse.ArgumentParser(description="Benchmark the uploader pipeline.")
+    arguments.add_argument("--cows", type=int, default=200)
+    arguments.add_argument("--days", type=int, default=30)
+    arguments.add_argument("--seed", type=int, default=1)
+    arguments.add_argument("--output", type=Path, help="also write the figures to this JSON file")
+    options = arguments.parse_args()
+    logging.getLogger("uploader").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(prefix="melkmonitor-bench-") as temp:
+        work_directory = Path(temp)
+        data_directory = work_directory / "data"
+        print(f"Generating {options.cows} cows x {options.days} days ...")
+        counts, _ = generate_sample_data.generate(
+            generate_sample_data.parse_args(
+                [str(data_directory), "--cows", str(options.cows), "--days", str(options.days),
+                 "--seed", str(options.seed)]
+            )
+        )
+        print(
+            f"      -> {counts['milkings']:,} milkings, {counts['feedings']:,} feedings, "
+            f"{counts['production_rows']:,} production rows"
+        )
+        vault = LocalVaultClient(work_directory / "vault")
+        passes = {name: run_pass(name, data_directory, vault, work_directory) for name in ("initial", "rerun")}
+
+    for name, report in passes.items():
+        print_pass(name, report)
+    if options.output:
+        options.output.write_text(
+            json.dumps(
+                {
+                    "created": datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "parameters": {"cows": options.cows, "days": options.days, "seed": options.seed},
+                    "input": counts,
+                    "passes": passes,
+                },
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+        print(f"\nWritten to {options.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,119 @@
+"""Micro-benchmark: app/sources/timestamps.py against datetime.strptime.
+
+Builds one million robot-style (date, time) pairs, checks that the fast parser
+returns exactly what the strptime path returned before it -- the same ISO
+timestamp, the same record-id stamp, and a ValueError for the same bad inputs --
+and then times both.
+
+    cd uploader
+    python benchmark_timestamps.py            # 1,000,000 rows
+    python benchmark_timestamps.py 200000     # fewer, for a quick check
+
+Exit code 0 = equivalent on every row (the timings are informational).
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app.sources.timestamps import iso_timestamp
+
+DEFAULT_ROWS = 1_000_000
+
+# Inputs strptime rejects; the fast parser must reject every one of them too.
+INVALID = (
+    ("31-02-2026", "10:00:00"),
+    ("0-7-2026", "10:00:00"),
+    ("5-13-2026", "10:00:00"),
+    ("5-7-26", "10:00:00"),
+    ("5/7/2026", "10:00:00"),
+    ("5-7-2026", "24:00:00"),
+    ("5-7-2026", "10:60:00"),
+    ("5-7-2026", "10:00:60"),
+    ("5-7-2026", "10:00:00:00"),
+    ("5-7-2026", "1000"),
+    ("", ""),
+    ("Datum", "Tijd"),
+)
+
+
+def sample_rows(count):
+    """Robot-style pairs over ~3 years: zero-padded (milking export) and
+    unpadded (feed export) dates, times with and without seconds."""
+    generator = random.Random(42)
+    start = datetime(2024, 1, 1)
+    rows = []
+    for _ in range(count):
+        moment = start + timedelta(seconds=generator.randrange(3 * 365 * 86400))
+        if generator.random() < 0.5:
+            date_text = moment.strftime("%d-%m-%Y")
+        else:
+            date_text = f"{moment.day}-{moment.month}-{moment.year}"
+        time_text = moment.strftime("%H:%M:%S" if generator.random() < 0.8 else "%H:%M")
+        rows.append((date_text, time_text))
+    return rows
+
+
+def strptime_stamp(date_text, time_text):
+    """The feed source's previous code path: seconds optional."""
+    for time_format in ("%H:%M:%S", "%H:%M"):
+        try:
+            timestamp = datetime.strptime(f"{date_text} {time_text}", f"%d-%m-%Y {time_format}")
+        except ValueError:
+            continue
+        return timestamp.isoformat(), timestamp.strftime("%Y-%m-%dT%H-%M-%S")
+    raise ValueError(f"unparseable: {date_text} {time_text}")
+
+
+def fast_stamp(date_text, time_text):
+    timestamp = iso_timestamp(date_text, time_text, seconds_required=False)
+    return timestamp, timestamp.replace(":", "-")
+
+
+def outcome(parse, date_text, time_text):
+    try:
+        return parse(date_text, time_text)
+    except ValueError:
+        return ValueError
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    print(f"Generating {count:,} rows ...")
+    rows = sample_rows(count)
+
+    print("Checking equivalence ...")
+    mismatches = [
+        row for row in (*rows, *INVALID)
+        if outcome(strptime_stamp, *row) != outcome(fast_stamp, *row)
+    ]
+    # Milkings require seconds: "HH:MM" must fail there, as "%H:%M:%S" did.
+    for date_text, time_text in rows[:1000]:
+        expected = outcome(
+            lambda d, t: datetime.strptime(f"{d} {t}", "%d-%m-%Y %H:%M:%S").isoformat(),
+            date_text,
+            time_text,
+        )
+        if outcome(iso_timestamp, date_text, time_text) != expected:
+            mismatches.append((date_text, time_text))
+    if mismatches:
+        print(f"MISMATCH on {len(mismatches)} rows, e.g. {mismatches[:5]}")
+        return 1
+    print(f"      -> identical on all {count + len(INVALID):,} inputs")
+
+    timings = {}
+    for name, parse in (("strptime", strptime_stamp), ("fast", fast_stamp)):
+        started = time.perf_counter()
+        for date_text, time_text in rows:
+            parse(date_text, time_text)
+        timings[name] = time.perf_counter() - started
+        print(f"{name:>9}: {timings[name]:.2f} s  ({count / timings[name]:,.0f} rows/s)")
+    print(f"  speedup: {timings['strptime'] / timings['fast']:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
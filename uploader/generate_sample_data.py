@@ -0,0 +1,284 @@
+"""Synthetic herd: robot exports in all three formats the uploader reads.
+
+The real exports in ``data/`` are private, but benchmarks and load tests need
+realistic input at any herd size. This writes, for a simulated herd, exactly
+what the robot writes:
+
+- FULLSENSE milking files ``robot_<date>.txt`` (``sep=,``, one row per visit,
+  read by MilkingRobotSource),
+- ``Voerdistributie-rapport <n>.csv`` (``sep=;``, header, empty filler rows,
+  the robot's emoji box column, visit times with and without seconds, decimal
+  commas; read by FeedDistributionSource),
+- one ``Productie-rapport_<d-m-yyyy>.csv`` per day (``sep=,``, quoted decimal
+  commas; read by ProductionReportSource).
+
+Every cow follows a lactation curve and visits the robot at irregular
+intervals; the feeding of a visit carries the same timestamp as its milking,
+as the robot does. A fraction of the cows gets an anomaly in the last days --
+a yield drop, feed refusals or a milking-speed drop -- which is listed in
+``anomalies.json`` next to the exports, so the agent's findings can be checked
+against what was injected. The same seed always produces the same files.
+
+    cd uploader
+    python generate_sample_data.py ../sample_data                      # 100 cows, 30 days
+    python generate_sample_data.py /tmp/herd --cows 5000 --days 365    # load test
+
+Point a source's ``data_directory`` in settings.json at the output folder to use it.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+from collections import deque
+from datetime import date, timedelta
+from pathlib import Path
+
+FIRST_ANIMAL_NUMBER = 1000
+MAX_COWS = 9000  # animal numbers must stay 4 digits
+SYSTEM_CODE = 25800
+FEED_BOX = "\N{COW}"
+ANOMALY_KINDS = ("yield_drop", "feed_refusal", "speed_drop")
+# Effect of an anomaly once it started.
+YIELD_DROP_FACTOR = 0.7
+SPEED_DROP_FACTOR = 0.7
+REFUSAL_PROBABILITY = 0.6
+# Shortest time between two visits of one cow (the robot refuses earlier ones).
+MIN_INTERVAL_HOURS = 4.0
+
+
+def decimal_comma(value, digits=1):
+    return f"{value:.{digits}f}".replace(".", ",")
+
+
+def robot_date(day):
+    """The robot's unpadded ``d-m-yyyy``."""
+    return f"{day.day}-{day.month}-{day.year}"
+
+
+class Cow:
+    """One animal's traits and running state across the simulated days."""
+
+    def __init__(self, animal_number, generator, options):
+        self.animal_number = animal_number
+        self.peak_liters = generator.uniform(24.0, 44.0)
+        self.lactation_number = generator.randint(1, 5)
+        self.lactation_days = generator.randint(5, 300)
+        self.speed = generator.uniform(1.6, 3.2)
+        self.concentrate_grams = generator.uniform(3000, 8000)
+        self.interval_hours = 24.0 / max(options.visits_per_day, 1.0)
+        # First visit somewhere in the first interval, so the herd is spread out.
+        self.next_visit_hours = generator.uniform(0, self.interval_hours)
+        self.anomaly = None
+        self.anomaly_from = None
+        self.last_days = deque(maxlen=10)
+
+    def daily_liters(self):
+        """Wood's lactation curve, scaled so its peak (day 50) is peak_liters."""
+        t = self.lactation_days
+        shape = t ** 0.2 * math.exp(-0.004 * t)
+        peak = 50 ** 0.2 * math.exp(-0.004 * 50)
+        return self.peak_liters * shape / peak
+
+    def has(self, kind, day):
+        return self.anomaly == kind and day >= self.anomaly_from
+
+    def next_day(self):
+        self.lactation_days += 1
+        if self.lactation_days > 340:
+            # Dried off and calved again.
+            self.lactation_days = 1
+            self.lactation_number += 1
+
+
+def simulate_day(herd, day, day_index, generator, options):
+    """All visits of one day, in time order: (hours, cow, liters, failed)."""
+    visits = []
+    for cow in herd:
+        liters_per_hour = cow.daily_liters() / 24.0
+        if cow.has("yield_drop", day):
+            liters_per_hour *= YIELD_DROP_FACTOR
+        day_start = day_index * 24.0
+        while cow.next_visit_hours < day_start + 24.0:
+            interval = max(
+                MIN_INTERVAL_HOURS, generator.gauss(cow.interval_hours, cow.interval_hours * 0.2)
+            )
+            hours = cow.next_visit_hours
+            liters = liters_per_hour * interval * generator.uniform(0.9, 1.1)
+            failed = generator.random() < options.failure_rate
+            if failed:
+                liters *= generator.uniform(0.1, 0.6)
+            visits.append((hours - day_start, cow, liters, failed))
+            cow.next_visit_hours = hours + interval
+    visits.sort(key=lambda visit: (visit[0], visit[1].animal_number))
+    return visits
+
+
+def clock(hours):
+    seconds = int(hours * 3600)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def milking_rows(day, visits, generator):
+    for hours, cow, liters, failed in visits:
+        if failed:
+            status = "#" if generator.random() < 0.05 else "!"
+        else:
+            status = "OK"
+        yield (
+            f"{cow.animal_number},NL 66075{cow.animal_number},{day:%d-%m-%Y},"
+            f"{clock(hours)},{status},{round(liters * 1000)},-,-,{SYSTEM_CODE}\n"
+        )
+
+
+def feed_rows(day, visits, generator, options):
+    for hours, cow, _, _ in visits:
+        refusal_probability = options.refusal_rate
+        if cow.has("feed_refusal", day):
+            refusal_probability = REFUSAL_PROBABILITY
+        share = cow.concentrate_grams / max(options.visits_per_day, 1.0)
+        time_text = clock(hours)
+        if generator.random() < 0.5:
+            time_text = time_text[:5]  # the export drops the seconds now and then
+        consumed = "Nee" if generator.random() < refusal_probability else "Ja"
+        yield (
+            f"1;{FEED_BOX};{robot_date(day)};{time_text};{cow.animal_number};{consumed};"
+            f"{round(share * generator.uniform(0.8, 1.2))};"
+            f"{decimal_comma(generator.uniform(5, 90))};0;\n"
+        )
+        if generator.random() < 0.01:
+            yield ";;;;;;;;;\n"
+
+
+def production_rows(day, herd, liters_by_cow, generator):
+    for cow in herd:
+        milk_24h = liters_by_cow.get(cow.animal_number, 0.0)
+        cow.last_days.append(milk_24h)
+        speed = cow.speed * generator.uniform(0.97, 1.03)
+        if cow.has("speed_drop", day):
+            speed *= SPEED_DROP_FACTOR
+        yield (
+            f'{cow.animal_number},"{decimal_comma(milk_24h)}",'
+            f'"{decimal_comma(sum(cow.last_days) / len(cow.last_days))}",'
+            f'{cow.lactation_number},"{decimal_comma(speed, 2)}",{cow.lactation_days}\n'
+        )
+
+
+def inject_anomalies(herd, start, days, generator, options):
+    """Give a share of the herd one anomaly each, starting in the last week."""
+    count = round(len(herd) * options.anomaly_rate)
+    last_days = max(1, min(7, days // 3))
+    injected = []
+    for index, cow in enumerate(generator.sample(herd, count)):
+        cow.anomaly = ANOMALY_KINDS[index % len(ANOMALY_KINDS)]
+        cow.anomaly_from = start + timedelta(days=days - generator.randint(1, last_days))
+        injected.append(
+            {
+                "kind": cow.anomaly,
+                "animal_number": cow.animal_number,
+                "from": cow.anomaly_from.isoformat(),
+            }
+        )
+    injected.sort(key=lambda entry: (entry["kind"], entry["animal_number"]))
+    return injected
+
+
+def generate(options):
+    output = Path(options.output)
+    output.mkdir(parents=True, exist_ok=True)
+    generator = random.Random(options.seed)
+    herd = [
+        Cow(FIRST_ANIMAL_NUMBER + index, generator, options) for index in range(options.cows)
+    ]
+    injected = inject_anomalies(herd, options.start, options.days, generator, options)
+
+    milking_file = feed_file = None
+    counts = {"milkings": 0, "feedings": 0, "production_rows": 0, "files": 0}
+    try:
+        for day_index in range(options.days):
+            day = options.start + timedelta(days=day_index)
+            if day_index % options.days_per_file == 0:
+                for handle in (milking_file, feed_file):
+                    if handle:
+                        handle.close()
+                milking_file = open(output / f"robot_{day.isoformat()}.txt", "w", encoding="utf-8")
+                milking_file.write("sep=,\n")
+                feed_number = day_index // options.days_per_file + 1
+                feed_file = open(
+                    output / f"Voerdistributie-rapport {feed_number}.csv", "w", encoding="utf-8"
+                )
+                feed_file.write("sep=;\nRobot;Box;Datum;Tijd;Koe;Op;A;B;C;D\n")
+                counts["files"] += 2
+
+            visits = simulate_day(herd, day, day_index, generator, options)
+            milking_file.writelines(milking_rows(day, visits, generator))
+            feed_file.writelines(feed_rows(day, visits, generator, options))
+            counts["milkings"] += len(visits)
+            counts["feedings"] += len(visits)
+
+            liters_by_cow = {}
+            for _, cow, liters, _ in visits:
+                liters_by_cow[cow.animal_number] = liters_by_cow.get(cow.animal_number, 0.0) + liters
+            with open(
+                output / f"Productie-rapport_{robot_date(day)}.csv", "w", encoding="utf-8"
+            ) as report:
+                report.write("sep=,\nKoe,24h,10d,Lact,Snelheid,Dagen\n")
+                report.writelines(production_rows(day, herd, liters_by_cow, generator))
+            counts["production_rows"] += len(herd)
+            counts["files"] += 1
+            for cow in herd:
+                cow.next_day()
+    finally:
+        for handle in (milking_file, feed_file):
+            if handle:
+                handle.close()
+
+    (output / "anomalies.json").write_text(json.dumps(injected, indent=2) + "\n", encoding="utf-8")
+    return counts, injected
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Write synthetic robot exports for a simulated herd.")
+    parser.add_argument("output", help="folder to write the export files into")
+    parser.add_argument("--cows", type=int, default=100, help=f"herd size (1-{MAX_COWS}, default 100)")
+    parser.add_argument("--days", type=int, default=30, help="days to simulate (default 30)")
+    parser.add_argument(
+        "--start", type=date.fromisoformat, default=date(2026, 1, 1), help="first day, YYYY-MM-DD"
+    )
+    parser.add_argument(
+        "--visits-per-day", type=float, default=2.8, help="average robot visits per cow per day"
+    )
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.03, help="share of milkings that fail (status ! or #)"
+    )
+    parser.add_argument(
+        "--refusal-rate", type=float, default=0.08, help="share of feedings not finished (Nee)"
+    )
+    parser.add_argument(
+        "--anomaly-rate", type=float, default=0.05, help="share of cows that get an injected anomaly"
+    )
+    parser.add_argument(
+        "--days-per-file", type=int, default=1, help="days per milking / feed export file"
+    )
+    parser.add_argument("--seed", type=int, default=1, help="random seed (same seed, same files)")
+    options = parser.parse_args(argv)
+    if not 1 <= options.cows <= MAX_COWS:
+        parser.error(f"--cows must be between 1 and {MAX_COWS}")
+    if options.days < 1 or options.days_per_file < 1:
+        parser.error("--days and --days-per-file must be at least 1")
+    return options
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    counts, injected = generate(options)
+    print(
+        f"Wrote {counts['files']:,} files to {options.output}: {counts['milkings']:,} milkings, "
+        f"{counts['feedings']:,} feedings, {counts['production_rows']:,} production rows"
+    )
+    print(f"Injected {len(injected)} anomalies (see anomalies.json)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
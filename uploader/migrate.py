@@ -0,0 +1,12 @@
+import multiprocessing
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # repo root, for `core` and `agent`
+
+from app.migration import main
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -1,3 +1,4 @@
+import multiprocessing
 import sys
 from pathlib import Path
 
@@ -7,4 +8,7 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # repo root, fo
 from app.pipeline import main
 
 if __name__ == "__main__":
+    # Parallel parsing starts worker processes; in the PyInstaller .exe they
+    # must be routed back into the pool instead of starting another uploader.
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,84 @@
+"""Standalone self-test of DataSource.records() deduplication (app/sources/base.py).
+
+Feeds a source a stream with repeated record ids and checks which version is
+kept and that records are passed on as they are read, not held back. Touches
+no vault, no settings and no export files.
+
+    cd uploader
+    python test_records.py
+
+Exit code 0 = records() streams and keeps the first version of a repeated id.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # repo root, for `core`
+
+from app.sources import create_source
+
+
+def _source(rows, dedup_window=None, source_type="milking_robot"):
+    source = create_source(
+        {"type": source_type, "collection": "test", "data_directory": ".", "file_pattern": "*.none"}
+    )
+    source._transformed = lambda files: iter(rows)
+    if dedup_window is not None:
+        source.dedup_window = dedup_window
+    return source
+
+
+def test_first_version_of_a_repeated_id_is_kept():
+    rows = [
+        {"id": "a", "version": 1, "timestamp": "2026-01-01T05:00:00"},
+        {"id": "b", "version": 1, "timestamp": "2026-01-01T06:00:00"},
+        {"id": "a", "version": 2, "timestamp": "2026-01-01T05:00:00"},
+    ]
+    kept = [(record["id"], record["version"]) for record in _source(rows).records()]
+    assert kept == [("a", 1), ("b", 1)], kept
+    # The same once "a" has left the window (looked up by order_field).
+    kept = [(record["id"], record["version"]) for record in _source(rows, dedup_window=1).records()]
+    assert kept == [("a", 1), ("b", 1)], kept
+
+
+def test_repeat_with_other_seconds_is_dropped_after_the_window():
+    # Feed ids are to the minute; a re-export may carry other seconds.
+    rows = [
+        {"id": "5256_2026-01-01T05-12", "timestamp": "2026-01-01T05:12:00"},
+        {"id": "5256_2026-01-01T06-00", "timestamp": "2026-01-01T06:00:00"},
+        {"id": "5256_2026-01-01T05-12", "timestamp": "2026-01-01T05:12:40"},
+    ]
+    source = _source(rows, dedup_window=1, source_type="feed_distribution")
+    kept = [record["timestamp"] for record in source.records()]
+    assert kept == ["2026-01-01T05:12:00", "2026-01-01T06:00:00"], kept
+
+
+def test_records_are_passed_on_as_they_are_read():
+    read = []
+
+    def rows():
+        for number in range(3):
+            read.append(number)
+            yield {"id": str(number), "timestamp": f"2026-01-01T0{number}:00:00"}
+
+    source = _source([])
+    source._transformed = lambda files: rows()
+    records = source.records()
+    assert next(records)["id"] == "0"
+    assert read == [0], read
+
+
+def main():
+    try:
+        test_first_version_of_a_repeated_id_is_kept()
+        test_repeat_with_other_seconds_is_dropped_after_the_window()
+        test_records_are_passed_on_as_they_are_read()
+    except Exception as error:  # noqa: BLE001 - surface any failure clearly
+        print(f"FAILED: {type(error).__name__}: {error}")
+        return 1
+    print("SUCCESS -- records() streams and keeps the first version of a repeated id.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,69 @@
+"""Standalone self-test of the ``--watch`` change detection (app/watcher.py).
+
+Drops a zip with two exports and a plain export into a temporary data
+directory and checks that the watcher reports all three, settled, in the
+order a full pass reads them in. Touches no vault and no settings.
+
+    cd uploader
+    python test_watcher.py
+
+Exit code 0 = the watcher handles archives next to plain files.
+"""
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # repo root, for `core`
+
+from app.sources import create_source
+from app.watcher import DirectoryWatcher
+
+COLLECTION = "milking_controle_data"
+
+
+def test_archive_in_watched_directory():
+    with tempfile.TemporaryDirectory() as directory:
+        source = create_source(
+            {
+                "type": "milking_robot",
+                "collection": COLLECTION,
+                "data_directory": directory,
+                "file_pattern": "*.txt",
+            }
+        )
+        watcher = DirectoryWatcher([source], debounce_seconds=0)
+
+        with zipfile.ZipFile(Path(directory) / "exports.zip", "w") as archive:
+            archive.writestr("2025/b.txt", "")
+            archive.writestr("2025/a.txt", "")
+        (Path(directory) / "today.txt").write_text("", encoding="utf-8")
+
+        changed, _ = watcher.poll()  # first sight: the quiet period starts
+        assert changed == {}, changed
+        changed, changed_at = watcher.poll()
+        assert changed == {COLLECTION: source.files()}, changed
+        assert [str(file_path) for file_path in changed[COLLECTION]] == [
+            str(Path(directory) / "exports.zip") + "!2025/b.txt",
+            str(Path(directory) / "exports.zip") + "!2025/a.txt",
+            str(Path(directory) / "today.txt"),
+        ]
+        assert set(changed_at) == set(changed[COLLECTION])
+
+        watcher.synced(changed)
+        assert watcher.poll() == ({}, {})
+
+
+def main():
+    try:
+        test_archive_in_watched_directory()
+    except Exception as error:  # noqa: BLE001 - surface any failure clearly
+        print(f"FAILED: {type(error).__name__}: {error}")
+        return 1
+    print("SUCCESS -- the watcher reports archive members and plain files in file order.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())